@@ -1,12 +1,6 @@
 """PEP 517 compliant build backend for C and C++ extensions for Python."""
 
-from .local_backend import (
-    build_sdist,
-    build_wheel,
-    prepare_metadata_for_build_wheel,
-    get_requires_for_build_sdist,
-    build_editable,
-)
+from typing import Any
 
 VERSION = "0.2.6.dev15"
 
@@ -15,5 +9,19 @@ __all__ = [
     "build_wheel",
     "prepare_metadata_for_build_wheel",
     "get_requires_for_build_sdist",
+    "get_requires_for_build_wheel",
     "build_editable",
+    "prepare_metadata_for_build_editable",
+    "get_requires_for_build_editable",
 ]
+
+
+def __getattr__(name: str) -> Any:
+    # The backend hooks are loaded on first use so that importing one of the
+    # submodules, for example from a setup.py file, does not have to pay for
+    # importing the backend.
+    if name in __all__:
+        from . import local_backend  # noqa: PLC0415
+
+        return getattr(local_backend, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
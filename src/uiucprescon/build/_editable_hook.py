@@ -0,0 +1,183 @@
+"""Rebuilding the extensions of an editable install when they are imported.
+
+Editable wheels built with the editable_rebuild config setting ship a copy
+of this module. Before an extension is imported, the finder it installs
+checks the sources and the project headers each object file was compiled
+from, recompiles the objects that are out of date with the commands
+recorded when the wheel was built and links the extension again.
+
+This module is copied into the wheel, as a package with a copy of
+file_inputs, and runs where uiucprescon.build may not be installed. So it
+only uses the standard library and file_inputs, which it imports relative
+to itself.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import importlib.abc
+import json
+import os
+import shutil
+import subprocess  # nosec B404
+import sys
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+from .file_inputs import is_stale, source_inputs
+
+MANIFEST_VERSION = 1
+DISABLE_ENV_VAR = "UIUCPRESCON_BUILD_NO_REBUILD"
+
+
+def load_manifest(manifest_path: str) -> Optional[Dict[str, Any]]:
+    """Load the commands recorded when the extensions were last built."""
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def save_manifest(manifest_path: str, manifest: Dict[str, Any]) -> None:
+    """Save the manifest, replacing the earlier one atomically."""
+    temp_file = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(temp_file, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(temp_file, manifest_path)
+
+
+@contextlib.contextmanager
+def _lock(lock_file: str) -> Iterator[None]:
+    # Same as uiucprescon.build.utils.file_lock. The hook is copied into the
+    # editable wheel as a module of its own and runs without
+    # uiucprescon.build installed, so it must not import anything from it.
+    with open(lock_file, "a+b") as f:
+        if sys.platform == "win32":
+            # msvcrt only exists on Windows
+            import msvcrt  # noqa: PLC0415
+
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            # fcntl does not exist on Windows
+            import fcntl  # noqa: PLC0415
+
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def stale_objects(extension: Dict[str, Any]) -> List[str]:
+    """Get the object files of an extension that are out of date."""
+    return [
+        obj
+        for obj, record in sorted(extension["objects"].items())
+        if not os.path.exists(obj) or is_stale(record["inputs"])
+    ]
+
+
+def _run(step: Dict[str, Any], fullname: str) -> None:
+    env = {**os.environ, **step.get("env", {})}
+    result = subprocess.run(  # nosec B603
+        step["command"],
+        cwd=step["cwd"],
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        universal_newlines=True,
+        check=False,
+    )
+    if result.returncode != 0:
+        raise ImportError(
+            f"Unable to rebuild {fullname}:\n"
+            f"{' '.join(step['command'])}\n{result.stdout}",
+            name=fullname,
+        )
+
+
+def rebuild(manifest_path: str, fullname: str) -> bool:
+    """Rebuild an extension if any of its sources changed.
+
+    Returns True if the extension was rebuilt.
+
+    Raises:
+        ImportError: when the extension fails to compile or link.
+
+    """
+    with _lock(f"{manifest_path}.lock"):
+        manifest = load_manifest(manifest_path)
+        if manifest is None:
+            return False
+        extension = manifest["extensions"].get(fullname)
+        if extension is None or extension.get("link") is None:
+            return False
+        stale = stale_objects(extension)
+        if not stale:
+            return False
+        print(
+            f"Rebuilding {fullname}: compiling {len(stale)} of "
+            f"{len(extension['objects'])} source files",
+            file=sys.stderr,
+        )
+        for obj in stale:
+            record = extension["objects"][obj]
+            inputs = source_inputs(
+                record["source"], record["command"], manifest["source_root"]
+            )
+            # The object may be hard linked from the object cache, which
+            # the compiler would overwrite in place.
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(obj)
+            _run(record, fullname)
+            record["inputs"] = inputs
+        _run(extension["link"], fullname)
+        if extension.get("target"):
+            shutil.copy2(extension["output"], extension["target"])
+        save_manifest(manifest_path, manifest)
+    return True
+
+
+class RebuildFinder(importlib.abc.MetaPathFinder):
+    """Rebuilds extensions the first time they are imported.
+
+    It never finds modules itself. Once the extension is up to date, the
+    import goes on to the other finders.
+    """
+
+    def __init__(self, manifest_path: str, names: Sequence[str]) -> None:
+        """Check the extensions with these names, from the manifest."""
+        self.manifest_path = manifest_path
+        self.pending = set(names)
+
+    def find_spec(self, fullname, path, target=None):  # noqa: D102
+        if fullname in self.pending:
+            self.pending.discard(fullname)
+            rebuild(self.manifest_path, fullname)
+        return None
+
+
+def install(manifest_path: str) -> None:
+    """Check the extensions of the editable install as they are imported."""
+    if os.environ.get(DISABLE_ENV_VAR):
+        return
+    manifest = load_manifest(manifest_path)
+    if manifest is None:
+        return
+    sys.meta_path.insert(
+        0, RebuildFinder(manifest_path, list(manifest["extensions"]))
+    )
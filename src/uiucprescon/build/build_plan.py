@@ -0,0 +1,438 @@
+"""Build plans resolved once and shipped in the source distribution.
+
+A build plan holds what the build backend otherwise works out at the start of
+every wheel build: the extensions found by inspecting setup.py, and the Conan
+dependencies pinned in a lockfile, along with their dependency graph, which
+the wheel cache uses as part of its key.
+
+``build_sdist`` adds one to the sdist when the ``build_plan`` config setting
+is enabled. Wheels built from that sdist then use it instead of inspecting
+setup.py and resolving the dependencies again. Each part of the plan is only
+used when it still applies to the build machine and the project files.
+
+With the ``conan_bundle`` config setting, the sdist also gets the recipes and
+sources of the Conan dependencies, so wheels can be built from it without
+network access.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import platform
+import shutil
+import sys
+import tarfile
+import tempfile
+from importlib.metadata import version
+from typing import Any, Callable, Dict, List, Optional, Union, cast
+
+from uiucprescon.build.capabilities import get_toolchain_capabilities
+from uiucprescon.build.introspection import (
+    FINGERPRINTED_PROJECT_FILES,
+    INTROSPECTION_MODE_COMMAND,
+    get_extension_build_info,
+)
+from uiucprescon.build.utils import file_lock, find_conanfile
+
+__all__ = [
+    "add_files_to_sdist",
+    "create_build_plan",
+    "embed_build_plan",
+    "embed_conan_bundle",
+    "find_conan_bundle",
+    "load_build_plan",
+    "plan_build_info",
+    "plan_conan_lockfile",
+    "resolve_conan_graph",
+]
+
+BUILD_PLAN_FILE = "uiucprescon_build_plan.json"
+CONAN_BUNDLE_FILE = "uiucprescon_conan_bundle.tgz"
+BUILD_PLAN_VERSION = 1
+
+# Fields of the nodes of the Conan graph that are kept in the build plan.
+# The rest either describe where things are in the Conan cache of the machine
+# that created the plan or are only known once the packages are installed.
+GRAPH_NODE_FIELDS = [
+    "ref",
+    "name",
+    "user",
+    "channel",
+    "context",
+    "package_id",
+    "settings",
+    "options",
+    "requires",
+]
+
+
+def plan_environment() -> Dict[str, str]:
+    """Describe what the inspection of setup.py may depend on."""
+    return {
+        "system": platform.system(),
+        "machine": platform.machine(),
+        "python": f"{sys.implementation.name}"
+        f"{sys.version_info[0]}.{sys.version_info[1]}",
+        "setuptools": version("setuptools"),
+        "uiucprescon.build": version("uiucprescon.build"),
+    }
+
+
+def _file_sha256(file_path: str) -> Optional[str]:
+    if not os.path.isfile(file_path):
+        return None
+    with open(file_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _fingerprint(
+    mode: str, read_file: Callable[[str], Optional[bytes]]
+) -> str:
+    digest = hashlib.sha256(mode.encode("utf-8"))
+    for project_file in FINGERPRINTED_PROJECT_FILES:
+        digest.update(project_file.encode("utf-8"))
+        data = read_file(project_file)
+        if data is not None:
+            digest.update(hashlib.sha256(data).digest())
+    return digest.hexdigest()
+
+
+def project_fingerprint(
+    source_root: str = ".", mode: str = INTROSPECTION_MODE_COMMAND
+) -> str:
+    """Hash the project files the inspection of setup.py reads."""
+    def read_file(project_file: str) -> Optional[bytes]:
+        file_path = os.path.join(source_root, project_file)
+        if not os.path.isfile(file_path):
+            return None
+        with open(file_path, "rb") as f:
+            return f.read()
+
+    return _fingerprint(mode, read_file)
+
+
+def trim_conan_graph(graph: Dict[str, Any]) -> Dict[str, Any]:
+    """Keep only the parts of a Conan graph that any machine can use."""
+    return {
+        "nodes": {
+            node_id: {
+                field: node[field]
+                for field in GRAPH_NODE_FIELDS
+                if field in node
+            }
+            for node_id, node in graph.get("nodes", {}).items()
+        }
+    }
+
+
+def _conan_cache(
+    config_settings: Dict[str, Union[str, List[str], None]],
+) -> str:
+    conan_cache = cast(Optional[str], config_settings.get("conan_cache"))
+    if conan_cache is None:
+        conan_cache = os.path.join(
+            os.environ.get("CONAN_USER_HOME", os.path.join("build", "conan")),
+            ".conan2",
+        )
+    os.makedirs(conan_cache, exist_ok=True)
+    return conan_cache
+
+
+def _create_conan_plan(
+    conanfile: str,
+    config_settings: Dict[str, Union[str, List[str], None]],
+) -> Dict[str, Any]:
+    # build_plan is loaded by every hook, conan only when a plan is made.
+    from uiucprescon.build.conan import conan_api  # noqa: PLC0415
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        lockfile = os.path.join(temp_dir, "conan.lock")
+        # The lockfile is used with --lockfile-partial, in case the compiler
+        # of the build machine changes which versions are picked.
+        graph = conan_api.create_lockfile(
+            conanfile,
+            lockfile,
+            conan_cache=_conan_cache(config_settings),
+            target_os_version=cast(
+                Optional[str], config_settings.get("target_os_version")
+            ),
+            compiler_libcxx=cast(
+                Optional[str], config_settings.get("conan_compiler_libcxx")
+            ),
+            arch=cast(Optional[str], config_settings.get("arch")),
+        )
+        with open(lockfile, "r", encoding="utf-8") as f:
+            lock_data = json.load(f)
+    return {
+        "conanfile": os.path.basename(conanfile),
+        "conanfile_sha256": _file_sha256(conanfile),
+        "conan_version": get_toolchain_capabilities().conan_major_version,
+        "lockfile": lock_data,
+        "graph": trim_conan_graph(graph),
+    }
+
+
+def create_build_plan(
+    config_settings: Optional[Dict[str, Union[str, List[str], None]]] = None,
+    source_root: str = ".",
+) -> Dict[str, Any]:
+    """Inspect setup.py and resolve the Conan dependencies of the project.
+
+    The Conan part is only created with Conan 2. Conan 1 lockfiles are tied
+    to a single configuration, so they are of no use to other machines.
+    """
+    config_settings = config_settings or {}
+    mode = cast(
+        str,
+        config_settings.get("introspection_mode", INTROSPECTION_MODE_COMMAND),
+    )
+    plan: Dict[str, Any] = {
+        "version": BUILD_PLAN_VERSION,
+        "environment": plan_environment(),
+        "introspection": {
+            "mode": mode,
+            "fingerprint": project_fingerprint(source_root, mode),
+            "build_info": get_extension_build_info(use_cache=False, mode=mode),
+        },
+        "conan": None,
+    }
+    conanfile = find_conanfile(source_root)
+    conan_version = get_toolchain_capabilities().conan_major_version
+    if conanfile is not None and conan_version is not None and (
+        conan_version >= 2
+    ):
+        plan["conan"] = _create_conan_plan(conanfile, config_settings)
+    return plan
+
+
+def resolve_conan_graph(
+    config_settings: Optional[Dict[str, Union[str, List[str], None]]] = None,
+    plan: Optional[Dict[str, Any]] = None,
+    source_root: str = ".",
+) -> Optional[Dict[str, Any]]:
+    """Resolve the Conan dependencies of the project without installing them.
+
+    When the plan applies, its graph is used without running Conan. Returns
+    the parts of the graph that any machine can use, or None if the project
+    has no conanfile. Conan 1 cannot resolve a graph without installing it,
+    so None is returned with Conan 1 too.
+    """
+    conanfile = find_conanfile(source_root)
+    if conanfile is None:
+        return None
+    if (get_toolchain_capabilities().conan_major_version or 0) < 2:
+        return None
+    if plan_lockfile_data(plan, source_root) is not None:
+        planned_graph = cast(Dict[str, Any], plan)["conan"].get("graph")
+        if planned_graph is not None:
+            return cast(Dict[str, Any], planned_graph)
+    # build_plan is loaded by every hook, conan only when a plan is made.
+    from uiucprescon.build.conan import conan_api  # noqa: PLC0415
+
+    config_settings = config_settings or {}
+    conan_cache = _conan_cache(config_settings)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # Builds installing the dependencies hold the same lock
+        with file_lock(f"{os.path.abspath(conan_cache)}.lock"):
+            graph = conan_api.resolve_graph(
+                conanfile,
+                conan_cache=conan_cache,
+                target_os_version=cast(
+                    Optional[str], config_settings.get("target_os_version")
+                ),
+                compiler_libcxx=cast(
+                    Optional[str],
+                    config_settings.get("conan_compiler_libcxx"),
+                ),
+                arch=cast(Optional[str], config_settings.get("arch")),
+                lockfile=plan_conan_lockfile(plan, temp_dir, source_root),
+            )
+    return trim_conan_graph(graph)
+
+
+def add_files_to_sdist(sdist: str, files: Dict[str, str]) -> None:
+    """Add files to the root of an sdist.
+
+    files maps the names to give the files in the sdist to the files to add.
+    Files of the same name already in the sdist are replaced.
+    """
+    with tarfile.open(sdist, "r:gz") as original:
+        members = original.getmembers()
+        root = members[0].name.split("/")[0]
+        added_names = {f"{root}/{name}" for name in files}
+        temp_sdist = f"{sdist}.{os.getpid()}.tmp"
+        with tarfile.open(
+            temp_sdist, "w:gz", format=tarfile.PAX_FORMAT
+        ) as rewritten:
+            for member in members:
+                if member.name in added_names:
+                    continue
+                rewritten.addfile(
+                    member,
+                    original.extractfile(member) if member.isfile() else None,
+                )
+            for name, file_path in files.items():
+                info = tarfile.TarInfo(f"{root}/{name}")
+                info.size = os.path.getsize(file_path)
+                info.mode = 0o644
+                info.mtime = members[0].mtime
+                with open(file_path, "rb") as f:
+                    rewritten.addfile(info, f)
+    shutil.move(temp_sdist, sdist)
+
+
+def embed_build_plan(sdist: str, plan: Dict[str, Any]) -> None:
+    """Add the build plan to the root of an sdist.
+
+    setuptools writes its own setup.cfg into the sdist, so the project files
+    are fingerprinted again as they are in the sdist.
+    """
+    with tarfile.open(sdist, "r:gz") as original:
+        root = original.getmembers()[0].name.split("/")[0]
+
+        def read_file(project_file: str) -> Optional[bytes]:
+            try:
+                extracted = original.extractfile(f"{root}/{project_file}")
+            except KeyError:
+                return None
+            return extracted.read() if extracted is not None else None
+
+        if plan.get("introspection"):
+            plan = {
+                **plan,
+                "introspection": {
+                    **plan["introspection"],
+                    "fingerprint": _fingerprint(
+                        plan["introspection"]["mode"], read_file
+                    ),
+                },
+            }
+    with tempfile.TemporaryDirectory() as temp_dir:
+        plan_file = os.path.join(temp_dir, BUILD_PLAN_FILE)
+        with open(plan_file, "w", encoding="utf-8") as f:
+            json.dump(plan, f, indent=4, sort_keys=True)
+        add_files_to_sdist(sdist, {BUILD_PLAN_FILE: plan_file})
+
+
+def embed_conan_bundle(
+    sdist: str,
+    config_settings: Optional[Dict[str, Union[str, List[str], None]]] = None,
+    source_root: str = ".",
+) -> None:
+    """Add the recipes and sources of the Conan dependencies to an sdist.
+
+    Wheels built from the sdist restore them into their Conan cache, so they
+    do not need to download anything to build the dependencies.
+    """
+    # build_plan is loaded by every hook, conan only when a plan is made.
+    from uiucprescon.build.conan import conan_api  # noqa: PLC0415
+
+    conanfile = find_conanfile(source_root)
+    if conanfile is None:
+        return
+    if (get_toolchain_capabilities().conan_major_version or 0) < 2:
+        raise ValueError("Dependency bundles require Conan 2")
+    config_settings = config_settings or {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        bundle = os.path.join(temp_dir, CONAN_BUNDLE_FILE)
+        conan_api.save_bundle(
+            conanfile,
+            bundle,
+            conan_cache=_conan_cache(config_settings),
+            target_os_version=cast(
+                Optional[str], config_settings.get("target_os_version")
+            ),
+            compiler_libcxx=cast(
+                Optional[str], config_settings.get("conan_compiler_libcxx")
+            ),
+            arch=cast(Optional[str], config_settings.get("arch")),
+        )
+        add_files_to_sdist(sdist, {CONAN_BUNDLE_FILE: bundle})
+
+
+def find_conan_bundle(source_root: str = ".") -> Optional[str]:
+    """Locate the bundle of Conan dependencies shipped with the project."""
+    bundle = os.path.join(source_root, CONAN_BUNDLE_FILE)
+    if not os.path.isfile(bundle):
+        return None
+    if (get_toolchain_capabilities().conan_major_version or 0) < 2:
+        return None
+    return os.path.abspath(bundle)
+
+
+def load_build_plan(source_root: str = ".") -> Optional[Dict[str, Any]]:
+    """Load the build plan shipped with the project, if there is one."""
+    plan_file = os.path.join(source_root, BUILD_PLAN_FILE)
+    if not os.path.exists(plan_file):
+        return None
+    try:
+        with open(plan_file, "r", encoding="utf-8") as f:
+            plan = json.load(f)
+    except (OSError, ValueError) as error:
+        print(f"Ignoring unreadable {BUILD_PLAN_FILE}: {error}",
+              file=sys.stderr)
+        return None
+    if not isinstance(plan, dict) or plan.get("version") != BUILD_PLAN_VERSION:
+        print(f"Ignoring {BUILD_PLAN_FILE} written by another version",
+              file=sys.stderr)
+        return None
+    return plan
+
+
+def plan_build_info(
+    plan: Dict[str, Any],
+    mode: str = INTROSPECTION_MODE_COMMAND,
+    source_root: str = ".",
+) -> Optional[Dict[str, Any]]:
+    """Get the extensions found when the plan was created, if still valid."""
+    introspection = plan.get("introspection") or {}
+    if introspection.get("mode") != mode:
+        return None
+    if plan.get("environment") != plan_environment():
+        print("The build plan was created on a different platform, "
+              "inspecting setup.py again")
+        return None
+    if introspection.get("fingerprint") != project_fingerprint(
+        source_root, mode
+    ):
+        print("The project files changed since the build plan was created, "
+              "inspecting setup.py again")
+        return None
+    return introspection.get("build_info")
+
+
+def plan_lockfile_data(
+    plan: Optional[Dict[str, Any]], source_root: str = "."
+) -> Optional[Dict[str, Any]]:
+    """Get the Conan lockfile of the plan, if it applies to this build."""
+    conan_plan = (plan or {}).get("conan")
+    if not conan_plan or not conan_plan.get("lockfile"):
+        return None
+    capabilities = get_toolchain_capabilities()
+    if conan_plan.get("conan_version") != capabilities.conan_major_version:
+        return None
+    conanfile = find_conanfile(source_root)
+    if conanfile is None or (
+        _file_sha256(conanfile) != conan_plan.get("conanfile_sha256")
+    ):
+        return None
+    return conan_plan["lockfile"]
+
+
+def plan_conan_lockfile(
+    plan: Optional[Dict[str, Any]], output_dir: str, source_root: str = "."
+) -> Optional[str]:
+    """Write the Conan lockfile of the plan to output_dir, if it applies.
+
+    Returns the path of the lockfile.
+    """
+    lock_data = plan_lockfile_data(plan, source_root)
+    if lock_data is None:
+        return None
+    os.makedirs(output_dir, exist_ok=True)
+    lockfile = os.path.join(output_dir, "build_plan.lock")
+    with open(lockfile, "w", encoding="utf-8") as f:
+        json.dump(lock_data, f, indent=4)
+    return lockfile
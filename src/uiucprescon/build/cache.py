@@ -0,0 +1,327 @@
+"""Content-addressed store of build outputs on the local disk.
+
+Every entry is a single file stored under the key it was built from. Entries
+are evicted least recently used first once the store grows past its size
+limit. The store is safe to share between processes.
+
+The size of the store is kept as a running total in its stats file, so the
+entries are only listed when it goes over the limit. Hits and misses are
+counted in memory and written to the stats file in batches.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import weakref
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from uiucprescon.build.utils import file_lock
+
+__all__ = ["ContentStore", "StoreStats", "parse_size", "default_cache_root"]
+
+STATS_FILE = "stats.json"
+LOCK_FILE = "store.lock"
+ENTRIES_DIR = "entries"
+
+# Number of hits and misses counted before they are written out
+COUNTER_BATCH = 64
+
+SIZE_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+
+def parse_size(size: str) -> int:
+    """Parse a size such as 500M or 2G into a number of bytes."""
+    match = re.fullmatch(r"\s*(\d+)\s*([KMG]?)i?B?\s*", size, re.IGNORECASE)
+    if match is None:
+        raise ValueError(f"Invalid size: {size}")
+    return int(match.group(1)) * SIZE_UNITS[match.group(2).upper()]
+
+
+def default_cache_root() -> str:
+    """Get the directory this package keeps its caches in for this user."""
+    if sys.platform == "win32":
+        base = os.environ.get(
+            "LOCALAPPDATA", os.path.expanduser(r"~\AppData\Local")
+        )
+    elif sys.platform == "darwin":
+        base = os.path.expanduser("~/Library/Caches")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+    return os.path.join(base, "uiucprescon.build")
+
+
+@dataclasses.dataclass
+class StoreStats:
+    """Usage of a content store."""
+
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    entries: int = 0
+    size: int = 0
+    max_size: int = 0
+
+
+class ContentStore:
+    """Files stored by key, with a size limit and LRU eviction."""
+
+    def __init__(self, root: str, max_size: int) -> None:
+        """Use the store located at root, creating it if needed."""
+        self.root = root
+        self.max_size = max_size
+        self._pending: Dict[str, int] = {}
+        self._pending_lock = threading.Lock()
+        # The counts still pending are written when the store is garbage
+        # collected or the interpreter exits.
+        weakref.finalize(
+            self, _flush_counters, root, self._pending, self._pending_lock
+        )
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.root, ENTRIES_DIR, key[:2], key)
+
+    def get(self, key: str) -> Optional[str]:
+        """Get the path to the file stored under key, if there is one."""
+        entry_dir = self._entry_dir(key)
+        try:
+            names = os.listdir(entry_dir)
+        except FileNotFoundError:
+            self._count("misses")
+            return None
+        if len(names) != 1:
+            self._count("misses")
+            return None
+        # The modification time of the entry directory tracks when it was
+        # last used.
+        try:
+            os.utime(entry_dir)
+        except FileNotFoundError:
+            # Evicted by another process in the meantime.
+            self._count("misses")
+            return None
+        self._count("hits")
+        return os.path.join(entry_dir, names[0])
+
+    def fetch(
+        self, key: str, destination_dir: str, name: Optional[str] = None
+    ) -> Optional[str]:
+        """Place the file stored under key in destination_dir.
+
+        The file is hard linked when possible and copied otherwise. It keeps
+        the name it was stored with unless given another name. Returns the
+        path of the placed file, or None if nothing is stored under key.
+        """
+        cached = self.get(key)
+        if cached is None:
+            return None
+        os.makedirs(destination_dir, exist_ok=True)
+        destination = os.path.join(
+            destination_dir, name or os.path.basename(cached)
+        )
+        temp_destination = f"{destination}.{os.getpid()}.tmp"
+        try:
+            try:
+                os.link(cached, temp_destination)
+            except OSError:
+                shutil.copy2(cached, temp_destination)
+        except FileNotFoundError:
+            # Evicted by another process in the meantime.
+            return None
+        os.replace(temp_destination, destination)
+        return destination
+
+    def put(self, key: str, file_path: str) -> str:
+        """Store a copy of file_path under key and return its stored path."""
+        entry_dir = self._entry_dir(key)
+        os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+        staging_dir = tempfile.mkdtemp(
+            prefix=".staging-", dir=os.path.dirname(entry_dir)
+        )
+        added = 0
+        try:
+            staged = os.path.join(staging_dir, os.path.basename(file_path))
+            shutil.copy2(file_path, staged)
+            size = os.stat(staged).st_size
+            try:
+                os.rename(staging_dir, entry_dir)
+                added = size
+            except OSError:
+                # Another process stored the same key first.
+                if not os.path.isdir(entry_dir):
+                    raise
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+        with file_lock(os.path.join(self.root, LOCK_FILE)):
+            counters = self._take_pending()
+            data = self._read_counters()
+            total = data.get("size")
+            if total is None:
+                # Stores written before the size was kept are listed once
+                total = self._scan_size()
+            else:
+                total += added
+            if total > self.max_size:
+                evicted, total = self._evict_locked()
+                counters["evictions"] = evicted
+            self._update_counters(size=total, **counters)
+        return os.path.join(entry_dir, os.path.basename(file_path))
+
+    def _iter_entries(self) -> Iterator[Tuple[str, float, int]]:
+        entries_dir = os.path.join(self.root, ENTRIES_DIR)
+        if not os.path.isdir(entries_dir):
+            return
+        for prefix in os.scandir(entries_dir):
+            if not prefix.is_dir():
+                continue
+            for entry in os.scandir(prefix.path):
+                if entry.name.startswith(".") or not entry.is_dir():
+                    continue
+                try:
+                    size = sum(
+                        f.stat().st_size for f in os.scandir(entry.path)
+                    )
+                    yield entry.path, entry.stat().st_mtime, size
+                except FileNotFoundError:
+                    continue
+
+    def _scan_size(self) -> int:
+        return sum(size for _, _, size in self._iter_entries())
+
+    def _evict_locked(self) -> Tuple[int, int]:
+        # Only call while holding the store lock. Returns the number of
+        # entries removed and the size of the store left.
+        entries = sorted(self._iter_entries(), key=lambda e: e[1])
+        total = sum(size for _, _, size in entries)
+        evicted = 0
+        for entry_dir, _, size in entries:
+            if total <= self.max_size:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= size
+            evicted += 1
+        return evicted, total
+
+    def evict(self) -> int:
+        """Remove the least recently used entries until under max_size.
+
+        Returns the number of entries removed.
+        """
+        with file_lock(os.path.join(self.root, LOCK_FILE)):
+            evicted, total = self._evict_locked()
+            self._update_counters(
+                size=total, evictions=evicted, **self._take_pending()
+            )
+        return evicted
+
+    def clear(self) -> None:
+        """Remove every entry."""
+        with file_lock(os.path.join(self.root, LOCK_FILE)):
+            shutil.rmtree(
+                os.path.join(self.root, ENTRIES_DIR), ignore_errors=True
+            )
+            self._update_counters(size=0, **self._take_pending())
+
+    def stats(self) -> StoreStats:
+        """Get the usage of the store."""
+        self.flush()
+        counters = self._read_counters()
+        entries = list(self._iter_entries())
+        return StoreStats(
+            hits=counters.get("hits", 0),
+            misses=counters.get("misses", 0),
+            evictions=counters.get("evictions", 0),
+            entries=len(entries),
+            size=sum(size for _, _, size in entries),
+            max_size=self.max_size,
+        )
+
+    def flush(self) -> None:
+        """Write the hits and misses counted so far to the stats file."""
+        _flush_counters(self.root, self._pending, self._pending_lock)
+
+    def _count(self, name: str) -> None:
+        with self._pending_lock:
+            self._pending[name] = self._pending.get(name, 0) + 1
+            full = sum(self._pending.values()) >= COUNTER_BATCH
+        if full:
+            self.flush()
+
+    def _take_pending(self) -> Dict[str, int]:
+        with self._pending_lock:
+            counters = dict(self._pending)
+            self._pending.clear()
+        return counters
+
+    def _read_counters(self) -> Dict[str, int]:
+        return _read_counters(self.root)
+
+    def _update_counters(
+        self, size: Optional[int] = None, **counters: int
+    ) -> None:
+        # Only call while holding the store lock
+        _update_counters(self.root, counters, size)
+
+
+def _read_counters(root: str) -> Dict[str, int]:
+    try:
+        with open(os.path.join(root, STATS_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _update_counters(
+    root: str, counters: Dict[str, int], size: Optional[int] = None
+) -> None:
+    # Only call while holding the store lock
+    data = _read_counters(root)
+    for name, value in counters.items():
+        data[name] = data.get(name, 0) + value
+    if size is not None:
+        data["size"] = size
+    data["updated"] = int(time.time())
+    stats_file = os.path.join(root, STATS_FILE)
+    temp_file = f"{stats_file}.{os.getpid()}.tmp"
+    with open(temp_file, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(temp_file, stats_file)
+
+
+def _flush_counters(
+    root: str, pending: Dict[str, int], pending_lock: threading.Lock
+) -> None:
+    with pending_lock:
+        counters = dict(pending)
+        pending.clear()
+    if not counters:
+        return
+    try:
+        with file_lock(os.path.join(root, LOCK_FILE)):
+            _update_counters(root, counters)
+    except OSError:
+        # Only statistics, and the store may be gone by now
+        pass
+
+
+def format_stats(name: str, stats: StoreStats) -> List[str]:
+    """Format the usage of a store for printing."""
+    lookups = stats.hits + stats.misses
+    hit_rate = f"{stats.hits / lookups:.0%}" if lookups else "n/a"
+    return [
+        f"{name}:",
+        f"  entries:   {stats.entries}",
+        f"  size:      {stats.size / 1024 ** 2:.1f} MiB of "
+        f"{stats.max_size / 1024 ** 2:.1f} MiB",
+        f"  hits:      {stats.hits}",
+        f"  misses:    {stats.misses}",
+        f"  hit rate:  {hit_rate}",
+        f"  evictions: {stats.evictions}",
+    ]
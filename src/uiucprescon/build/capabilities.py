@@ -0,0 +1,273 @@
+"""Detection of what the toolchain on the build machine is capable of.
+
+Looking up the version of an installed distribution scans the metadata of
+everything on sys.path, and locating tools scans every directory on PATH. The
+capabilities are detected once per process and shared by every module
+instead of each one looking them up again.
+"""
+
+from __future__ import annotations
+
+import functools
+import os
+import platform
+import re
+import shutil
+import subprocess  # nosec B404
+import sysconfig
+from importlib.metadata import PackageNotFoundError, version
+from typing import Dict, Optional, Tuple
+
+__all__ = ["ToolchainCapabilities", "get_toolchain_capabilities"]
+
+# Environment variables that change which compiler a build uses
+COMPILER_ENV_VARS = ["PATH", "CC", "CXX"]
+
+
+def parse_version(version_string: str) -> Tuple[int, ...]:
+    """Parse the numeric part of a version string into a comparable tuple."""
+    parts = []
+    for part in version_string.split("."):
+        match = re.match(r"\d+", part)
+        if match is None:
+            break
+        parts.append(int(match.group()))
+    return tuple(parts)
+
+
+def find_compiler() -> Optional[str]:
+    """Get the path of the compiler that builds use.
+
+    The CXX and CC environment variables take precedence over the compilers
+    Python was built with, the same way setuptools picks its compiler.
+    Returns None if there is none on PATH, which is the case for MSVC unless
+    it is run from a developer command prompt.
+    """
+    command = (
+        os.environ.get("CXX")
+        or os.environ.get("CC")
+        or sysconfig.get_config_var("CXX")
+        or sysconfig.get_config_var("CC")
+    )
+    if not command:
+        return None
+    return shutil.which(command.split()[0])
+
+
+def _run_compiler(executable: str, *args: str) -> str:
+    try:
+        return subprocess.run(  # nosec B603
+            [executable, *args],
+            capture_output=True,
+            text=True,
+            check=False,
+            timeout=30,
+        ).stdout
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def get_compiler_family_of(executable: str) -> str:
+    """Get the family of a compiler from what it reports about itself.
+
+    Returns one of "gcc", "clang", "apple-clang", "msvc" or "unknown".
+    """
+    if os.path.basename(executable).lower() in ("cl", "cl.exe"):
+        return "msvc"
+    output = _run_compiler(executable, "--version")
+    if "Apple clang" in output:
+        return "apple-clang"
+    if "clang" in output:
+        return "clang"
+    if re.search(r"\bg(cc|\+\+)\b|Free Software Foundation", output):
+        return "gcc"
+    return "unknown"
+
+
+def get_compiler_version_of(executable: str, family: str) -> Optional[str]:
+    """Get the major and minor version of a gcc or clang compiler.
+
+    Returns None if the version could not be read.
+    """
+    if family == "gcc":
+        output = _run_compiler(
+            executable, "-dumpfullversion", "-dumpversion"
+        ).strip()
+        match = re.match(r"(\d+)(?:\.(\d+))?", output)
+    elif family in ("clang", "apple-clang"):
+        output = _run_compiler(executable, "--version")
+        match = re.search(r"clang version (\d+)(?:\.(\d+))?", output)
+    else:
+        return None
+    if match is None:
+        return None
+    return ".".join(part for part in match.groups() if part is not None)
+
+
+def get_compiler_family(python_compiler: Optional[str] = None) -> str:
+    """Get the family of the compiler that built the Python interpreter.
+
+    Returns one of "gcc", "clang", "apple-clang", "msvc" or "unknown".
+    """
+    python_compiler = python_compiler or platform.python_compiler()
+    if python_compiler.startswith("GCC"):
+        return "gcc"
+    if python_compiler.startswith("Clang"):
+        return "apple-clang" if platform.system() == "Darwin" else "clang"
+    if python_compiler.startswith(("MSC", "MSVC")):
+        return "msvc"
+    return "unknown"
+
+
+class ToolchainCapabilities:
+    """What the toolchain of the build machine is able to do.
+
+    Anything that requires running a program, such as the compiler version,
+    is only detected when it is first used.
+    """
+
+    def __init__(
+        self,
+        conan_version: Optional[Tuple[int, ...]] = None,
+        system: Optional[str] = None,
+        compiler_family: Optional[str] = None,
+    ) -> None:
+        """Create capabilities, detecting anything that is not given."""
+        self.conan_version = (
+            conan_version if conan_version is not None
+            else _detect_conan_version()
+        )
+        self.platform = system or platform.system()
+        self._compiler_family = compiler_family
+        self._tools: Dict[Tuple[str, Optional[str]], Optional[str]] = {}
+        self._compilers: Dict[
+            Tuple[Optional[str], ...], Tuple[Optional[str], str]
+        ] = {}
+        self._compiler_versions: Dict[Tuple[Optional[str], ...], str] = {}
+
+    @property
+    def conan_major_version(self) -> Optional[int]:
+        """Major version of the installed Conan or None if not installed."""
+        return self.conan_version[0] if self.conan_version else None
+
+    @property
+    def uses_conan_v1(self) -> bool:
+        """Check if the installed Conan is older than version 2."""
+        major = self.conan_major_version
+        return major is not None and major < 2
+
+    @property
+    def compiler(self) -> Optional[str]:
+        """Path of the compiler builds use or None if it is not on PATH."""
+        return self._detect_compiler()[0]
+
+    @property
+    def compiler_family(self) -> str:
+        """Family of the compiler builds use.
+
+        One of "gcc", "clang", "apple-clang", "msvc" or "unknown". Falls back
+        to the compiler Python was built with if there is none on PATH.
+        """
+        if self._compiler_family is not None:
+            return self._compiler_family
+        return self._detect_compiler()[1]
+
+    def _detect_compiler(self) -> Tuple[Optional[str], str]:
+        # Like the tools, the compiler depends on the environment of the
+        # build, which changes between the requests of a build server.
+        key = _compiler_environment()
+        if key not in self._compilers:
+            executable = find_compiler()
+            family = (
+                get_compiler_family_of(executable) if executable is not None
+                else get_compiler_family()
+            )
+            self._compilers[key] = (executable, family)
+        return self._compilers[key]
+
+    @property
+    def compiler_version(self) -> str:
+        """Version of the compiler, formatted the way Conan expects it."""
+        key = _compiler_environment()
+        if key not in self._compiler_versions:
+            self._compiler_versions[key] = self._detect_compiler_version()
+        return self._compiler_versions[key]
+
+    def _detect_compiler_version(self) -> str:
+        if self.compiler_family == "msvc" and not self.uses_conan_v1:
+            # Imports conan, which capabilities is used to detect.
+            from uiucprescon.build.conan import v2  # noqa: PLC0415
+
+            return v2.get_msvc_compiler_version()
+
+        if self.compiler is not None:
+            compiler_version = get_compiler_version_of(
+                self.compiler, self.compiler_family
+            )
+            if compiler_version is not None:
+                return compiler_version
+
+        # compiler_info warns about being deprecated when it is imported, so
+        # only import it when it is actually needed.
+        from uiucprescon.build import compiler_info  # noqa: PLC0415
+
+        return compiler_info.get_compiler_version()
+
+    def tool_path(self, tool: str) -> Optional[str]:
+        """Get the full path to a tool or None if it is not available."""
+        # The same process can build with different PATH variables, for
+        # example when it runs as a build server.
+        key = (tool, os.environ.get("PATH"))
+        if key not in self._tools:
+            self._tools[key] = _locate_tool(tool)
+        return self._tools[key]
+
+    def has_tool(self, tool: str) -> bool:
+        """Check if a tool is available."""
+        return self.tool_path(tool) is not None
+
+    @property
+    def has_patchelf(self) -> bool:
+        """Check if patchelf is available."""
+        return self.has_tool("patchelf")
+
+    @property
+    def has_readelf(self) -> bool:
+        """Check if readelf is available."""
+        return self.has_tool("readelf")
+
+    @property
+    def has_otool(self) -> bool:
+        """Check if otool is available."""
+        return self.has_tool("otool")
+
+    @property
+    def has_dumpbin(self) -> bool:
+        """Check if dumpbin is available."""
+        return self.has_tool("dumpbin")
+
+
+def _compiler_environment() -> Tuple[Optional[str], ...]:
+    return tuple(os.environ.get(name) for name in COMPILER_ENV_VARS)
+
+
+def _detect_conan_version() -> Tuple[int, ...]:
+    try:
+        return parse_version(version("conan"))
+    except PackageNotFoundError:
+        return ()
+
+
+def _locate_tool(tool: str) -> Optional[str]:
+    if tool == "dumpbin" and platform.system() == "Windows":
+        # deps imports capabilities
+        from uiucprescon.build import deps  # noqa: PLC0415
+
+        return deps.locate_dumpbin()
+    return shutil.which(tool)
+
+
+@functools.cache
+def get_toolchain_capabilities() -> ToolchainCapabilities:
+    """Get the capabilities of the toolchain, detected once per process."""
+    return ToolchainCapabilities()
@@ -0,0 +1,55 @@
+"""Thin setuptools command shims registered as distutils.commands.
+
+setuptools loads every distutils.commands entry point whenever it reads a
+pyproject.toml file, in every environment that has this package installed.
+The shims in this module only declare the command line options of the
+commands. The modules implementing them are imported when setuptools creates
+the command object.
+"""
+
+from typing import Any, List, Optional, Tuple
+
+from setuptools import Command
+
+__all__ = ["BuildExtInfo", "BuildConan"]
+
+
+class BuildExtInfo(Command):
+    """Shim for uiucprescon.build.introspection.BuildExtInfo."""
+
+    description = "Build the extension and return build information."
+
+    user_options: List[Tuple[str, Optional[str], str]] = [
+        (
+            "persist",
+            None,
+            "write setuptools_introspection.json to the build directory",
+        ),
+    ]
+
+    boolean_options = ["persist"]
+
+    def __new__(cls, dist: Any, **kw: Any) -> Any:  # type: ignore[misc]
+        """Create the actual command."""
+        from uiucprescon.build import introspection  # noqa: PLC0415
+
+        return introspection.BuildExtInfo(dist, **kw)
+
+
+class BuildConan(Command):
+    """Shim for uiucprescon.build.conan_libs.BuildConan."""
+
+    description = "Get the required dependencies from a Conan package manager"
+
+    user_options: List[Tuple[str, Optional[str], str]] = [
+        ("conan-cache=", None, "conan cache directory"),
+        ("compiler-version=", None, "Compiler version"),
+        ("compiler-libcxx=", None, "Compiler libcxx"),
+        ("target-os-version=", None, "Target OS version"),
+    ]
+
+    def __new__(cls, dist: Any, **kw: Any) -> Any:  # type: ignore[misc]
+        """Create the actual command."""
+        from uiucprescon.build import conan_libs  # noqa: PLC0415
+
+        return conan_libs.BuildConan(dist, **kw)
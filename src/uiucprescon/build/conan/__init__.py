@@ -1,9 +1,22 @@
-"""This module provides access to the Conan API."""
-from importlib.metadata import version as _version
-if _version("conan") < "2.0":
-    from . import v1 as conan_api  # type: ignore[no-redef]
-else:
-    from . import v2 as conan_api
-del _version
+"""This module provides access to the Conan API.
+
+The Conan API module matching the installed version of Conan is only imported
+when conan_api is first accessed because importing conan is slow.
+"""
+import importlib
+from types import ModuleType
+
+from uiucprescon.build.capabilities import get_toolchain_capabilities
 
 __all__ = ["conan_api"]
+
+
+def __getattr__(name: str) -> ModuleType:
+    if name == "conan_api":
+        if get_toolchain_capabilities().uses_conan_v1:
+            conan_api = importlib.import_module(f"{__name__}.v1")
+        else:
+            conan_api = importlib.import_module(f"{__name__}.v2")
+        globals()["conan_api"] = conan_api
+        return conan_api
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
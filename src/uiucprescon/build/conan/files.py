@@ -4,7 +4,9 @@ import dataclasses
 import io
 import os
 import json
-from typing import List, Dict, TypedDict, Iterable, Optional, Tuple, Set
+from typing import (
+    Any, List, Dict, TypedDict, Iterable, Optional, Tuple, Set
+)
 import abc
 import warnings
 from uiucprescon.build.utils import locate_file
@@ -12,8 +14,11 @@ from uiucprescon.build.utils import locate_file
 __all__ = [
     "parse_conan_build_info",
     "read_conan_build_info_json",
+    "get_library_metadata_from_build_info",
     "get_library_metadata_from_build_info_json",
+    "get_linking_libraries",
     "get_linking_libraries_fp",
+    "summarize_conan_build_info",
     "ConanBuildInfo"
 ]
 
@@ -193,6 +198,20 @@ def _locate_node_by_name(name, nodes):
     return None, None
 
 
+def get_linking_libraries(
+    library_name: str,
+    conan_build_info: Dict[str, Any]
+) -> List[str]:
+    """Get the linking libraries for a library from Conan build info data."""
+    _, node = _locate_node_by_name(
+        library_name, conan_build_info["graph"]["nodes"]
+    )
+    libs = []
+    for cpp_info in node["cpp_info"].values():
+        libs += cpp_info.get("libs", []) or []
+    return libs
+
+
 def get_linking_libraries_fp(
     library_name: str,
     conan_build_info_fp: io.TextIOWrapper
@@ -200,12 +219,9 @@ def get_linking_libraries_fp(
     """Get the linking libraries for a library from a Conan build info file."""
     original_position = conan_build_info_fp.tell()
     try:
-        data = json.load(conan_build_info_fp)
-        _, node = _locate_node_by_name(library_name, data["graph"]["nodes"])
-        libs = []
-        for cpp_info in node["cpp_info"].values():
-            libs += cpp_info.get("libs", []) or []
-        return libs
+        return get_linking_libraries(
+            library_name, json.load(conan_build_info_fp)
+        )
     finally:
         conan_build_info_fp.seek(original_position)
 
@@ -307,11 +323,47 @@ def _get_from_ref(reference_key: str, nodes) -> CLibCompilerMetadata:
     return metadata
 
 
+def get_library_metadata_from_build_info(
+    library_name: str, conan_build_info: Dict[str, Any]
+) -> Optional[CLibCompilerMetadata]:
+    """Get the metadata for a library from Conan build info data."""
+    metadata = CLibCompilerMetadata()
+    nodes = conan_build_info["graph"]["nodes"]
+    key, node = _locate_node_by_name(library_name, nodes)
+    if not node:
+        return None
+    node_data = _get_from_ref(key, nodes)
+
+    for include_path in node_data.include_paths:
+        if include_path not in metadata.include_paths:
+            metadata.include_paths.append(include_path)
+            # metadata.include_paths.insert(0, include_path)
+
+    for definition in node_data.definitions:
+        if definition not in metadata.definitions:
+            metadata.definitions.append(definition)
+
+    for lib_dir in node_data.lib_dirs:
+        if lib_dir not in metadata.lib_dirs:
+            metadata.lib_dirs.append(lib_dir)
+
+    for lib in node_data.libs:
+        if lib not in metadata.libs:
+            metadata.libs.append(lib)
+        else:
+            del metadata.libs[metadata.libs.index(lib)]
+            metadata.libs.append(lib)
+
+    for bin_path in node_data.bin_paths:
+        if bin_path not in metadata.bin_paths:
+            metadata.bin_paths.append(bin_path)
+    return metadata
+
+
 def get_library_metadata_from_build_info_json(
     library_name, fp: io.TextIOWrapper
 ) -> Optional[CLibCompilerMetadata]:
     """Get the metadata for a library from a Conan build info JSON file."""
-    metadata = CLibCompilerMetadata()
     original_position = fp.tell()
     try:
         fp.seek(0)
@@ -323,49 +375,26 @@ def get_library_metadata_from_build_info_json(
                 category=UserWarning,
             )
             return None
-        nodes = data["graph"]["nodes"]
-        key, node = _locate_node_by_name(library_name, nodes)
-        if not node:
-            return None
-        node_data = _get_from_ref(key, nodes)
-
-        for include_path in node_data.include_paths:
-            if include_path not in metadata.include_paths:
-                metadata.include_paths.append(include_path)
-                # metadata.include_paths.insert(0, include_path)
-
-        for definition in node_data.definitions:
-            if definition not in metadata.definitions:
-                metadata.definitions.append(definition)
-
-        for lib_dir in node_data.lib_dirs:
-            if lib_dir not in metadata.lib_dirs:
-                metadata.lib_dirs.append(lib_dir)
-
-        for lib in node_data.libs:
-            if lib not in metadata.libs:
-                metadata.libs.append(lib)
-            else:
-                del metadata.libs[metadata.libs.index(lib)]
-                metadata.libs.append(lib)
-
-        for bin_path in node_data.bin_paths:
-            if bin_path not in metadata.bin_paths:
-                metadata.bin_paths.append(bin_path)
-        return metadata
+        return get_library_metadata_from_build_info(library_name, data)
     finally:
         fp.seek(original_position)
 
 
 def read_conan_build_info_json(fp: io.TextIOWrapper):
     """Read a Conan build info JSON file and return the relevant data."""
+    return summarize_conan_build_info(json.loads(fp.read()))
+
+
+def summarize_conan_build_info(
+    conan_build_info: Dict[str, Any]
+) -> ConanBuildInfo:
+    """Collect the paths, libraries and definitions from Conan build info."""
     definitions: List[str] = []
     include_paths: List[str] = []
     lib_dirs: List[str] = []
     bin_paths: List[str] = []
     libs: List[str] = []
-    data = json.loads(fp.read())
-    for node in data["graph"]["nodes"].values():
+    for node in conan_build_info["graph"]["nodes"].values():
         if node.get("name") is None:
             continue
         for data in node.get("cpp_info", {}).values():
@@ -42,8 +42,14 @@ def build_deps_with_conan(
     debug: bool = False,
     install_libs=True,
     announce=None,
+    lockfile=None,
+    bundle=None,
 ):
-    """Build dependencies with conan."""
+    """Build dependencies with conan.
+
+    Build plan lockfiles and dependency bundles are written by Conan 2, so
+    lockfile and bundle are ignored.
+    """
     conan = conan_api.Conan(
         cache_folder=os.path.abspath(conan_cache) if conan_cache else None
     )
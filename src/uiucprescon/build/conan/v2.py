@@ -2,6 +2,7 @@
 
 from __future__ import annotations
 import functools
+import hashlib
 import json
 import platform
 import pprint
@@ -10,20 +11,26 @@ import shutil
 import sys
 import tempfile
 from typing import (
+    Any,
     AnyStr,
     Callable,
+    Dict,
     List,
     Optional,
     TYPE_CHECKING,
     TypedDict,
     TextIO,
+    Tuple,
 )
 import os
 
 import conan.errors
 import yaml
 
-from uiucprescon.build.compiler_info import get_compiler_version
+from uiucprescon.build.capabilities import (
+    COMPILER_ENV_VARS,
+    get_toolchain_capabilities,
+)
 from uiucprescon.build.conan.files import read_conan_build_info_json
 
 from conan.api.conan_api import ConanAPI
@@ -36,7 +43,13 @@ if TYPE_CHECKING:
     from uiucprescon.build.conan_libs import ConanBuildInfo
     from .utils import LanguageStandardsVersion
 
-__all__ = ["build_deps_with_conan"]
+__all__ = [
+    "build_deps_with_conan",
+    "create_lockfile",
+    "detect_profile",
+    "restore_bundle",
+    "save_bundle",
+]
 
 
 @dataclasses.dataclass
@@ -112,49 +125,49 @@ def extract_json_build(fp: TextIO) -> ConanBuildInfo:
     }
 
 
-def _build_deps(
-    conan_cache,
-    conanfile,
-    build_dir,
-    build: List[str],
-    compiler_version,
-    target_os_version,
-    compiler_libcxx,
-    arch=None,
-    language_standards: Optional[LanguageStandardsVersion] = None,
-    verbose=False,
-    debug=False,
-):
-    if conanfile is None:
-        raise ValueError("conanfile cannot be none")
+# Profiles detected by Conan, by the environment choosing the compiler
+_detected_profiles: Dict[Tuple[Optional[str], ...], Any] = {}
 
+
+def detect_profile(conan_api: ConanAPI) -> Any:
+    """Detect the default Conan profile of the compiler of the build.
+
+    Conan runs the compiler every time it detects a profile, so the profile
+    is only detected once per process for the same compiler.
+    """
+    key = tuple(os.environ.get(name) for name in COMPILER_ENV_VARS)
+    if key not in _detected_profiles:
+        _detected_profiles[key] = conan_api.profiles.detect()
+    return _detected_profiles[key]
+
+
+def _conan_api(conan_cache) -> ConanAPI:
     conan_api = ConanAPI(
         os.path.abspath(conan_cache) if conan_cache is not None else None
     )
     cli = Cli(conan_api)
     cli.add_commands()
-    conan_api.command.run(
-        ["profile", "detect", "--exist-ok"]
-        + (["-vverbose"] if verbose else [])
+    # What "conan profile detect --exist-ok" does
+    default_profile = conan_api.profiles.get_path(
+        "default", os.getcwd(), exists=False
     )
+    if not os.path.exists(default_profile):
+        os.makedirs(os.path.dirname(default_profile), exist_ok=True)
+        with open(default_profile, "w", encoding="utf-8") as f:
+            f.write(detect_profile(conan_api).dumps())
     conan_api.reinit()
+    return conan_api
 
-    build_json = os.path.join(build_dir, "conan_build_info.json")
-    conan_args = [
-        "install",
-        conanfile,
-        "--output-folder",
-        build_dir,
-        "-cc",
-        "core:non_interactive=True",
-    ] + [f"--build={b}" for b in build]
-
-    conan_args += ["-c", "tools.build:skip_test=True"]
-    conan_args += ["-c", "tools.graph:skip_test=True"]
-    if verbose:
-        conan_args += ["-c:h", "tools.build:verbosity=verbose"]
-        conan_args += ["-c:h", "tools.compilation:verbosity=verbose"]
 
+def _settings_args(
+    compiler_version,
+    target_os_version,
+    compiler_libcxx,
+    arch=None,
+    language_standards: Optional[LanguageStandardsVersion] = None,
+    debug=False,
+) -> List[str]:
+    conan_args = []
     if language_standards:
         if language_standards.cpp_std:
             conan_args.append(
@@ -171,7 +184,7 @@ def _build_deps(
             f"--settings:host=compiler.version={compiler_version}",
         ]
         if platform.system() == "Windows":
-            if "MSC" in platform.python_compiler():
+            if get_toolchain_capabilities().compiler_family == "msvc":
                 from setuptools.msvc import EnvironmentInfo
 
                 visual_studio_info = EnvironmentInfo("amd64")
@@ -191,11 +204,15 @@ def _build_deps(
         conan_args += ["--settings", "build_type=Debug"]
     else:
         conan_args += ["--settings", "build_type=Release"]
+    return conan_args
 
-    conan_args.append("--format=json")
+
+def _run_conan(conan_api: ConanAPI, conan_args: List[str], quiet=False):
     try:
-        result = conan_api.command.run(conan_args)
+        return conan_api.command.run(conan_args)
     except conan.errors.ConanException as e:
+        if quiet:
+            raise
         print(
             f'Failed to run conan with: "{" ".join(conan_args)}"',
             file=sys.stderr,
@@ -203,19 +220,211 @@ def _build_deps(
         print("Run with the following environment variables", file=sys.stderr)
         pprint.pprint(dict(sorted(os.environ.items())), stream=sys.stderr)
         raise e
+
+
+def _serialize_graph(result) -> dict:
     graph = result["graph"]
     field_filter = result.get("field_filter")
     package_filter = result.get("package_filter")
     serial = graph.serialize()
-    serial = filter_graph(
+    return filter_graph(
         serial, package_filter=package_filter, field_filter=field_filter
     )
+
+
+def _build_deps(
+    conan_cache,
+    conanfile,
+    build_dir,
+    build: List[str],
+    compiler_version,
+    target_os_version,
+    compiler_libcxx,
+    arch=None,
+    language_standards: Optional[LanguageStandardsVersion] = None,
+    verbose=False,
+    debug=False,
+    lockfile: Optional[str] = None,
+    no_remote=False,
+):
+    if conanfile is None:
+        raise ValueError("conanfile cannot be none")
+
+    conan_api = _conan_api(conan_cache)
+
+    build_json = os.path.join(build_dir, "conan_build_info.json")
+    conan_args = [
+        "install",
+        conanfile,
+        "--output-folder",
+        build_dir,
+        "-cc",
+        "core:non_interactive=True",
+    ] + [f"--build={b}" for b in build]
+
+    conan_args += ["-c", "tools.build:skip_test=True"]
+    conan_args += ["-c", "tools.graph:skip_test=True"]
+    if verbose:
+        conan_args += ["-c:h", "tools.build:verbosity=verbose"]
+        conan_args += ["-c:h", "tools.compilation:verbosity=verbose"]
+    if lockfile:
+        # The lockfile may have been created on another platform, which can
+        # have conditional requirements this one does not.
+        conan_args += ["--lockfile", lockfile, "--lockfile-partial"]
+    if no_remote:
+        conan_args.append("--no-remote")
+
+    conan_args += _settings_args(
+        compiler_version,
+        target_os_version,
+        compiler_libcxx,
+        arch,
+        language_standards,
+        debug,
+    )
+
+    conan_args.append("--format=json")
+    result = _run_conan(conan_api, conan_args, quiet=no_remote)
     with open(build_json, "w") as f:
-        f.write(json.dumps({"graph": serial}, indent=4))
+        f.write(json.dumps({"graph": _serialize_graph(result)}, indent=4))
 
     return build_json
 
 
+def _graph_info(
+    conan_api: ConanAPI,
+    conanfile: str,
+    extra_args: List[str],
+    target_os_version: Optional[str] = None,
+    compiler_libcxx: Optional[str] = None,
+    arch: Optional[str] = None,
+) -> dict:
+    conan_args = [
+        "graph",
+        "info",
+        conanfile,
+        "-cc",
+        "core:non_interactive=True",
+        "-c",
+        "tools.graph:skip_test=True",
+        *extra_args,
+        *_settings_args(None, target_os_version, compiler_libcxx, arch),
+        "--format=json",
+    ]
+    return _serialize_graph(_run_conan(conan_api, conan_args))
+
+
+def create_lockfile(
+    conanfile: str,
+    lockfile_out: str,
+    conan_cache: Optional[str] = None,
+    target_os_version: Optional[str] = None,
+    compiler_libcxx: Optional[str] = None,
+    arch: Optional[str] = None,
+) -> dict:
+    """Resolve the dependencies of conanfile without building them.
+
+    The resolved versions and revisions are written to lockfile_out. The
+    compiler is left to the detected profile. Returns the dependency graph.
+    """
+    return _graph_info(
+        _conan_api(conan_cache),
+        conanfile,
+        ["--lockfile-out", os.path.abspath(lockfile_out)],
+        target_os_version,
+        compiler_libcxx,
+        arch,
+    )
+
+
+def resolve_graph(
+    conanfile: str,
+    conan_cache: Optional[str] = None,
+    target_os_version: Optional[str] = None,
+    compiler_libcxx: Optional[str] = None,
+    arch: Optional[str] = None,
+    lockfile: Optional[str] = None,
+) -> dict:
+    """Resolve the dependencies of conanfile without building them.
+
+    Only the recipes are fetched. When a lockfile is given, the versions it
+    pins are used. Returns the dependency graph.
+    """
+    return _graph_info(
+        _conan_api(conan_cache),
+        conanfile,
+        ["--lockfile", lockfile, "--lockfile-partial"] if lockfile else [],
+        target_os_version,
+        compiler_libcxx,
+        arch,
+    )
+
+
+def save_bundle(
+    conanfile: str,
+    bundle_file: str,
+    conan_cache: Optional[str] = None,
+    target_os_version: Optional[str] = None,
+    compiler_libcxx: Optional[str] = None,
+    arch: Optional[str] = None,
+) -> None:
+    """Save the recipes and sources of every dependency of conanfile.
+
+    The sources are downloaded into the Conan cache first. The bundle is a
+    "conan cache save" archive without any binaries, so it can be restored
+    on any platform.
+    """
+    conan_api = _conan_api(conan_cache)
+    graph = _graph_info(
+        conan_api,
+        conanfile,
+        ["-c", "tools.build:download_source=True"],
+        target_os_version,
+        compiler_libcxx,
+        arch,
+    )
+    with tempfile.TemporaryDirectory() as temp_dir:
+        graph_json = os.path.join(temp_dir, "graph.json")
+        with open(graph_json, "w", encoding="utf-8") as f:
+            json.dump({"graph": graph}, f)
+        package_list = _run_conan(
+            conan_api,
+            ["list", "--graph", graph_json, "--graph-recipes=*",
+             "--format=json"],
+        )
+        package_list_json = os.path.join(temp_dir, "packages.json")
+        with open(package_list_json, "w", encoding="utf-8") as f:
+            json.dump(package_list["results"], f)
+        _run_conan(
+            conan_api,
+            ["cache", "save", "--list", package_list_json,
+             "--file", os.path.abspath(bundle_file)],
+        )
+
+
+RESTORED_BUNDLES_FILE = "uiucprescon_restored_bundles.json"
+
+
+def restore_bundle(bundle_file: str, conan_cache: Optional[str]) -> None:
+    """Put the recipes and sources saved in bundle_file in the Conan cache.
+
+    A bundle is only restored once into the same cache.
+    """
+    with open(bundle_file, "rb") as f:
+        bundle_hash = hashlib.sha256(f.read()).hexdigest()
+    conan_api = _conan_api(conan_cache)
+    restored_file = os.path.join(conan_api.home_folder, RESTORED_BUNDLES_FILE)
+    restored: List[str] = []
+    if os.path.exists(restored_file):
+        with open(restored_file, "r", encoding="utf-8") as f:
+            restored = json.load(f)
+    if bundle_hash in restored:
+        return
+    _run_conan(conan_api, ["cache", "restore", os.path.abspath(bundle_file)])
+    with open(restored_file, "w", encoding="utf-8") as f:
+        json.dump(restored + [bundle_hash], f)
+
+
 def locate_cl(paths):
     for path in paths:
         cl = shutil.which("cl.exe", path=path)
@@ -308,8 +517,15 @@ def build_deps_with_conan(
     debug: bool = False,
     install_libs: bool = True,
     announce: Optional[Callable[[AnyStr, int], None]] = None,
+    lockfile: Optional[str] = None,
+    bundle: Optional[str] = None,
 ) -> ConanBuildInfo:
-    """Build dependencies with conan."""
+    """Build dependencies with conan.
+
+    When a bundle saved by save_bundle() is given, it is restored into the
+    Conan cache and the dependencies are first installed without contacting
+    any remote. The remotes are only used if the bundle is missing something.
+    """
     if conanfile is None:
         raise ValueError("conanfile cannot be None")
     verbose = False
@@ -321,7 +537,7 @@ def build_deps_with_conan(
     if not did_settings_yaml_already_exist:
         with open(settings_yaml, "r") as f:
             settings_data = yaml.load(f.read(), Loader=yaml.SafeLoader)
-        default_profile_settings = conan_api.profiles.detect().settings
+        default_profile_settings = detect_profile(conan_api).settings
         default_compiler = default_profile_settings["compiler"]
         settings_data["compiler"][default_compiler]["version"].append(
             default_profile_settings["compiler.version"].value
@@ -329,7 +545,7 @@ def build_deps_with_conan(
         settings_data["compiler"][default_compiler]["version"].append(
             get_msvc_compiler_version(working_path=build_dir)
             if default_compiler == "msvc"
-            else get_compiler_version()
+            else get_toolchain_capabilities().compiler_version
         )
 
         with open(settings_yaml, "w") as f:
@@ -339,7 +555,8 @@ def build_deps_with_conan(
 
     build_json = os.path.join(build_dir, "conan_build_info.json")
     if not os.path.exists(build_json):
-        build_json = _build_deps(
+        build_deps = functools.partial(
+            _build_deps,
             conan_cache,
             conanfile,
             build_dir,
@@ -351,7 +568,21 @@ def build_deps_with_conan(
             language_standards,
             verbose,
             debug,
+            lockfile,
         )
+        if bundle is not None:
+            restore_bundle(bundle, conan_cache)
+            try:
+                build_json = build_deps(no_remote=True)
+            except conan.errors.ConanException as error:
+                print(
+                    f"Unable to install the dependencies from {bundle} "
+                    f"alone, using the Conan remotes: {error}",
+                    file=sys.stderr,
+                )
+                build_json = build_deps()
+        else:
+            build_json = build_deps()
     with open(build_json, "r", encoding="utf-8") as f:
         build_info = read_conan_build_info_json(f)
 
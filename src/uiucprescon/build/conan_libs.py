@@ -1,7 +1,9 @@
 """Setuptools command to build dependencies with Conan package manager."""
 
 from __future__ import annotations
+import contextlib
 import functools
+import hashlib
 import io
 import logging
 import os
@@ -11,14 +13,12 @@ import subprocess  # nosec B404
 import sys
 import shutil
 import abc
-from importlib.metadata import version
 import typing
 from typing import Dict, List, Optional, cast, Set, Tuple, Union, TYPE_CHECKING
 import warnings
 
 from pathlib import Path
 import json
-import toml
 
 import setuptools
 from setuptools.dist import Distribution
@@ -27,19 +27,20 @@ from setuptools.command.build_py import build_py as BuildPy
 from setuptools.command.build_clib import build_clib as BuildClib
 from setuptools.command.build import build as Build
 
-from uiucprescon.build.deps import get_win_deps
-from uiucprescon.build.compiler_info import (
-    get_compiler_version,
-)
-from uiucprescon.build.conan import conan_api
 from uiucprescon.build.conan.files import (
     ConanBuildInfo,
     read_conan_build_info_json,
     parse_conan_build_info,
-    get_library_metadata_from_build_info_json,
+    get_library_metadata_from_build_info,
+    get_linking_libraries,
     get_linking_libraries_fp
 )
+from uiucprescon.build import build_plan, pipeline
+from uiucprescon.build.capabilities import get_toolchain_capabilities
 from uiucprescon.build.conan.utils import LanguageStandardsVersion
+from uiucprescon.build.deps import get_win_deps
+from uiucprescon.build.session import get_active_session, load_conan_graph
+from uiucprescon.build.utils import file_lock, find_conanfile, load_toml
 
 if TYPE_CHECKING:
     import distutils.ccompiler
@@ -83,7 +84,7 @@ class AbsResultTester(abc.ABC):
 
 class MacResultTester(AbsResultTester):
     def test_binary_dependents(self, file_path: Path) -> None:
-        otool = shutil.which("otool")
+        otool = get_toolchain_capabilities().tool_path("otool")
         if otool is None:
             raise FileNotFoundError("otool")
         self.compiler.spawn([otool, "-L", str(file_path.resolve())])
@@ -115,7 +116,7 @@ class WindowsResultTester(AbsResultTester):
 
 class LinuxResultTester(AbsResultTester):
     def test_binary_dependents(self, file_path: Path):
-        ldd = shutil.which("ldd")
+        ldd = get_toolchain_capabilities().tool_path("ldd")
         if ldd is None:
             raise FileNotFoundError("ldd not found")
         self.compiler.spawn([ldd, str(file_path.resolve())])
@@ -205,46 +206,53 @@ def update_extension3(
 
 def match_libs(
     extension: setuptools.extension.Extension,
-    build_path: str
+    build_path: str,
+    conan_build_info: Optional[Dict[str, typing.Any]] = None,
 ) -> None:
-    build_json = os.path.join(build_path, "conan_build_info.json")
-
-    with open(build_json, "r", encoding="utf-8") as f:
-        libraries = extension.libraries.copy()
-        for original_lib_name in libraries:
-            if metadata := get_library_metadata_from_build_info_json(
-                original_lib_name,
-                f
+    if conan_build_info is None:
+        conan_build_info = load_conan_graph(build_path)
+        if conan_build_info is None:
+            raise FileNotFoundError(
+                f"Missing conan_build_info.json in {build_path}"
+            )
+
+    libraries = extension.libraries.copy()
+    for original_lib_name in libraries:
+        if metadata := get_library_metadata_from_build_info(
+            original_lib_name,
+            conan_build_info
+        ):
+            # replace name of the library in case the actual name is
+            # different from the original
+            new_names = get_linking_libraries(
+                original_lib_name, conan_build_info
+            )
+            if len(new_names) > 0 \
+                and (
+                    len(new_names) > 1 or new_names[0] != original_lib_name
             ):
-                # replace name of the library in case the actual name is
-                # different from the original
-                new_names = update_library_names(original_lib_name, f)
-                if len(new_names) > 0 \
-                    and (
-                        len(new_names) > 1 or new_names[0] != original_lib_name
-                ):
-                    original_position =\
-                        extension.libraries.index(original_lib_name)
-                    extension.libraries.remove(original_lib_name)
-                    for new_name in reversed(new_names):
-                        extension.libraries.insert(original_position, new_name)
-
-                extension.libraries += [
-                    lib for lib in metadata.libs
-                    if lib not in extension.libraries
-                ]
+                original_position =\
+                    extension.libraries.index(original_lib_name)
+                extension.libraries.remove(original_lib_name)
+                for new_name in reversed(new_names):
+                    extension.libraries.insert(original_position, new_name)
+
+            extension.libraries += [
+                lib for lib in metadata.libs
+                if lib not in extension.libraries
+            ]
 
-                for include_path in reversed(metadata.include_paths):
-                    if include_path not in extension.include_dirs:
-                        extension.include_dirs.insert(0, include_path)
+            for include_path in reversed(metadata.include_paths):
+                if include_path not in extension.include_dirs:
+                    extension.include_dirs.insert(0, include_path)
 
-                for lib_path in reversed(metadata.lib_dirs):
-                    if lib_path not in extension.library_dirs:
-                        extension.library_dirs.insert(0, lib_path)
+            for lib_path in reversed(metadata.lib_dirs):
+                if lib_path not in extension.library_dirs:
+                    extension.library_dirs.insert(0, lib_path)
 
-                for define_macro in reversed(metadata.definitions):
-                    if define_macro not in extension.define_macros:
-                        extension.define_macros.insert(0, define_macro)
+            for define_macro in reversed(metadata.definitions):
+                if define_macro not in extension.define_macros:
+                    extension.define_macros.insert(0, define_macro)
 
 
 def add_all_libs(
@@ -318,6 +326,12 @@ def get_conan_options() -> List[str]:
     return platform_settings.get("conan_options", [])
 
 
+def _get_conan_options_if_available() -> List[str]:
+    if not os.path.exists("pyproject.toml"):
+        return []
+    return get_conan_options()
+
+
 class BuildConan(setuptools.Command):
     """Build dependencies with Conan package manager."""
 
@@ -356,12 +370,9 @@ class BuildConan(setuptools.Command):
         if not os.path.exists(self.conan_home):
             self.mkpath(self.conan_home)
 
-        self.build_temp = os.path.join(build_cmd.build_temp, "conan_build")
-        if not os.path.exists(self.build_temp):
-            self.mkpath(self.build_temp)
-
+        capabilities = get_toolchain_capabilities()
         if self.conan_cache is None:
-            if version("conan") < "2.0.0":
+            if capabilities.uses_conan_v1:
                 self.conan_cache = os.path.join(
                     os.environ.get("CONAN_USER_HOME", self.conan_home),
                     ".conan"
@@ -377,16 +388,58 @@ class BuildConan(setuptools.Command):
 
         if self.compiler_version is None:
             # This function section is ugly and should be refactored
-            if version("conan") < "2.0.0":
+            if capabilities.uses_conan_v1:
                 self.compiler_version = os.getenv(
-                    "CONAN_COMPILER_VERSION", get_compiler_version()
+                    "CONAN_COMPILER_VERSION", capabilities.compiler_version
                 )
             else:
-                if platform.system() == "Windows":
-                    if "msc" in platform.python_compiler().lower():
-                        from .conan.v2 import get_msvc_compiler_version
-                        self.compiler_version =\
-                            get_msvc_compiler_version(self.build_temp)
+                if capabilities.platform == "Windows":
+                    if capabilities.compiler_family == "msvc":
+                        self.compiler_version = capabilities.compiler_version
+
+        if self.build_temp is None:
+            self.build_temp = _get_shared_conan_build_dir()
+        if self.build_temp is None:
+            session = get_active_session()
+            if session is not None and session.conan_build_dir is not None:
+                self.build_temp = session.conan_build_dir
+            else:
+                # Every configuration gets a directory of its own so builds
+                # with different settings never reuse each other's results.
+                self.build_temp = os.path.join(
+                    build_cmd.build_temp,
+                    "conan_build",
+                    self.get_configuration_id(),
+                )
+        if not os.path.exists(self.build_temp):
+            self.mkpath(self.build_temp)
+
+    def get_configuration_id(self) -> str:
+        """Get an id for everything that changes what Conan builds."""
+        conanfile = self.conanfile or _find_conanfile(path=".")
+        conanfile_hash = None
+        if conanfile is not None and os.path.isfile(conanfile):
+            with open(conanfile, "rb") as f:
+                conanfile_hash = hashlib.sha256(f.read()).hexdigest()
+        language_standards = self.language_standards
+        configuration = {
+            "conanfile": conanfile_hash,
+            "conan_version": list(
+                get_toolchain_capabilities().conan_version[:1]
+            ),
+            "machine": platform.machine(),
+            "compiler_version": self.compiler_version,
+            "compiler_libcxx": self.compiler_libcxx,
+            "target_os_version": self.target_os_version,
+            "arch": self.arch,
+            "cxx_std": getattr(language_standards, "cpp_std", None),
+            "c_std": getattr(language_standards, "c_std", None),
+            "conan_options": _get_conan_options_if_available(),
+            "lockfile": _get_build_plan_lockfile_data(),
+        }
+        return hashlib.sha256(
+            json.dumps(configuration, sort_keys=True).encode("utf-8")
+        ).hexdigest()[:16]
 
     def getConanBuildInfo(
         self, root_dir: str
@@ -449,7 +502,7 @@ class BuildConan(setuptools.Command):
         else:
             install_dir = build_ext.build_temp
 
-        build_dir_full_path = os.path.abspath(self.build_temp)
+        build_dir_full_path = os.path.abspath(cast(str, self.build_temp))
         conan_cache = self.conan_cache
         if conan_cache and not os.path.exists(conan_cache):
             self.mkpath(conan_cache)
@@ -462,21 +515,71 @@ class BuildConan(setuptools.Command):
             _find_conanfile(path=".") or
             os.path.abspath(".")
         )
-        metadata = build_deps_with_conan(
-            conanfile=conanfile,
-            build_dir=self.build_temp,
-            install_dir=os.path.abspath(install_dir),
-            compiler_libcxx=self.compiler_libcxx,
-            compiler_version=self.compiler_version,
-            target_os_version=self.target_os_version,
-            arch=self.arch,
-            build=self.build_libs if len(self.build_libs) > 0 else None,
-            language_standards=self.language_standards,
-            conan_options=get_conan_options(),
-            conan_cache=conan_cache,
-            install_libs=self.install_libs,
-            announce=self.announce,
+        session = get_active_session()
+        if session is not None and session.conan_install is not None:
+            if session.conan_install_pending:
+                self.announce(
+                    "Compiling the sources that do not need the Conan "
+                    "dependencies while they are installed",
+                    5,
+                )
+                pipeline.precompile_independent_sources(
+                    build_ext, _get_source_root(self.distribution)
+                )
+            session.wait_for_conan_install()
+        resolution = (
+            session.get_conan_resolution(build_dir_full_path)
+            if session is not None else None
         )
+        if resolution is not None:
+            self.announce(
+                f"Using dependencies already resolved in {self.build_temp}",
+                5
+            )
+            metadata = resolution.build_info
+        else:
+            # Other builds of the same checkout may be using the same build
+            # directory or Conan cache at the same time.
+            with contextlib.ExitStack() as locks:
+                locks.enter_context(file_lock(f"{build_dir_full_path}.lock"))
+                if conan_cache:
+                    locks.enter_context(
+                        file_lock(f"{os.path.abspath(conan_cache)}.lock")
+                    )
+                lockfile = (
+                    build_plan.plan_conan_lockfile(
+                        session.build_plan, build_dir_full_path
+                    )
+                    if session is not None else None
+                )
+                if lockfile is not None:
+                    self.announce(
+                        f"Using the versions pinned in {lockfile}", 5
+                    )
+                metadata = build_deps_with_conan(
+                    conanfile=conanfile,
+                    build_dir=self.build_temp,
+                    install_dir=os.path.abspath(install_dir),
+                    compiler_libcxx=self.compiler_libcxx,
+                    compiler_version=self.compiler_version,
+                    target_os_version=self.target_os_version,
+                    arch=self.arch,
+                    build=(
+                        self.build_libs if len(self.build_libs) > 0 else None
+                    ),
+                    language_standards=self.language_standards,
+                    conan_options=get_conan_options(),
+                    conan_cache=conan_cache,
+                    install_libs=self.install_libs,
+                    announce=self.announce,
+                    lockfile=lockfile,
+                    bundle=build_plan.find_conan_bundle(),
+                )
+                if session is not None:
+                    resolution = session.record_conan_resolution(
+                        build_dir_full_path, metadata
+                    )
+        conan_graph = resolution.graph if resolution is not None else None
         build_ext_cmd = cast(BuildExt, self.get_finalized_command("build_ext"))
         extensions = []
         for extension in build_ext_cmd.extensions:
@@ -496,8 +599,12 @@ class BuildConan(setuptools.Command):
                 extension,
                 strategy=(
                     functools.partial(add_all_libs, text_md=metadata)
-                    if version("conan") < "2.0.0" else
-                    functools.partial(match_libs, build_path=self.build_temp)
+                    if get_toolchain_capabilities().uses_conan_v1 else
+                    functools.partial(
+                        match_libs,
+                        build_path=self.build_temp,
+                        conan_build_info=conan_graph
+                    )
                 )
             )
             extension.library_dirs.insert(0, install_dir)
@@ -510,6 +617,25 @@ class BuildConan(setuptools.Command):
         build_ext_cmd.extensions = extensions
 
 
+def _get_shared_conan_build_dir() -> Optional[str]:
+    # Set when the dependencies are shared by builds for several Python
+    # interpreters, for example by a matrix build.
+    session = get_active_session()
+    if session is None or not session.config_settings:
+        return None
+    conan_build_dir = session.config_settings.get("conan_build_dir")
+    if not conan_build_dir:
+        return None
+    return os.path.abspath(cast(str, conan_build_dir))
+
+
+def _get_build_plan_lockfile_data() -> Optional[Dict[str, typing.Any]]:
+    session = get_active_session()
+    if session is None:
+        return None
+    return build_plan.plan_lockfile_data(session.build_plan)
+
+
 def _get_source_root(dist: Distribution) -> str:
     project_files = ["pyproject.toml", "setup.py"]
     path = dist.src_root or os.curdir
@@ -521,12 +647,7 @@ def _get_source_root(dist: Distribution) -> str:
 
 
 def _find_conanfile(path: str) -> Optional[str]:
-    conanfile_types = ["conanfile.py", "conanfile.txt"]
-    for conanfile_type in conanfile_types:
-        conanfile = os.path.join(path, conanfile_type)
-        if os.path.exists(conanfile):
-            return conanfile
-    return None
+    return find_conanfile(path)
 
 
 def build_conan(
@@ -535,8 +656,24 @@ def build_conan(
     metadata_directory: Optional[str] = None,
     install_libs: bool = True,
 ) -> None:
-    dist = Distribution()
-    dist.parse_config_files()
+    create_build_conan_command(
+        wheel_directory, config_settings, metadata_directory, install_libs
+    ).run()
+
+
+def create_build_conan_command(
+    wheel_directory: str,
+    config_settings: Optional[Dict[str, Union[str, List[str], None]]] = None,
+    metadata_directory: Optional[str] = None,
+    install_libs: bool = True,
+) -> BuildConan:
+    """Create the build_conan command build_conan runs, finalized."""
+    session = get_active_session()
+    if session is not None:
+        dist = session.distribution
+    else:
+        dist = Distribution()
+        dist.parse_config_files()
 
     source_root = _get_source_root(dist)
 
@@ -567,14 +704,17 @@ def build_conan(
 
         command.compiler_libcxx = config_settings.get("conan_compiler_libcxx")
         command.arch = config_settings.get("arch")
-        if version("conan") > "2.0.0" and "MSC" in platform.python_compiler():
-            from uiucprescon.build.conan.v2 import get_msvc_compiler_version
-            command.compiler_version = get_msvc_compiler_version()
+        capabilities = get_toolchain_capabilities()
+        if (
+            not capabilities.uses_conan_v1
+            and capabilities.compiler_family == "msvc"
+        ):
+            command.compiler_version = capabilities.compiler_version
         else:
             command.compiler_version = config_settings.get(
-                "conan_compiler_version", get_compiler_version()
+                "conan_compiler_version", capabilities.compiler_version
             )
-        if version("conan") > "2.0.0":
+        if not capabilities.uses_conan_v1:
             command.language_standards = LanguageStandardsVersion(
                 cpp_std=config_settings.get("cxx_std")
             )
@@ -582,13 +722,13 @@ def build_conan(
     if conan_cache is None:
         conan_home = os.getenv("CONAN_USER_HOME")
         if conan_home is not None:
-            if version("conan") < "2.0.0":
+            if get_toolchain_capabilities().uses_conan_v1:
                 conan_cache = os.path.join(conan_home, ".conan")
             else:
                 conan_cache = os.path.join(conan_home, ".conan2")
 
     if conan_cache is None:
-        if version("conan") < "2.0.0":
+        if get_toolchain_capabilities().uses_conan_v1:
             os.path.join(
                 cast(
                     BuildExt, command.get_finalized_command("build_ext")
@@ -603,13 +743,11 @@ def build_conan(
                 ".conan2",
             )
     command.finalize_options()
-    command.run()
+    return command
 
 
 def get_pyproject_toml_data() -> Dict[str, typing.Any]:
-    pyproj_toml = Path("pyproject.toml")
-    with open(pyproj_toml, "r", encoding="utf-8") as f:
-        return toml.load(f)
+    return load_toml("pyproject.toml")
 
 
 def build_deps_with_conan(
@@ -627,7 +765,13 @@ def build_deps_with_conan(
     install_libs=True,
     build=None,
     announce=None,
+    lockfile=None,
+    bundle=None,
 ):
+    # pybind11_builder imports this module, so setup.py files that only
+    # import pybind11_builder must not import conan.
+    from uiucprescon.build.conan import conan_api  # noqa: PLC0415
+
     return conan_api.build_deps_with_conan(
         conanfile,
         build_dir,
@@ -643,6 +787,8 @@ def build_deps_with_conan(
         debug,
         install_libs,
         announce,
+        lockfile,
+        bundle,
     )
 
 
@@ -745,6 +891,15 @@ def update_library_names(
 
 
 def find_linking_libraries_with_conan_build_info_json(conan_build_info):
+    session = get_active_session()
+    if session is not None:
+        resolution = session.get_conan_resolution(
+            os.path.dirname(conan_build_info)
+        )
+        if resolution is not None:
+            return resolution.build_info[
+                "bin_paths" if sys.platform == "win32" else "lib_paths"
+            ]
     if not os.path.exists(conan_build_info):
         raise FileNotFoundError("Missing required file conan_build_info.json.")
 
@@ -0,0 +1,180 @@
+"""Index of the files every object file and extension was built from.
+
+setuptools compiles all the sources of an extension again when any of them
+is newer than the extension, and not at all otherwise. The headers they
+include are not looked at, unless they are listed in Extension.depends.
+
+BuildPybind11Extension has the compiler write the headers each source
+includes into a dependency file (-MMD -MF) and keeps them, with the flags
+the source was compiled with, in an index in the build directory. An
+extension is only built when one of its sources, their headers or its flags
+changed. Then a source is only compiled again when it, one of its headers
+or its flags changed, and the extension is only linked again when one of
+its objects or its link flags changed.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, List, Sequence, Tuple
+
+from uiucprescon.build import file_inputs
+
+__all__ = ["DependencyIndex", "parse_dependency_file", "signature"]
+
+DEPENDENCY_INDEX = "uiucprescon_dependencies.json"
+INDEX_VERSION = 1
+
+# Compiler types of distutils that write dependency files with -MMD -MF
+DEPENDENCY_FILE_COMPILERS = ["unix", "cygwin", "mingw32"]
+
+
+def parse_dependency_file(path: str) -> List[str]:
+    """Get the files listed in a dependency file written by gcc or clang."""
+    with open(path, "r", encoding="utf-8", errors="surrogateescape") as f:
+        text = f.read().replace("\\\r\n", " ").replace("\\\n", " ")
+    files: List[str] = []
+    for rule in text.splitlines():
+        # The target ends at the first colon followed by whitespace, which
+        # leaves drive letters of Windows paths alone.
+        _, separator, prerequisites = rule.partition(": ")
+        if not separator:
+            continue
+        current = ""
+        escaped = False
+        for char in prerequisites:
+            if escaped:
+                current += char if char in " #\\" else "\\" + char
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char.isspace():
+                if current:
+                    files.append(current)
+                current = ""
+            else:
+                current += char
+        if escaped:
+            current += "\\"
+        if current:
+            files.append(current)
+    return [name.replace("$$", "$") for name in files]
+
+
+def signature(**flags: Any) -> str:
+    """Hash the flags an output is built with."""
+    return hashlib.sha256(
+        json.dumps(flags, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+class DependencyIndex:
+    """The files and flags every output was built from.
+
+    Safe to use from several threads of the same build.
+    """
+
+    def __init__(self, path: str) -> None:
+        """Use the index stored at path, if there is one."""
+        self.path = path
+        self.outputs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._digests: Dict[Tuple[str, int, int], str] = {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("version") == INDEX_VERSION:
+            self.outputs = data.get("outputs", {})
+
+    def is_up_to_date(self, output: str, flags: str) -> bool:
+        """Check if output was built with flags from unchanged files."""
+        output = os.path.abspath(output)
+        with self._lock:
+            entry = self.outputs.get(output)
+        return (
+            entry is not None
+            and entry["flags"] == flags
+            and os.path.exists(output)
+            and not file_inputs.is_stale(entry["inputs"])
+        )
+
+    def is_extension_up_to_date(self, output: str, flags: str) -> bool:
+        """Check if the extension at output was built with flags.
+
+        The objects it was linked from and every file they were compiled
+        from have to be unchanged too.
+        """
+        output = os.path.abspath(output)
+        with self._lock:
+            entry = self.outputs.get(output)
+            if entry is None or entry.get("extension") != flags:
+                return False
+            objects = [
+                self.outputs.get(path) for path in entry["inputs"]
+            ]
+        return (
+            os.path.exists(output)
+            and not file_inputs.is_stale(entry["inputs"])
+            and all(
+                not file_inputs.is_stale(obj["inputs"])
+                for obj in objects
+                if obj is not None
+            )
+        )
+
+    def _fingerprint(self, paths: Sequence[str]) -> file_inputs.Inputs:
+        # Most headers are included by many sources, so each one is only
+        # read once.
+        inputs: file_inputs.Inputs = {}
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            memo = (path, st.st_mtime_ns, st.st_size)
+            with self._lock:
+                digest = self._digests.get(memo)
+            if digest is None:
+                digest = file_inputs.file_digest(path)
+                with self._lock:
+                    self._digests[memo] = digest
+            inputs[path] = [st.st_mtime_ns, st.st_size, digest]
+        return inputs
+
+    def record(self, output: str, flags: str, inputs: Sequence[str]) -> None:
+        """Record the files and flags output was just built from."""
+        fingerprints = self._fingerprint(
+            sorted({os.path.abspath(path) for path in inputs})
+        )
+        with self._lock:
+            self.outputs[os.path.abspath(output)] = {
+                "flags": flags,
+                "inputs": fingerprints,
+            }
+
+    def record_extension(self, output: str, flags: str) -> None:
+        """Record the flags of the extension just linked at output."""
+        with self._lock:
+            entry = self.outputs.get(os.path.abspath(output))
+            if entry is not None:
+                entry["extension"] = flags
+
+    def forget(self, output: str) -> None:
+        """Drop output from the index, so that it is built again."""
+        with self._lock:
+            self.outputs.pop(os.path.abspath(output), None)
+
+    def save(self) -> None:
+        """Write the index."""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with self._lock:
+            data = {"version": INDEX_VERSION, "outputs": self.outputs}
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+        os.replace(temp_path, self.path)
@@ -27,7 +27,8 @@ import warnings
 
 from setuptools.msvc import EnvironmentInfo
 
-from .msvc import msvc14_get_vc_env
+from uiucprescon.build.capabilities import get_toolchain_capabilities
+from uiucprescon.build.msvc import msvc14_get_vc_env
 
 if TYPE_CHECKING:
     from distutils.ccompiler import CCompiler
@@ -295,7 +296,7 @@ def use_readelf_to_determine_deps(
     run_readelf_strategy: Optional[Callable[[str], str]] = None,
 ) -> List[str]:
     def _run_readelf(_library_path: str) -> str:
-        readelf = shutil.which("readelf")
+        readelf = get_toolchain_capabilities().tool_path("readelf")
         if readelf is None:
             raise FileNotFoundError("readelf not found")
         return subprocess.run(  # nosec B603
@@ -341,7 +342,7 @@ def is_linux_system_libraries(library: str) -> bool:
 
 def use_patchelf_to_determine_deps(library: str, patchelf) -> List[str]:
     if patchelf is None:
-        patchelf = shutil.which("patchelf")
+        patchelf = get_toolchain_capabilities().tool_path("patchelf")
     if patchelf is None:
         raise FileNotFoundError("patchelf not found")
     return [
@@ -363,7 +364,7 @@ def fix_up_linux_libraries(
     exclude_libraries: Optional[Union[Set[str], List[str]]] = None,
 ) -> None:
     output_path = os.path.dirname(library)
-    patchelf = shutil.which("patchelf")
+    patchelf = get_toolchain_capabilities().tool_path("patchelf")
     if patchelf is None:
         raise FileNotFoundError("patchelf not found")
     for dependent_library in use_patchelf_to_determine_deps(
@@ -592,12 +593,15 @@ DEFAULT_FIXUP_LIBRARY_STRATEGIES: Dict[
         get_dependencies_strat=functools.partial(
             iter_otool_lib_dependencies,
             otool_get_shared_libs_strategy=functools.partial(
-                otool_subprocess, otool_exec=shutil.which("otool")
+                otool_subprocess,
+                otool_exec=get_toolchain_capabilities().tool_path("otool"),
             ),
         ),
         change_depend_shared_lib_name_strat=functools.partial(
             change_mac_lib_depend_shared_lib_name,
-            install_name_tool_exec=shutil.which("install_name_tool"),
+            install_name_tool_exec=get_toolchain_capabilities().tool_path(
+                "install_name_tool"
+            ),
         ),
         exclude_libraries=exclusions,
         deploy_library_strat=functools.partial(deploy_darwin_shared_lib),
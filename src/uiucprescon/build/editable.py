@@ -0,0 +1,328 @@
+"""Editable installs that rebuild their extensions when they are imported.
+
+setuptools builds the extensions of an editable install in a temporary
+directory, so every reinstall compiles everything again and the Conan
+libraries installed next to the objects are deleted once the wheel is
+built. With the editable_rebuild config setting, the build directories are
+kept in the project instead, and object files whose sources and headers are
+unchanged are reused.
+
+The compile and link commands of every extension are recorded in a
+manifest. The editable wheel installs an import hook, see _editable_hook,
+that uses them to recompile the changed sources before the extension is
+imported.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import os
+import threading
+import zipfile
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+    cast,
+)
+
+from setuptools.command import editable_wheel
+
+from uiucprescon.build import _editable_hook, file_inputs
+from uiucprescon.build.errors import PlatformError
+from uiucprescon.build.wheel_writer import ParallelWheelFile
+
+__all__ = [
+    "EDITABLE_MANIFEST",
+    "add_rebuild_hook",
+    "get_editable_build_dir",
+    "persistent_editable_build",
+]
+
+EDITABLE_MANIFEST = "uiucprescon_editable.json"
+DEFAULT_EDITABLE_BUILD_DIR = os.path.join("build", "editable")
+
+# Options giving the output of a command, for gcc/clang and MSVC
+OUTPUT_FLAGS = ["-o"]
+OUTPUT_PREFIXES = ["/Fo", "/OUT:", "-Fo"]
+SOURCE_PREFIXES = ["/Tp", "/Tc", "-Tp", "-Tc"]
+
+
+def get_editable_build_dir(
+    config_settings: Optional[Dict[str, Union[str, List[str], None]]],
+) -> str:
+    """Get the directory editable builds keep their build files in."""
+    return os.path.abspath(
+        cast(
+            str,
+            (config_settings or {}).get("editable_build_dir")
+            or DEFAULT_EDITABLE_BUILD_DIR,
+        )
+    )
+
+
+def _output_of(command: List[str]) -> Optional[str]:
+    for i, arg in enumerate(command):
+        if arg in OUTPUT_FLAGS and i + 1 < len(command):
+            return os.path.abspath(command[i + 1])
+        for prefix in OUTPUT_PREFIXES:
+            if arg.startswith(prefix) and len(arg) > len(prefix):
+                return os.path.abspath(arg[len(prefix):])
+    return None
+
+
+def _source_of(command: List[str], sources: Dict[str, str]) -> Optional[str]:
+    for arg in command:
+        path = arg
+        for prefix in SOURCE_PREFIXES:
+            if arg.startswith(prefix):
+                path = arg[len(prefix):]
+                break
+        source = sources.get(os.path.abspath(path))
+        if source is not None:
+            return source
+    return None
+
+
+class CommandRecorder:
+    """Records the commands that build each extension.
+
+    Object files whose compile command is unchanged since the last build,
+    and whose sources and headers are unchanged too, are not compiled again.
+
+    Extensions may be built at the same time, with their sources compiled
+    in other threads, so commands are matched to the extension they build
+    by their output and sources rather than by the thread running them.
+    """
+
+    def __init__(self, manifest_path: str, source_root: str) -> None:
+        """Record into manifest_path, reusing what it already holds."""
+        self.manifest_path = manifest_path
+        self.source_root = source_root
+        previous = _editable_hook.load_manifest(manifest_path) or {}
+        self.previous: Dict[str, Any] = previous.get("extensions", {})
+        self.extensions: Dict[str, Any] = {}
+        self._building: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._forced = 0
+        self._force: Any = None
+
+    def _find_record(
+        self, command: List[str], output: str
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        with self._lock:
+            records = list(self._building.values())
+        for record in records:
+            if output == record["output"]:
+                return record, None
+        for record in records:
+            source = _source_of(command, record["sources"])
+            if source is not None:
+                return record, source
+        return None, None
+
+    def _spawn(
+        self,
+        spawn: Callable[..., Any],
+        compiler: Any,
+        command: List[str],
+        **kwargs: Any,
+    ) -> Any:
+        command = list(command)
+        output = _output_of(command)
+        if output is None:
+            return spawn(command, **kwargs)
+        record, source = self._find_record(command, output)
+        if record is None:
+            return spawn(command, **kwargs)
+        env = {}
+        # MSVC finds its tools through the PATH it sets up for itself
+        if getattr(compiler, "_paths", None):
+            env["PATH"] = compiler._paths
+        step = {"command": command, "cwd": os.getcwd(), "env": env}
+        if source is None:
+            record["link"] = step
+            return spawn(command, **kwargs)
+        earlier = self.previous.get(record["name"], {}).get(
+            "objects", {}
+        ).get(output)
+        if (
+            earlier is not None
+            and earlier["command"] == command
+            and os.path.exists(output)
+            and not file_inputs.is_stale(earlier["inputs"])
+        ):
+            print(f"skipping {source} (up-to-date)")
+            record["objects"][output] = earlier
+            return None
+        inputs = file_inputs.source_inputs(
+            source, command, self.source_root
+        )
+        result = spawn(command, **kwargs)
+        record["objects"][output] = {
+            **step, "source": source, "inputs": inputs
+        }
+        return result
+
+    def _record_compiler(self, compiler: Any) -> None:
+        with self._lock:
+            if getattr(compiler, "_uiucprescon_recorder", None) is self:
+                return
+            # Compiler.call replaces the deprecated spawn in newer setuptools
+            method = "call" if hasattr(compiler, "call") else "spawn"
+            spawn = getattr(compiler, method)
+            setattr(
+                compiler,
+                method,
+                lambda command, **kwargs: self._spawn(
+                    spawn, compiler, command, **kwargs
+                ),
+            )
+            compiler._uiucprescon_recorder = self
+
+    def _force_build(self, build_ext: Any, force: bool) -> None:
+        # Headers are not part of the up-to-date check of setuptools, the
+        # recorder decides which objects to compile instead.
+        with self._lock:
+            if force:
+                if self._forced == 0:
+                    self._force = build_ext.force
+                    build_ext.force = True
+                self._forced += 1
+            else:
+                self._forced -= 1
+                if self._forced == 0:
+                    build_ext.force = self._force
+
+    def build_extension(
+        self, build_ext: Any, ext: Any, original: Callable[..., None]
+    ) -> None:
+        """Build ext with build_ext, recording the commands it runs."""
+        fullname = build_ext.get_ext_fullname(ext.name)
+        record: Dict[str, Any] = {
+            "name": fullname,
+            "sources": {
+                os.path.abspath(s): os.path.abspath(s) for s in ext.sources
+            },
+            "output": os.path.abspath(build_ext.get_ext_fullpath(ext.name)),
+            "target": None,
+            "link": None,
+            "objects": {},
+        }
+        if hasattr(build_ext, "_get_inplace_equivalent"):
+            build_py = build_ext.get_finalized_command("build_py")
+            record["target"] = os.path.abspath(
+                build_ext._get_inplace_equivalent(build_py, ext)[0]
+            )
+        self._record_compiler(build_ext.compiler)
+        with self._lock:
+            self._building[fullname] = record
+        self._force_build(build_ext, True)
+        try:
+            original(build_ext, ext)
+        finally:
+            self._force_build(build_ext, False)
+            with self._lock:
+                del self._building[fullname]
+        if record["link"] is None:
+            # Not linked again because no object changed
+            record["link"] = self.previous.get(fullname, {}).get("link")
+        del record["name"]
+        del record["sources"]
+        with self._lock:
+            self.extensions[fullname] = record
+
+    def save(self) -> None:
+        """Write the manifest used by the import hook."""
+        _editable_hook.save_manifest(
+            self.manifest_path,
+            {
+                "version": _editable_hook.MANIFEST_VERSION,
+                "source_root": self.source_root,
+                "extensions": self.extensions,
+            },
+        )
+
+
+@contextlib.contextmanager
+def persistent_editable_build(
+    build_dir: str, source_root: Optional[str] = None
+) -> Iterator[str]:
+    """Have setuptools build editable wheels in build_dir.
+
+    Yields the path of the manifest the build commands are recorded in.
+    """
+    original_configure_build = getattr(
+        editable_wheel.editable_wheel, "_configure_build", None
+    )
+    if original_configure_build is None:
+        # setuptools has no public way to choose the build directories of
+        # an editable wheel.
+        raise PlatformError(
+            "editable_rebuild is not supported by this version of "
+            "setuptools. Build the editable install without it."
+        )
+    os.makedirs(build_dir, exist_ok=True)
+    manifest_path = os.path.join(build_dir, EDITABLE_MANIFEST)
+    recorder = CommandRecorder(
+        manifest_path, os.path.abspath(source_root or os.curdir)
+    )
+
+    def configure_build(self: Any, *args: Any, **kwargs: Any) -> None:
+        original_configure_build(self, *args, **kwargs)
+        build = self.distribution.get_command_obj("build")
+        build.build_temp = os.path.join(build_dir, "temp")
+        build.build_platlib = build.build_purelib = build.build_lib = (
+            os.path.join(build_dir, "lib")
+        )
+        # Only the build_ext command of this editable wheel is recorded
+        build_ext = self.distribution.get_command_obj("build_ext")
+        original_build_extension = type(build_ext).build_extension
+        build_ext.build_extension = lambda ext: recorder.build_extension(
+            build_ext, ext, original_build_extension
+        )
+
+    editable_wheel.editable_wheel._configure_build = configure_build
+    try:
+        with _editable_hook._lock(f"{manifest_path}.lock"):
+            yield manifest_path
+            recorder.save()
+    finally:
+        editable_wheel.editable_wheel._configure_build = (
+            original_configure_build
+        )
+
+
+def add_rebuild_hook(wheel: str, manifest_path: str) -> None:
+    """Add the import hook rebuilding the extensions to an editable wheel."""
+    name = os.path.basename(wheel).split("-")[0].lower()
+    module = f"__uiucprescon_rebuild_{name}"
+    # The hook imports file_inputs relative to itself, so both are shipped
+    # in a package of their own.
+    hook_files = {
+        "__init__.py": cast(str, _editable_hook.__file__),
+        "file_inputs.py": cast(str, file_inputs.__file__),
+    }
+    pth = f"import {module}; {module}.install({manifest_path!r})\n"
+    original = f"{wheel}.orig"
+    os.replace(wheel, original)
+    try:
+        with zipfile.ZipFile(original) as source, ParallelWheelFile(
+            wheel, "w"
+        ) as target:
+            for filename, path in hook_files.items():
+                with open(path, "r", encoding="utf-8") as f:
+                    target.writestr(f"{module}/{filename}", f.read())
+            target.writestr(f"{module}.pth", pth)
+            for info in source.infolist():
+                if info.filename != target.record_path:
+                    target.writestr(info, source.read(info))
+    except BaseException:
+        os.replace(original, wheel)
+        raise
+    os.remove(original)
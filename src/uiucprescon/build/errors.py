@@ -1,4 +1,25 @@
+from typing import Dict
+
 from distutils.errors import DistutilsPlatformError, DistutilsExecError
 
 PlatformError = DistutilsPlatformError
 ExecError = DistutilsExecError
+
+
+class BuildServerError(RuntimeError):
+    """A build forwarded to the build server failed."""
+
+
+class PreflightError(PlatformError):
+    """The build machine is missing something the build needs."""
+
+    def __init__(self, problems: Dict[str, str]) -> None:
+        """Report the problems found, by the name of the failed check."""
+        self.problems = problems
+        report = "\n".join(
+            f"  {name}: {problem}" for name, problem in problems.items()
+        )
+        super().__init__(
+            "The build cannot succeed on this machine. Set the config "
+            "setting preflight=false to skip these checks.\n" + report
+        )
@@ -0,0 +1,131 @@
+"""The files an object file is built from, and whether they changed.
+
+The headers a source includes are found by scanning its include directives
+without running the preprocessor. Files are fingerprinted by their
+modification time, size and content, so that touching a file without
+changing it does not make what was built from it out of date.
+
+Editable wheels built with the editable_rebuild config setting ship a copy
+of this module next to the import hook, see _editable_hook. It runs where
+uiucprescon.build may not be installed, so it only uses the standard
+library.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+from typing import Any, Dict, List, Sequence
+
+__all__ = [
+    "INCLUDE_REGEX",
+    "Inputs",
+    "file_digest",
+    "fingerprint",
+    "include_dirs_of",
+    "is_stale",
+    "scan_includes",
+    "source_inputs",
+]
+
+INCLUDE_REGEX = re.compile(
+    rb'^[ \t]*#[ \t]*include[ \t]*([<"])([^>"\r\n]+)[>"]', re.MULTILINE
+)
+
+# path: [mtime_ns, size, sha256]
+Inputs = Dict[str, List[Any]]
+
+
+def file_digest(path: str) -> str:
+    """Hash the content of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fingerprint(paths: Sequence[str]) -> Inputs:
+    """Get the fingerprints of the files compiled into an object file."""
+    inputs: Inputs = {}
+    for path in paths:
+        st = os.stat(path)
+        inputs[path] = [st.st_mtime_ns, st.st_size, file_digest(path)]
+    return inputs
+
+
+def is_stale(inputs: Inputs) -> bool:
+    """Check if any of the inputs changed since they were fingerprinted.
+
+    Only the files whose modification time changed are read, so touching a
+    file without changing it, such as by switching git branches back and
+    forth, does not make it stale.
+    """
+    for path, (mtime_ns, size, digest) in inputs.items():
+        try:
+            st = os.stat(path)
+        except OSError:
+            return True
+        if (st.st_mtime_ns, st.st_size) == (mtime_ns, size):
+            continue
+        if st.st_size != size or file_digest(path) != digest:
+            return True
+    return False
+
+
+def include_dirs_of(command: Sequence[str]) -> List[str]:
+    """Get the include directories given to a compile command."""
+    include_dirs = []
+    args = iter(command)
+    for arg in args:
+        if arg in ["-I", "/I"]:
+            include_dirs.append(next(args, ""))
+        elif arg.startswith(("-I", "/I")):
+            include_dirs.append(arg[2:])
+    return [d for d in include_dirs if d]
+
+
+def scan_includes(
+    source: str, include_dirs: Sequence[str], root: str
+) -> List[str]:
+    """Find the headers inside root that source includes, recursively.
+
+    Headers outside of root, such as the ones of Python or of the Conan
+    dependencies, are left out. They do not change while developing.
+    """
+    root = os.path.join(os.path.abspath(root), "")
+    found: List[str] = []
+    seen = {os.path.abspath(source)}
+    pending = [os.path.abspath(source)]
+    while pending:
+        path = pending.pop()
+        try:
+            with open(path, "rb") as f:
+                text = f.read()
+        except OSError:
+            continue
+        for kind, name in INCLUDE_REGEX.findall(text):
+            search_dirs = list(include_dirs)
+            if kind == b'"':
+                search_dirs.insert(0, os.path.dirname(path))
+            header_name = name.decode("utf-8", "replace").strip()
+            for search_dir in search_dirs:
+                candidate = os.path.abspath(
+                    os.path.join(search_dir, header_name)
+                )
+                if not os.path.isfile(candidate):
+                    continue
+                if candidate.startswith(root) and candidate not in seen:
+                    seen.add(candidate)
+                    found.append(candidate)
+                    pending.append(candidate)
+                break
+    return sorted(found)
+
+
+def source_inputs(source: str, command: Sequence[str], root: str) -> Inputs:
+    """Fingerprint a source file and the project headers it includes."""
+    return fingerprint(
+        [source] + scan_includes(source, include_dirs_of(command), root)
+    )
@@ -1,13 +1,63 @@
 """This module provides functionality to introspect of setup.py extensions."""
 
+import contextlib
+import dataclasses
+import hashlib
 import os
 import sys
-from typing import cast, Optional
+from importlib.metadata import version
+from typing import cast, Any, Dict, Iterator, List, Optional
 import tokenize
 import json
+import distutils.core
+import setuptools
 from setuptools import Command
 from setuptools import build_meta
 from setuptools.command.build_ext import build_ext
+from setuptools.extension import Extension
+
+
+INTROSPECTION_FILE = "setuptools_introspection.json"
+
+INTROSPECTION_MODE_COMMAND = "command"
+INTROSPECTION_MODE_INTERCEPT = "intercept"
+INTROSPECTION_MODES = [
+    INTROSPECTION_MODE_COMMAND,
+    INTROSPECTION_MODE_INTERCEPT,
+]
+
+# Results published by BuildExtInfo for get_extension_build_info() to collect
+# without having to round-trip through a file on disk.
+_introspection_results: List[Dict[str, Any]] = []
+
+
+def publish_introspection_result(data: Dict[str, Any]) -> None:
+    """Make introspection data available to the in-process caller."""
+    _introspection_results.append(data)
+
+
+def collect_introspection_result() -> Optional[Dict[str, Any]]:
+    """Retrieve and clear the most recently published introspection data."""
+    if not _introspection_results:
+        return None
+    result = _introspection_results[-1]
+    _introspection_results.clear()
+    return result
+
+
+def extension_build_info(extension: Extension) -> Dict[str, Any]:
+    """Get the build information of an extension as json friendly data."""
+    return {
+        "name": extension.name,
+        "sources": list(extension.sources),
+        "depends": list(extension.depends),
+        "language": extension.language,
+        "define_macros": extension.define_macros,
+        "include_dirs": extension.include_dirs,
+        "libraries": extension.libraries,
+        "extra_compile_args": extension.extra_compile_args,
+        "cxx_std": getattr(extension, "cxx_std", None),
+    }
 
 
 class BuildExtInfo(Command):
@@ -17,13 +67,24 @@ class BuildExtInfo(Command):
 
     description = "Build the extension and return build information."
 
+    user_options = [
+        (
+            "persist",
+            None,
+            f"write {INTROSPECTION_FILE} to the build directory",
+        ),
+    ]
+
+    boolean_options = ["persist"]
+
     def initialize_options(self) -> None:
         """Initialize options for the command."""
         self.build_dir = None
+        self.persist = False
 
     def finalize_options(self) -> None:
         """Finalize options for the command."""
-        if self.build_dir is None:
+        if self.build_dir is None and self.persist:
             build_ext_cmd = cast(
                 build_ext, self.get_finalized_command("build_ext")
             )
@@ -42,29 +103,26 @@ class BuildExtInfo(Command):
     def run(self) -> None:
         """Run the command to build the extension."""
         print("inspecting setup.py...")
+        build_ext_cmd = cast(
+            build_ext, self.get_finalized_command("build_ext")
+        )
+        data: Dict[str, Any] = {"extensions": []}
+        for e in build_ext_cmd.extensions:
+            data["extensions"].append(extension_build_info(e))
+        publish_introspection_result(data)
+        if self.persist:
+            self.write_introspection_file(data)
+
+    def write_introspection_file(self, data: Dict[str, Any]) -> None:
+        """Write the introspection data to the build directory."""
         if self.build_dir is None:
             self.warn("build_dir was not set")
             return
         build_dir: str = self.build_dir
         if not os.path.exists(build_dir):
             self.mkpath(build_dir)
-
-        build_ext_cmd = cast(
-            build_ext, self.get_finalized_command("build_ext")
-        )
-        data = {"extensions": []}
-        for e in build_ext_cmd.extensions:
-            data["extensions"].append(
-                {
-                    "name": e.name,
-                    "define_macros": e.define_macros,
-                    "include_dirs": e.include_dirs,
-                    "libraries": e.libraries,
-                    "cxx_std": getattr(e, "cxx_std", None),
-                }
-            )
         with open(
-            os.path.join(build_dir, "setuptools_introspection.json"),
+            os.path.join(build_dir, INTROSPECTION_FILE),
             "w",
             encoding="utf-8"
         ) as f:
@@ -74,42 +132,238 @@ class BuildExtInfo(Command):
             f.write(json_string)
 
 
-def get_extension_build_info():
+INTROSPECTION_CACHE_FILE = "setuptools_introspection_cache.json"
+INTROSPECTION_CACHE_MAX_ENTRIES = 16
+
+FINGERPRINTED_PROJECT_FILES = ["setup.py", "pyproject.toml", "setup.cfg"]
+
+
+@dataclasses.dataclass
+class IntrospectionCacheStats:
+    """Counters for introspection cache lookups."""
+
+    hits: int = 0
+    misses: int = 0
+
+
+introspection_cache_stats = IntrospectionCacheStats()
+
+
+class IntrospectionCache:
+    """Persistent cache of setup.py introspection results.
+
+    Results are keyed by a fingerprint of the project files, the setuptools
+    version and the running interpreter so that setup.py only needs to be
+    executed again when one of them changes.
+    """
+
+    def __init__(
+        self,
+        cache_file: str,
+        stats: Optional[IntrospectionCacheStats] = None,
+    ) -> None:
+        """Create a cache backed by the given json file."""
+        self.cache_file = cache_file
+        self.stats = (
+            stats if stats is not None else introspection_cache_stats
+        )
+
+    @staticmethod
+    def fingerprint(
+        source_root: str = ".", mode: str = INTROSPECTION_MODE_COMMAND
+    ) -> str:
+        """Generate a cache key for the project located at source_root."""
+        key = hashlib.sha256()
+        key.update(mode.encode("utf-8"))
+        for project_file in FINGERPRINTED_PROJECT_FILES:
+            key.update(project_file.encode("utf-8"))
+            file_path = os.path.join(source_root, project_file)
+            if os.path.exists(file_path):
+                with open(file_path, "rb") as f:
+                    key.update(hashlib.sha256(f.read()).digest())
+        key.update(version("setuptools").encode("utf-8"))
+        key.update(sys.executable.encode("utf-8"))
+        key.update(sys.version.encode("utf-8"))
+        return key.hexdigest()
+
+    def _read_entries(self) -> Dict[str, Any]:
+        if not os.path.exists(self.cache_file):
+            return {}
+        try:
+            with open(self.cache_file, "r", encoding="utf-8") as f:
+                return json.load(f).get("entries", {})
+        except (OSError, ValueError, AttributeError):
+            # A corrupt cache is treated the same as an empty cache
+            return {}
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Get the cached introspection data, if any."""
+        data = self._read_entries().get(key)
+        if data is None:
+            self.stats.misses += 1
+        else:
+            self.stats.hits += 1
+        return data
+
+    def put(self, key: str, data: Dict[str, Any]) -> None:
+        """Store introspection data in the cache."""
+        entries = self._read_entries()
+        entries.pop(key, None)
+        entries[key] = data
+        while len(entries) > INTROSPECTION_CACHE_MAX_ENTRIES:
+            del entries[next(iter(entries))]
+        cache_dir = os.path.dirname(self.cache_file)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        temp_file = f"{self.cache_file}.{os.getpid()}.tmp"
+        with open(temp_file, "w", encoding="utf-8") as f:
+            json.dump({"entries": entries}, f)
+        os.replace(temp_file, self.cache_file)
+
+
+def get_extension_build_info(
+    use_cache: bool = True,
+    cache_dir: str = "build",
+    persist: bool = False,
+    mode: str = INTROSPECTION_MODE_COMMAND,
+) -> Dict[str, Any]:
     """Retrieve the build information for extensions from the setup.py file.
 
-    This creates a setuptools_introspection.json file in the build directory
+    When use_cache is True, results are stored in cache_dir and reused for as
+    long as setup.py, pyproject.toml, setuptools and the interpreter are
+    unchanged. When persist is True, setup.py writes a
+    setuptools_introspection.json file to the build directory.
+
+    The "command" mode runs setup.py with the build_ext_info command. The
+    "intercept" mode only captures the arguments given to setup() and never
+    creates or finalizes any setuptools commands. Persisting is only
+    supported by the "command" mode.
+    """
+    if mode not in INTROSPECTION_MODES:
+        raise ValueError(
+            f"Unknown introspection mode {mode}. "
+            f"Valid options are: {', '.join(INTROSPECTION_MODES)}"
+        )
+
+    def introspect() -> Dict[str, Any]:
+        if mode == INTROSPECTION_MODE_INTERCEPT:
+            return _intercept_setup_py()
+        return _introspect_setup_py(persist)
+
+    if not use_cache:
+        return introspect()
+
+    cache = IntrospectionCache(
+        os.path.join(cache_dir, INTROSPECTION_CACHE_FILE)
+    )
+    key = cache.fingerprint(mode=mode)
+    build_info = cache.get(key)
+    if build_info is not None:
+        print("Using cached introspection of setup.py")
+    else:
+        build_info = introspect()
+        cache.put(key, build_info)
+    print(
+        f"Introspection cache hits: {cache.stats.hits}, "
+        f"misses: {cache.stats.misses}"
+    )
+    return build_info
+
+
+def _introspect_setup_py(persist: bool = False) -> Dict[str, Any]:
+    """Run setup.py to retrieve the build information for extensions.
+
+    The data is handed back in-process by BuildExtInfo. Only if persist is
+    True is a setuptools_introspection.json file also created in the build
+    directory.
     """
     og = sys.argv.copy()
-    setuptools_introspection = None
     try:
         sys.argv = [
             *sys.argv[:1],
             "build_ext_info",
+            *(["--persist"] if persist else []),
         ]
         with build_meta.Distribution.patch():
-            build_meta.Distribution.patch()
             setup = os.path.abspath("setup.py")
             if not os.path.exists(setup):
                 return {"extensions": []}
             code = tokenize.open(setup).read().replace("\r\n", "\n")
+            collect_introspection_result()
             exec(code, {**locals(), **{"__file__": setup}})  # nosec B102
-            for root, dirs, files in os.walk("build"):
-                if len(os.path.split(root)) > 10:
-                    raise FileNotFoundError(
-                        "Too many nested directories, skipping introspection."
-                    )
-                for file in files:
-                    if file == "setuptools_introspection.json":
-                        setuptools_introspection = os.path.join(root, file)
-                        break
-                if setuptools_introspection:
-                    break
-            else:
-                raise FileNotFoundError(
-                    "unable to find setuptools_introspection.json file. "
-                )
+            setuptools_introspection = collect_introspection_result()
+        if setuptools_introspection is None:
+            raise RuntimeError(
+                "setup.py did not produce any introspection data."
+            )
+        return setuptools_introspection
+    finally:
+        sys.argv = og
+
 
-        with open(setuptools_introspection, "r", encoding="utf-8") as f:
-            return json.load(f)
+def _json_friendly_setup_keywords(
+    setup_keywords: Dict[str, Any]
+) -> Dict[str, Any]:
+    json_friendly = {}
+    for key, value in setup_keywords.items():
+        if key == "ext_modules":
+            continue
+        try:
+            json.dumps(value)
+        except (TypeError, ValueError):
+            continue
+        json_friendly[key] = value
+    return json_friendly
+
+
+@contextlib.contextmanager
+def _capture_setup_calls(
+    setup_calls: List[Dict[str, Any]]
+) -> Iterator[None]:
+    def capture_setup(**attrs: Any) -> None:
+        setup_calls.append(attrs)
+
+    original_setuptools_setup = setuptools.setup
+    original_distutils_setup = distutils.core.setup
+    setuptools.setup = capture_setup
+    distutils.core.setup = capture_setup  # type: ignore[assignment]
+    try:
+        yield
+    finally:
+        setuptools.setup = original_setuptools_setup
+        distutils.core.setup = original_distutils_setup
+
+
+def _intercept_setup_py() -> Dict[str, Any]:
+    """Retrieve the build information by capturing the call to setup().
+
+    The call to setup() returns straight away so no Distribution is created
+    and no commands are finalized.
+    """
+    setup = os.path.abspath("setup.py")
+    if not os.path.exists(setup):
+        return {"extensions": []}
+    print("inspecting setup.py...")
+    setup_calls: List[Dict[str, Any]] = []
+    og = sys.argv.copy()
+    try:
+        sys.argv = [setup]
+        with tokenize.open(setup) as f:
+            code = f.read().replace("\r\n", "\n")
+        with _capture_setup_calls(setup_calls):
+            exec(  # nosec B102
+                compile(code, setup, "exec"),
+                {"__file__": setup, "__name__": "__main__"}
+            )
     finally:
         sys.argv = og
+    if not setup_calls:
+        raise RuntimeError("setup.py did not call setup().")
+    setup_keywords = setup_calls[-1]
+    return {
+        "extensions": [
+            extension_build_info(extension)
+            for extension in setup_keywords.get("ext_modules") or []
+        ],
+        "setup_keywords": _json_friendly_setup_keywords(setup_keywords),
+    }
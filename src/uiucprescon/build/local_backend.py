@@ -1,16 +1,29 @@
 """PEP 517 backend for building Python packages."""
+import contextlib
 import os
+import re
+import sys
 
 import setuptools
 import setuptools.build_meta
 import platform
-from . introspection import get_extension_build_info
+from . introspection import (
+    get_extension_build_info,
+    INTROSPECTION_MODE_COMMAND
+)
 from . import utils
-from . import conan_libs
 from . import monkey
+from . import preflight
+from . import build_plan
+from . import object_cache
+from . import remote_cache
+from . import server
+from . import wheel_cache
+from . import wheel_writer
+from .session import BuildSession, build_session
 from pathlib import Path
-from typing import Optional, Dict, List, Union, cast
-from importlib.metadata import version
+from typing import Any, Optional, Dict, List, Union, cast
+from .capabilities import get_toolchain_capabilities
 
 pyproj_toml = Path("pyproject.toml")
 
@@ -19,8 +32,24 @@ def build_sdist(
     sdist_directory: str,
     config_settings: Optional[Dict[str, Union[str, List[str], None]]] = None,
 ) -> str:
-    """Build a source distribution."""
-    return setuptools.build_meta.build_sdist(sdist_directory, config_settings)
+    """Build a source distribution.
+
+    With the build_plan config setting enabled, the sdist also gets a build
+    plan so that wheels built from it can skip inspecting setup.py and
+    resolving the Conan dependencies. With conan_bundle enabled, it gets the
+    recipes and sources of the Conan dependencies.
+    """
+    sdist = setuptools.build_meta.build_sdist(sdist_directory, config_settings)
+    if _is_enabled(config_settings, "build_plan", default=False):
+        plan = build_plan.create_build_plan(config_settings)
+        build_plan.embed_build_plan(
+            os.path.join(sdist_directory, sdist), plan
+        )
+    if _is_enabled(config_settings, "conan_bundle", default=False):
+        build_plan.embed_conan_bundle(
+            os.path.join(sdist_directory, sdist), config_settings
+        )
+    return sdist
 
 
 def build_wheel(
@@ -29,6 +58,174 @@ def build_wheel(
     metadata_directory: Optional[str] = None,
 ) -> str:
     """Build a wheel."""
+    forwarded = server.forward_hook(
+        "build_wheel", wheel_directory, config_settings, metadata_directory
+    )
+    if forwarded is not None:
+        return forwarded
+    with build_session(config_settings) as session:
+        return _build_wheel(
+            session, wheel_directory, config_settings, metadata_directory
+        )
+
+
+def _build_wheel(
+    session: BuildSession,
+    wheel_directory: str,
+    config_settings: Optional[Dict[str, Union[str, List[str], None]]] = None,
+    metadata_directory: Optional[str] = None,
+    prepared: bool = False,
+) -> str:
+    cache = wheel_cache.get_wheel_cache(config_settings)
+    remote = remote_cache.get_remote_cache(config_settings)
+    cache_key = None
+    if cache is not None or remote is not None:
+        # Looked up before anything is inspected or installed, so a hit only
+        # costs resolving the dependency graph.
+        cache_key = wheel_cache.wheel_cache_key(
+            config_settings,
+            resolve_conan_graph(session, config_settings),
+            exclude=[wheel_directory],
+        )
+        cached_wheel = _fetch_cached_wheel(
+            cache, remote, cache_key, wheel_directory
+        )
+        if cached_wheel is not None:
+            return cached_wheel
+    if not prepared:
+        config_settings = prepare_build(
+            session, wheel_directory, config_settings, metadata_directory
+        )
+    elif platform.system() == "Windows":
+        monkey.patch_for_msvc_specialized_compiler()
+    env_vars = {}
+    if config_settings is not None:
+        if "conan_cache" in config_settings:
+            env_vars["CONAN_USER_HOME"] = os.path.normpath(
+                os.path.join(cast(str, config_settings["conan_cache"]), "..")
+            )
+        if "target_os_version" in config_settings:
+            if platform.system() == "Darwin":
+                env_vars["MACOSX_DEPLOYMENT_TARGET"] =\
+                    config_settings["target_os_version"]
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(utils.set_env_var(env_vars))
+        _use_object_cache(stack, config_settings)
+        if _is_enabled(config_settings, "parallel_wheel_writer", False):
+            stack.enter_context(
+                wheel_writer.parallel_wheel_writer(
+                    wheel_writer.CompressionPolicy.from_config_settings(
+                        config_settings
+                    )
+                )
+            )
+        wheel = setuptools.build_meta.build_wheel(
+            wheel_directory, config_settings, metadata_directory
+        )
+    if cache is not None and cache_key is not None:
+        try:
+            cache.put(cache_key, os.path.join(wheel_directory, wheel))
+        except OSError as error:
+            print(f"Unable to add {wheel} to the wheel cache: {error}",
+                  file=sys.stderr)
+    if remote is not None and cache_key is not None:
+        remote.put(
+            remote_cache.NAMESPACE_WHEELS,
+            cache_key,
+            os.path.join(wheel_directory, wheel),
+        )
+        remote.close()
+    return wheel
+
+
+def build_prepared_wheel(
+    session: BuildSession,
+    wheel_directory: str,
+    config_settings: Optional[Dict[str, Union[str, List[str], None]]] = None,
+    metadata_directory: Optional[str] = None,
+) -> str:
+    """Build a wheel that prepare_build already ran for.
+
+    prepare_build may have run in another process, for another interpreter.
+    The session needs its results, and config_settings are the config
+    settings it returned. Only the steps that depend on the interpreter run.
+    """
+    return _build_wheel(
+        session,
+        wheel_directory,
+        config_settings,
+        metadata_directory,
+        prepared=True,
+    )
+
+
+def resolve_conan_graph(
+    session: BuildSession,
+    config_settings: Optional[Dict[str, Union[str, List[str], None]]] = None,
+) -> Optional[Dict[str, Any]]:
+    """Get the Conan dependencies of the session, without installing them.
+
+    They are only resolved once per session.
+    """
+    if session.conan_graph is None:
+        if session.build_plan is None:
+            session.build_plan = build_plan.load_build_plan()
+        session.conan_graph = build_plan.resolve_conan_graph(
+            config_settings, session.build_plan
+        )
+    return session.conan_graph
+
+
+def _use_object_cache(
+    stack: contextlib.ExitStack,
+    config_settings: Optional[Dict[str, Union[str, List[str], None]]],
+) -> None:
+    objects = object_cache.get_object_cache(config_settings)
+    if objects is not None:
+        stack.enter_context(object_cache.cached_compiles(objects))
+
+
+def _fetch_cached_wheel(
+    cache: Optional[wheel_cache.WheelCache],
+    remote: Optional[remote_cache.RemoteCache],
+    cache_key: str,
+    wheel_directory: str,
+) -> Optional[str]:
+    if cache is not None:
+        cached_wheel = cache.fetch_wheel(cache_key, wheel_directory)
+        if cached_wheel is not None:
+            print(f"Using {cached_wheel} from the wheel cache")
+            return cached_wheel
+    if remote is None:
+        return None
+    downloaded = remote.get(
+        remote_cache.NAMESPACE_WHEELS, cache_key, wheel_directory
+    )
+    remote.close()
+    if downloaded is None:
+        return None
+    if cache is not None:
+        try:
+            cache.put(cache_key, downloaded)
+        except OSError as error:
+            print(f"Unable to add {downloaded} to the wheel cache: {error}",
+                  file=sys.stderr)
+    print(f"Using {os.path.basename(downloaded)} from the remote cache")
+    return os.path.basename(downloaded)
+
+
+def prepare_build(
+    session: BuildSession,
+    wheel_directory: str,
+    config_settings: Optional[Dict[str, Union[str, List[str], None]]] = None,
+    metadata_directory: Optional[str] = None,
+) -> Optional[Dict[str, Union[str, List[str], None]]]:
+    """Inspect the extensions and build the Conan dependencies.
+
+    These are the steps of building a wheel that do not depend on the Python
+    interpreter. Returns the config settings completed with what was
+    learned from the extensions.
+    """
     if platform.system() == "Windows":
         monkey.patch_for_msvc_specialized_compiler()
     if (
@@ -36,7 +233,7 @@ def build_wheel(
         and config_settings.get("conan_cache") is not None
         and "CONAN_USER_HOME" in os.environ
     ):
-        if version("conan") < "2.0.0":
+        if get_toolchain_capabilities().uses_conan_v1:
             config_settings["conan_cache"] = os.path.join(
                 os.environ["CONAN_USER_HOME"], ".conan"
             )
@@ -44,7 +241,26 @@ def build_wheel(
             config_settings["conan_cache"] = os.path.join(
                 os.environ["CONAN_USER_HOME"], ".conan2"
             )
-    build_info = get_extension_build_info()
+    introspection_mode = cast(
+        str,
+        (config_settings or {}).get(
+            "introspection_mode", INTROSPECTION_MODE_COMMAND
+        ),
+    )
+    if session.build_plan is None:
+        session.build_plan = build_plan.load_build_plan()
+    build_info = (
+        build_plan.plan_build_info(session.build_plan, introspection_mode)
+        if session.build_plan is not None else None
+    )
+    if build_info is not None:
+        print(f"Using the extensions from {build_plan.BUILD_PLAN_FILE}")
+    else:
+        build_info = get_extension_build_info(
+            use_cache=_use_introspection_cache(config_settings),
+            mode=introspection_mode,
+        )
+    session.build_info = build_info
 
     required_cxx_std = None
     required_c_std = None
@@ -69,27 +285,56 @@ def build_wheel(
         if config_settings is None:
             config_settings = {}
         config_settings["c_std"] = required_c_std
-    conan_libs.build_conan(
-        wheel_directory,
-        config_settings,
-        metadata_directory,
-        install_libs=False,
-    )
-    env_vars = {}
-    if config_settings is not None:
-        if "conan_cache" in config_settings:
-            env_vars["CONAN_USER_HOME"] = os.path.normpath(
-                os.path.join(cast(str, config_settings["conan_cache"]), "..")
-            )
-        if "target_os_version" in config_settings:
-            if platform.system() == "Darwin":
-                env_vars["MACOSX_DEPLOYMENT_TARGET"] =\
-                    config_settings["target_os_version"]
-    with utils.set_env_var(env_vars):
-        return setuptools.build_meta.build_wheel(
-            wheel_directory, config_settings, metadata_directory
+    session.config_settings = config_settings
+
+    uses_conan = utils.find_conanfile(".") is not None
+    if _is_enabled(config_settings, "preflight", default=True):
+        preflight.run_preflight_checks(
+            config_settings, build_info, wheel_directory, uses_conan
         )
 
+    if uses_conan:
+        # conan_libs is imported here so that the hooks that only need
+        # metadata never have to pay for importing conan.
+        from . import conan_libs  # noqa: PLC0415
+
+        if _is_enabled(config_settings, "conan_pipeline", default=False):
+            # build_conan compiles what it can while waiting for it
+            command = conan_libs.create_build_conan_command(
+                wheel_directory,
+                config_settings,
+                metadata_directory,
+                install_libs=False,
+            )
+            session.start_conan_install(
+                command.run, cast(str, command.build_temp)
+            )
+        else:
+            conan_libs.build_conan(
+                wheel_directory,
+                config_settings,
+                metadata_directory,
+                install_libs=False,
+            )
+    return config_settings
+
+
+def _use_introspection_cache(
+    config_settings: Optional[Dict[str, Union[str, List[str], None]]] = None,
+) -> bool:
+    return _is_enabled(config_settings, "introspection_cache", default=True)
+
+
+def _is_enabled(
+    config_settings: Optional[Dict[str, Union[str, List[str], None]]],
+    key: str,
+    default: bool,
+) -> bool:
+    if config_settings is None or config_settings.get(key) is None:
+        return default
+    value = str(config_settings[key]).lower()
+    return value not in ["false", "0", "no", "off", ""]
+
 
 def get_requires_for_build_sdist(
     config_settings: Optional[Dict[str, Union[str, List[str], None]]] = None,
@@ -102,17 +347,69 @@ def prepare_metadata_for_build_wheel(
     metadata_directory: str,
     config_settings: Optional[Dict[str, Union[str, List[str], None]]] = None,
 ) -> str:
-    """Prepare metadata for building a wheel."""
+    """Prepare metadata for building a wheel.
+
+    This does not introspect setup.py, resolve dependencies or use a compiler.
+    """
     return setuptools.build_meta.prepare_metadata_for_build_wheel(
         metadata_directory, config_settings
     )
 
 
+CONAN_BUILD_REQUIREMENTS = [
+    "conan",
+    "cmake",
+    "PyYAML",
+    'patchelf; sys_platform == "linux"',
+]
+
+PYBIND11_IMPORT_REGEX = re.compile(
+    r"^\s*(?:from|import)\s+[\w.]*pybind11", re.MULTILINE
+)
+
+
+def _setup_py_uses_pybind11(setup_py: str = "setup.py") -> bool:
+    if not os.path.exists(setup_py):
+        return False
+    with open(setup_py, "r", encoding="utf-8") as f:
+        return PYBIND11_IMPORT_REGEX.search(f.read()) is not None
+
+
 def get_requires_for_build_wheel(
     config_settings: Optional[Dict[str, Union[str, List[str], None]]] = None,
 ) -> List[str]:
-    """Get the requirements for building a wheel."""
-    return ["wheel >= 0.25", "setuptools", "pybind11>=2.5", "toml"]
+    """Get the requirements for building a wheel.
+
+    Only the requirements that the project actually uses are returned.
+    """
+    requires = ["wheel >= 0.25", "setuptools"]
+    if _setup_py_uses_pybind11():
+        requires.append("pybind11>=2.5")
+    if utils.find_conanfile(".") is not None:
+        requires += CONAN_BUILD_REQUIREMENTS
+    if sys.version_info < (3, 11):
+        requires.append("toml")
+    return requires
+
+
+def prepare_metadata_for_build_editable(
+    metadata_directory: str,
+    config_settings: Optional[Dict[str, Union[str, List[str], None]]] = None,
+) -> str:
+    """Prepare metadata for building an editable wheel.
+
+    This does not introspect setup.py, resolve dependencies or use a compiler.
+    """
+    return setuptools.build_meta.prepare_metadata_for_build_editable(
+        metadata_directory, config_settings
+    )
+
+
+def get_requires_for_build_editable(
+    config_settings: Optional[Dict[str, Union[str, List[str], None]]] = None,
+) -> List[str]:
+    """Get the requirements for building an editable wheel."""
+    return get_requires_for_build_wheel(config_settings)
 
 
 def build_editable(
@@ -122,7 +419,35 @@ def build_editable(
     ] = None,
     metadata_directory: Optional[str] = None,
 ):
-    """Build an editable wheel."""
-    return setuptools.build_meta.build_editable(
-        wheel_directory, config_settings, metadata_directory
+    """Build an editable wheel.
+
+    With the editable_rebuild config setting, the extensions are built in a
+    build directory kept in the project, and the wheel gets an import hook
+    recompiling the changed sources before an extension is imported.
+    """
+    forwarded = server.forward_hook(
+        "build_editable", wheel_directory, config_settings, metadata_directory
     )
+    if forwarded is not None:
+        return forwarded
+    if not _is_enabled(config_settings, "editable_rebuild", default=False):
+        with contextlib.ExitStack() as stack:
+            _use_object_cache(stack, config_settings)
+            return setuptools.build_meta.build_editable(
+                wheel_directory, config_settings, metadata_directory
+            )
+    # editable is imported here so that the other hooks never import it.
+    from . import editable  # noqa: PLC0415
+
+    with contextlib.ExitStack() as stack:
+        manifest = stack.enter_context(
+            editable.persistent_editable_build(
+                editable.get_editable_build_dir(config_settings)
+            )
+        )
+        _use_object_cache(stack, config_settings)
+        wheel = setuptools.build_meta.build_editable(
+            wheel_directory, config_settings, metadata_directory
+        )
+    editable.add_rebuild_hook(os.path.join(wheel_directory, wheel), manifest)
+    return wheel
@@ -0,0 +1,254 @@
+r"""Build wheels of one project for several Python interpreters.
+
+The extensions are inspected and the Conan dependencies are resolved and
+built only once, with the interpreter running the matrix build. Every
+interpreter then compiles and fixes up the extensions in its own process,
+in parallel, reusing the dependencies from a shared Conan build directory.
+The results of these first steps are saved for the interpreters, which do
+not run them again.
+
+Run it from the root of the project::
+
+    python -m uiucprescon.build.matrix -o dist --python python3.10 \
+        --python python3.11 --python python3.12
+"""
+
+from __future__ import annotations
+
+import argparse
+import concurrent.futures
+import json
+import os
+import shutil
+import subprocess  # nosec B404
+import tempfile
+from typing import Dict, List, Optional, Union
+
+from uiucprescon.build import local_backend, remote_cache, wheel_cache
+from uiucprescon.build.errors import ExecError
+from uiucprescon.build.session import BuildSession, build_session
+
+__all__ = ["build_prepared_wheel", "build_wheel_matrix"]
+
+PREPARED_BUILD_FILE = "prepared_build.json"
+
+# Runs in the target interpreter, so it must only use what that interpreter
+# has available.
+BUILD_WHEEL_SCRIPT = """
+import json, sys
+from uiucprescon.build import matrix
+wheel = matrix.build_prepared_wheel(
+    sys.argv[1], json.loads(sys.argv[2]), sys.argv[3]
+)
+print(wheel)
+"""
+
+
+def _with_build_option(
+    config_settings: Dict[str, Union[str, List[str], None]],
+    options: List[str],
+) -> Dict[str, Union[str, List[str], None]]:
+    build_options = config_settings.get("--build-option") or []
+    if isinstance(build_options, str):
+        build_options = build_options.split()
+    return {**config_settings, "--build-option": build_options + options}
+
+
+def save_prepared_build(
+    session: BuildSession, prepared_build_file: str
+) -> None:
+    """Save what prepare_build learned for the interpreters of the matrix."""
+    with open(prepared_build_file, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "build_info": session.build_info,
+                "build_plan": session.build_plan,
+                "conan_graph": session.conan_graph,
+            },
+            f,
+        )
+
+
+def build_prepared_wheel(
+    wheel_directory: str,
+    config_settings: Dict[str, Union[str, List[str], None]],
+    prepared_build_file: str,
+) -> str:
+    """Build a wheel with the build prepared by the matrix build.
+
+    Runs in every interpreter of the matrix. Returns the file name of the
+    wheel.
+    """
+    with open(prepared_build_file, "r", encoding="utf-8") as f:
+        prepared = json.load(f)
+    with build_session(config_settings) as session:
+        session.build_info = prepared["build_info"]
+        session.build_plan = prepared["build_plan"]
+        session.conan_graph = prepared["conan_graph"]
+        return local_backend.build_prepared_wheel(
+            session, wheel_directory, config_settings
+        )
+
+
+def _build_for_interpreter(
+    interpreter: str,
+    wheel_directory: str,
+    config_settings: Dict[str, Union[str, List[str], None]],
+    matrix_dir: str,
+) -> str:
+    # Every interpreter gets its own bdist and egg-info directories. The ones
+    # setuptools uses by default are shared and the builds run at the same
+    # time.
+    work_dir = tempfile.mkdtemp(dir=matrix_dir)
+    config_settings = _with_build_option(
+        config_settings,
+        [
+            "--bdist-dir",
+            os.path.join(work_dir, "bdist"),
+            "egg_info",
+            "--egg-base",
+            work_dir,
+        ],
+    )
+    env = dict(os.environ)
+    # A build server runs with its own interpreter.
+    env.pop("UIUCPRESCON_BUILD_SERVER", None)
+    try:
+        result = subprocess.run(  # nosec B603
+            [
+                interpreter,
+                "-c",
+                BUILD_WHEEL_SCRIPT,
+                wheel_directory,
+                json.dumps(config_settings),
+                os.path.join(matrix_dir, PREPARED_BUILD_FILE),
+            ],
+            env=env,
+            capture_output=True,
+            text=True,
+            check=False,
+        )
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    if result.returncode != 0:
+        raise ExecError(
+            f"Building a wheel with {interpreter} failed.\n"
+            f"{result.stdout}{result.stderr}"
+        )
+    return result.stdout.strip().splitlines()[-1]
+
+
+def build_wheel_matrix(
+    wheel_directory: str,
+    interpreters: List[str],
+    config_settings: Optional[Dict[str, Union[str, List[str], None]]] = None,
+    max_workers: Optional[int] = None,
+) -> Dict[str, str]:
+    """Build a wheel for each interpreter.
+
+    Args:
+        wheel_directory: Directory to write the wheels to.
+        interpreters: Python executables to build wheels for. Each of them
+            must have uiucprescon.build and the build requirements of the
+            project installed.
+        config_settings: Same config settings the build_wheel hook accepts.
+        max_workers: Maximum number of wheels built at the same time.
+            Defaults to one per interpreter.
+
+    Returns: The file name of the wheel built by each interpreter.
+
+    """
+    wheel_directory = os.path.abspath(wheel_directory)
+    os.makedirs(wheel_directory, exist_ok=True)
+    config_settings = dict(config_settings or {})
+    if config_settings.get("conan_build_dir"):
+        config_settings["conan_build_dir"] = os.path.abspath(
+            str(config_settings["conan_build_dir"])
+        )
+
+    with build_session(config_settings) as session:
+        prepared = local_backend.prepare_build(
+            session, wheel_directory, config_settings
+        )
+        config_settings = dict(prepared or config_settings)
+        if (
+            wheel_cache.get_wheel_cache_dir(config_settings) is not None
+            or remote_cache.get_remote_cache(config_settings) is not None
+        ):
+            # Every interpreter looks up its wheel with the same graph
+            local_backend.resolve_conan_graph(session, config_settings)
+    if session.conan_build_dir is not None:
+        # The interpreters may report different compiler versions, so they
+        # are given the directory instead of deriving it from their settings.
+        config_settings["conan_build_dir"] = session.conan_build_dir
+    os.makedirs("build", exist_ok=True)
+    matrix_dir = tempfile.mkdtemp(prefix="matrix-", dir="build")
+    try:
+        save_prepared_build(
+            session, os.path.join(matrix_dir, PREPARED_BUILD_FILE)
+        )
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers or len(interpreters) or None
+        ) as executor:
+            futures = {
+                interpreter: executor.submit(
+                    _build_for_interpreter,
+                    interpreter,
+                    wheel_directory,
+                    config_settings,
+                    matrix_dir,
+                )
+                for interpreter in interpreters
+            }
+            return {
+                interpreter: future.result()
+                for interpreter, future in futures.items()
+            }
+    finally:
+        shutil.rmtree(matrix_dir, ignore_errors=True)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Build a wheel matrix from the command line."""
+    parser = argparse.ArgumentParser(
+        prog="python -m uiucprescon.build.matrix",
+        description="Build wheels for several Python interpreters, sharing "
+        "the Conan dependencies between them.",
+    )
+    parser.add_argument(
+        "--python",
+        dest="interpreters",
+        action="append",
+        required=True,
+        help="Python interpreter to build a wheel for. Can be repeated.",
+    )
+    parser.add_argument(
+        "-o", "--outdir", default="dist", help="output directory"
+    )
+    parser.add_argument(
+        "-C",
+        "--config-setting",
+        dest="config_settings",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="config setting given to the build backend. Can be repeated.",
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=None,
+        help="maximum number of wheels built at the same time",
+    )
+    args = parser.parse_args(argv)
+    config_settings: Dict[str, Union[str, List[str], None]] = {}
+    for setting in args.config_settings:
+        key, _, value = setting.partition("=")
+        config_settings[key] = value
+    wheels = build_wheel_matrix(
+        args.outdir, args.interpreters, config_settings, args.jobs
+    )
+    for interpreter, wheel in wheels.items():
+        print(f"{interpreter}: {os.path.join(args.outdir, wheel)}")
+
+
+if __name__ == "__main__":
+    main()
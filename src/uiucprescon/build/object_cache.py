@@ -0,0 +1,376 @@
+"""Cache of compiled object files, shared between builds.
+
+setuptools compiles every extension in a fresh build directory, so touching
+one source of a project compiles all of them again. With the object_cache
+config setting, every compile command run while building the extensions is
+looked up in this cache first.
+
+An object file is keyed by its preprocessed source, the compile command
+without the names of its source and output files, and the compiler that
+runs it. Cached objects are hard linked into the build directory when
+possible and copied otherwise. Like the wheel cache, the store is shared by
+every build of the user and evicts the least recently used objects once it
+grows past its size limit.
+
+Show how well the cache is doing with::
+
+    python -m uiucprescon.build.object_cache stats
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import dataclasses
+import functools
+import hashlib
+import json
+import os
+import shutil
+import subprocess  # nosec B404
+import sys
+from typing import Any, Callable, Dict, Iterator, List, Optional, Union
+
+from setuptools.command import build_ext as build_ext_module
+
+from uiucprescon.build.cache import (
+    ContentStore,
+    default_cache_root,
+    format_stats,
+    parse_size,
+)
+
+__all__ = [
+    "ObjectCache",
+    "cache_compiler",
+    "cached_compiles",
+    "get_object_cache",
+]
+
+OBJECT_CACHE_ENV_VAR = "UIUCPRESCON_BUILD_OBJECT_CACHE"
+DEFAULT_MAX_SIZE = "5G"
+
+# Bumped whenever the way keys are made changes
+KEY_VERSION = 1
+
+# Options of gcc/clang and MSVC
+COMPILE_ONLY_FLAGS = ["-c", "/c"]
+OUTPUT_FLAGS = ["-o"]
+OUTPUT_PREFIXES = ["/Fo", "-Fo"]
+SOURCE_PREFIXES = ["/Tp", "/Tc", "-Tp", "-Tc"]
+DEPENDENCY_FLAGS = ["-MD", "-MMD"]
+DEPENDENCY_FLAGS_WITH_VALUE = ["-MF", "-MT", "-MQ"]
+DEBUG_FLAGS = ["-g", "/Zi", "/Z7", "-Zi", "-Z7"]
+
+
+@dataclasses.dataclass
+class CompileCommand:
+    """A command compiling a single source into an object file."""
+
+    command: List[str]
+    source: str
+    output: str
+    msvc: bool = False
+
+    def without_files(self) -> List[str]:
+        """Get the command without the names of its source and output."""
+        args: List[str] = []
+        skip = False
+        for arg in self.command:
+            if skip:
+                skip = False
+                continue
+            if arg in OUTPUT_FLAGS or arg in DEPENDENCY_FLAGS_WITH_VALUE:
+                skip = True
+                continue
+            if arg in DEPENDENCY_FLAGS or arg.startswith(
+                tuple(OUTPUT_PREFIXES)
+            ):
+                continue
+            if _strip_source_prefix(arg) == self.source:
+                args.append(os.path.splitext(self.source)[1])
+                continue
+            args.append(arg)
+        return args
+
+    def preprocess_command(self) -> List[str]:
+        """Get the command writing the preprocessed source to stdout."""
+        args = []
+        skip = False
+        for arg in self.command:
+            if skip:
+                skip = False
+                continue
+            if arg in OUTPUT_FLAGS or arg in DEPENDENCY_FLAGS_WITH_VALUE:
+                skip = True
+                continue
+            if arg in DEPENDENCY_FLAGS or arg.startswith(
+                tuple(OUTPUT_PREFIXES)
+            ):
+                continue
+            if arg in COMPILE_ONLY_FLAGS:
+                args.append("/E" if self.msvc else "-E")
+            else:
+                args.append(arg)
+        return args
+
+
+def _strip_source_prefix(arg: str) -> str:
+    for prefix in SOURCE_PREFIXES:
+        if arg.startswith(prefix):
+            return arg[len(prefix):]
+    return arg
+
+
+def parse_compile_command(
+    command: List[str], source_extensions: List[str]
+) -> Optional[CompileCommand]:
+    """Find the source and output of a compile command.
+
+    Returns None for any other command, such as linking, or a command
+    compiling more than one source.
+    """
+    if not any(arg in COMPILE_ONLY_FLAGS for arg in command):
+        return None
+    output = None
+    sources = []
+    for i, arg in enumerate(command[1:], start=1):
+        if arg in OUTPUT_FLAGS and i + 1 < len(command):
+            output = command[i + 1]
+            continue
+        for prefix in OUTPUT_PREFIXES:
+            if arg.startswith(prefix) and len(arg) > len(prefix):
+                output = arg[len(prefix):]
+        source = _strip_source_prefix(arg)
+        if source != arg:
+            sources.append(source)
+        elif (
+            os.path.splitext(arg)[1] in source_extensions
+            and command[i - 1] not in OUTPUT_FLAGS
+        ):
+            sources.append(arg)
+    if output is None or len(sources) != 1:
+        return None
+    return CompileCommand(
+        list(command), sources[0], output, msvc="/c" in command
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def compiler_identity(executable: str) -> Dict[str, Any]:
+    """Describe the compiler run as executable."""
+    path = shutil.which(executable) or executable
+    identity: Dict[str, Any] = {"path": path}
+    try:
+        stat = os.stat(path)
+        identity["size"] = stat.st_size
+        identity["mtime"] = stat.st_mtime_ns
+    except OSError:
+        pass
+    msvc = os.path.basename(path).lower() in ["cl", "cl.exe"]
+    try:
+        # cl prints its version when it is given nothing to do
+        result = subprocess.run(  # nosec B603
+            [path] if msvc else [path, "--version"],
+            capture_output=True,
+            text=True,
+            check=False,
+            timeout=30,
+        )
+        identity["version"] = result.stderr if msvc else result.stdout
+    except (OSError, subprocess.SubprocessError):
+        identity["version"] = None
+    return identity
+
+
+class ObjectCache(ContentStore):
+    """Store of compiled object files."""
+
+    def key(
+        self,
+        compile_command: CompileCommand,
+        env: Optional[Dict[str, str]] = None,
+    ) -> Optional[str]:
+        """Make the key of the object file compile_command writes.
+
+        Returns None if the source cannot be preprocessed, in which case it
+        has to be compiled.
+        """
+        try:
+            preprocessed = subprocess.run(  # nosec B603
+                compile_command.preprocess_command(),
+                capture_output=True,
+                check=False,
+                env=env,
+            )
+        except OSError:
+            return None
+        if preprocessed.returncode != 0:
+            return None
+        command = compile_command.without_files()
+        key_data: Dict[str, Any] = {
+            "version": KEY_VERSION,
+            "command": command[1:],
+            "compiler": compiler_identity(command[0]),
+            "preprocessed": hashlib.sha256(preprocessed.stdout).hexdigest(),
+        }
+        if any(arg in DEBUG_FLAGS for arg in command):
+            # The debug information has the build directory in it
+            key_data["cwd"] = os.getcwd()
+        return hashlib.sha256(
+            json.dumps(key_data, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
+    def fetch_object(self, key: str, output: str) -> bool:
+        """Place the object file stored under key at output, if any."""
+        return (
+            self.fetch(
+                key,
+                os.path.dirname(os.path.abspath(output)),
+                os.path.basename(output),
+            )
+            is not None
+        )
+
+
+def _compiler_env(compiler: Any) -> Optional[Dict[str, str]]:
+    # MSVC finds its tools through the PATH it sets up for itself
+    paths = getattr(compiler, "_paths", None)
+    return {**os.environ, "PATH": paths} if paths else None
+
+
+def _cached_call(
+    cache: ObjectCache,
+    call: Callable[..., Any],
+    compiler: Any,
+    command: List[str],
+    **kwargs: Any,
+) -> Any:
+    compile_command = parse_compile_command(
+        list(command), list(compiler.src_extensions)
+    )
+    if compile_command is None:
+        return call(command, **kwargs)
+    key = cache.key(compile_command, _compiler_env(compiler))
+    if key is not None and cache.fetch_object(key, compile_command.output):
+        print(f"using cached object for {compile_command.source}")
+        return None
+    # The object may be a hard link into the cache from an earlier build,
+    # which the compiler would overwrite in place.
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(compile_command.output)
+    result = call(command, **kwargs)
+    if key is not None:
+        try:
+            cache.put(key, compile_command.output)
+        except OSError as error:
+            print(
+                f"Unable to add {compile_command.output} to the object "
+                f"cache: {error}",
+                file=sys.stderr,
+            )
+    return result
+
+
+def cache_compiler(compiler: Any, cache: ObjectCache) -> None:
+    """Have compiler look up the objects it compiles in cache."""
+    if getattr(compiler, "_uiucprescon_object_cache", None) is cache:
+        return
+    # Compiler.call replaces the deprecated spawn in newer setuptools
+    method = "call" if hasattr(compiler, "call") else "spawn"
+    call = getattr(compiler, method)
+    setattr(
+        compiler,
+        method,
+        lambda command, **kwargs: _cached_call(
+            cache, call, compiler, command, **kwargs
+        ),
+    )
+    compiler._uiucprescon_object_cache = cache
+
+
+@contextlib.contextmanager
+def cached_compiles(cache: ObjectCache) -> Iterator[ObjectCache]:
+    """Look up the objects compiled by build_ext in cache."""
+    original_build_extension = build_ext_module.build_ext.build_extension
+
+    def build_extension(self: Any, ext: Any) -> None:
+        cache_compiler(self.compiler, cache)
+        original_build_extension(self, ext)
+
+    build_ext_module.build_ext.build_extension = build_extension
+    try:
+        yield cache
+    finally:
+        build_ext_module.build_ext.build_extension = original_build_extension
+
+
+def get_object_cache_dir(
+    config_settings: Optional[Dict[str, Union[str, List[str], None]]] = None,
+) -> Optional[str]:
+    """Get the directory of the object cache, or None if it is disabled."""
+    value = (config_settings or {}).get("object_cache")
+    if value is None:
+        value = os.environ.get(OBJECT_CACHE_ENV_VAR)
+    if value is None:
+        return None
+    value = str(value)
+    if value.lower() in ["false", "0", "no", "off", ""]:
+        return None
+    if value.lower() in ["true", "1", "yes", "on"]:
+        return os.path.join(default_cache_root(), "objects")
+    return os.path.abspath(value)
+
+
+def get_object_cache(
+    config_settings: Optional[Dict[str, Union[str, List[str], None]]] = None,
+) -> Optional[ObjectCache]:
+    """Get the object cache configured by config_settings, if enabled."""
+    cache_dir = get_object_cache_dir(config_settings)
+    if cache_dir is None:
+        return None
+    max_size = (config_settings or {}).get(
+        "object_cache_max_size", DEFAULT_MAX_SIZE
+    )
+    return ObjectCache(cache_dir, parse_size(str(max_size)))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Show or clear the object cache from the command line."""
+    parser = argparse.ArgumentParser(
+        prog="python -m uiucprescon.build.object_cache",
+        description="Manage the cache of object files compiled by "
+        "uiucprescon.build.",
+    )
+    parser.add_argument(
+        "command", choices=["stats", "clear"], help="what to do"
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=None,
+        help="location of the cache. Defaults to "
+        f"${OBJECT_CACHE_ENV_VAR} or the user cache directory.",
+    )
+    parser.add_argument(
+        "--max-size",
+        default=DEFAULT_MAX_SIZE,
+        help=f"size limit of the cache. Default: {DEFAULT_MAX_SIZE}",
+    )
+    args = parser.parse_args(argv)
+    cache_dir = (
+        args.cache_dir
+        or get_object_cache_dir()
+        or os.path.join(default_cache_root(), "objects")
+    )
+    cache = ObjectCache(cache_dir, parse_size(args.max_size))
+    if args.command == "clear":
+        cache.clear()
+        print(f"Cleared {cache_dir}")
+        return
+    print(
+        "\n".join(format_stats(f"Object cache ({cache_dir})", cache.stats()))
+    )
+
+
+if __name__ == "__main__":
+    main()
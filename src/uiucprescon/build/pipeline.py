@@ -0,0 +1,213 @@
+"""Compiling the sources that do not need Conan while Conan is running.
+
+Installing the Conan dependencies can take longer than compiling the
+extensions, and most of the sources of an extension usually do not include
+any header of a Conan dependency. With the conan_pipeline config setting,
+the dependencies are installed in a worker thread and these sources are
+compiled in the meantime.
+
+The sources are compiled by BuildPybind11Extension with the flags its
+build_extension uses and recorded in its dependency index, so build_ext
+skips them later. Conan adds its include directories and definitions to
+the extensions linking its libraries once it is done, which the sources
+compiled early do without: none of their headers comes from Conan. Other
+build_ext commands compile everything once the dependencies are
+installed, as usual.
+
+Whether a source needs Conan is found by scanning its includes. Every
+header it includes, directly or through the headers of the project, has to
+be found in the include directories the extension already has, or be a
+header of the C or C++ standard library or of the operating system.
+Anything else may come from a Conan dependency.
+"""
+
+from __future__ import annotations
+
+import os
+from typing import Dict, List, Optional, Sequence, Set, TYPE_CHECKING, cast
+
+from pybind11.setup_helpers import auto_cpp_level
+from setuptools._distutils.ccompiler import new_compiler
+from setuptools._distutils.sysconfig import customize_compiler
+from setuptools._distutils.util import get_platform
+from setuptools.extension import Extension, Library
+
+from uiucprescon.build import object_cache
+from uiucprescon.build.file_inputs import INCLUDE_REGEX
+from uiucprescon.build.session import get_active_session
+
+if TYPE_CHECKING:
+    from distutils.ccompiler import CCompiler
+    from setuptools.command.build_ext import build_ext as BuildExt
+
+__all__ = ["needs_conan", "precompile_independent_sources"]
+
+C_HEADERS = {
+    "assert.h", "complex.h", "ctype.h", "errno.h", "fenv.h", "float.h",
+    "inttypes.h", "iso646.h", "limits.h", "locale.h", "math.h", "setjmp.h",
+    "signal.h", "stdalign.h", "stdarg.h", "stdatomic.h", "stdbool.h",
+    "stddef.h", "stdint.h", "stdio.h", "stdlib.h", "stdnoreturn.h",
+    "string.h", "tgmath.h", "threads.h", "time.h", "uchar.h", "wchar.h",
+    "wctype.h",
+}
+
+CXX_HEADERS = {
+    "algorithm", "any", "array", "atomic", "barrier", "bit", "bitset",
+    "cassert", "cctype", "cerrno", "cfenv", "cfloat", "charconv", "chrono",
+    "cinttypes", "climits", "clocale", "cmath", "codecvt", "compare",
+    "complex", "concepts", "condition_variable", "coroutine", "csetjmp",
+    "csignal", "cstdarg", "cstddef", "cstdint", "cstdio", "cstdlib",
+    "cstring", "ctime", "cuchar", "cwchar", "cwctype", "deque", "exception",
+    "execution", "expected", "filesystem", "format", "forward_list",
+    "fstream", "functional", "future", "initializer_list", "iomanip", "ios",
+    "iosfwd", "iostream", "istream", "iterator", "latch", "limits", "list",
+    "locale", "map", "memory", "memory_resource", "mutex", "new", "numbers",
+    "numeric", "optional", "ostream", "print", "queue", "random", "ranges",
+    "ratio", "regex", "scoped_allocator", "semaphore", "set",
+    "shared_mutex", "source_location", "span", "sstream", "stack",
+    "stdexcept", "stop_token", "streambuf", "string", "string_view",
+    "syncstream", "system_error", "thread", "tuple", "type_traits",
+    "typeindex", "typeinfo", "unordered_map", "unordered_set", "utility",
+    "valarray", "variant", "vector", "version",
+}
+
+OS_HEADERS = {
+    "dirent.h", "dlfcn.h", "fcntl.h", "io.h", "malloc.h", "poll.h",
+    "pthread.h", "sched.h", "semaphore.h", "strings.h", "unistd.h",
+    "windows.h", "winsock2.h", "ws2tcpip.h",
+}
+
+OS_HEADER_DIRS = ("sys/", "arpa/", "netinet/", "mach/", "mach-o/")
+
+SYSTEM_HEADERS = C_HEADERS | CXX_HEADERS | OS_HEADERS
+
+
+def _is_system_header(name: str) -> bool:
+    return (
+        name in SYSTEM_HEADERS
+        or name.lower() in OS_HEADERS
+        or name.startswith(OS_HEADER_DIRS)
+    )
+
+
+def find_unresolved_includes(
+    source: str, include_dirs: Sequence[str], root: str
+) -> Set[str]:
+    """Find the includes of source that cannot be found yet.
+
+    The headers found inside root are scanned too. Headers found outside of
+    it, such as the ones of Python, are assumed to find what they include.
+    System headers are never reported.
+    """
+    root = os.path.join(os.path.abspath(root), "")
+    unresolved: Set[str] = set()
+    seen = {os.path.abspath(source)}
+    pending = [os.path.abspath(source)]
+    while pending:
+        path = pending.pop()
+        try:
+            with open(path, "rb") as f:
+                text = f.read()
+        except OSError:
+            continue
+        for kind, name in INCLUDE_REGEX.findall(text):
+            header_name = name.decode("utf-8", "replace").strip()
+            search_dirs = list(include_dirs)
+            if kind == b'"':
+                search_dirs.insert(0, os.path.dirname(path))
+            for search_dir in search_dirs:
+                candidate = os.path.abspath(
+                    os.path.join(search_dir, header_name)
+                )
+                if os.path.isfile(candidate):
+                    if candidate.startswith(root) and candidate not in seen:
+                        seen.add(candidate)
+                        pending.append(candidate)
+                    break
+            else:
+                if not _is_system_header(header_name):
+                    unresolved.add(header_name)
+    return unresolved
+
+
+def needs_conan(
+    source: str, include_dirs: Sequence[str], root: str
+) -> bool:
+    """Check if source may include headers of the Conan dependencies."""
+    return bool(find_unresolved_includes(source, include_dirs, root))
+
+
+def _create_compiler(build_ext: BuildExt) -> CCompiler:
+    # Set up the same way build_ext.run sets up its compiler
+
+    compiler = new_compiler(
+        compiler=build_ext.compiler,
+        verbose=build_ext.verbose,
+        force=build_ext.force,
+    )
+    customize_compiler(compiler)
+    if build_ext.plat_name != get_platform():
+        compiler.initialize(build_ext.plat_name)
+    if build_ext.include_dirs is not None:
+        compiler.set_include_dirs(build_ext.include_dirs)
+    for name, value in build_ext.define or []:
+        compiler.define_macro(name, value)
+    for macro in build_ext.undef or []:
+        compiler.undefine_macro(macro)
+    session = get_active_session()
+    cache = object_cache.get_object_cache(
+        session.config_settings if session is not None else None
+    )
+    if cache is not None:
+        object_cache.cache_compiler(compiler, cache)
+    return cast("CCompiler", compiler)
+
+
+def _independent_sources(
+    ext: Extension,
+    compiler: CCompiler,
+    include_dirs: Sequence[str],
+    root: str,
+) -> List[str]:
+    src_extensions = getattr(compiler, "src_extensions", None) or []
+    return [
+        source
+        for source in sorted(ext.sources)
+        if os.path.splitext(source)[1] in src_extensions
+        and not needs_conan(source, include_dirs, root)
+    ]
+
+
+def precompile_independent_sources(
+    build_ext: BuildExt, root: Optional[str] = None
+) -> Dict[str, List[str]]:
+    """Compile the sources of the extensions that do not need Conan.
+
+    The extensions keep all their sources. Returns the object files
+    compiled, by extension name.
+    """
+    precompile_sources = getattr(build_ext, "precompile_sources", None)
+    if precompile_sources is None:
+        return {}
+    root = os.path.abspath(root or os.curdir)
+    compiler: Optional[CCompiler] = None
+    compiled: Dict[str, List[str]] = {}
+    for ext in build_ext.extensions:
+        if isinstance(ext, Library) or not ext.sources:
+            continue
+        if compiler is None:
+            compiler = _create_compiler(build_ext)
+        include_dirs = list(ext.include_dirs) + list(
+            build_ext.include_dirs or []
+        )
+        sources = _independent_sources(ext, compiler, include_dirs, root)
+        if not sources:
+            continue
+        if getattr(ext, "_cxx_level", None) == 0:
+            # pybind11 picks the newest C++ standard the compiler supports
+            # in build_ext.build_extensions, which has not run yet.
+            ext.cxx_std = auto_cpp_level(compiler)
+        objects = precompile_sources(ext, sources, compiler)
+        if objects:
+            compiled[ext.name] = objects
+    return compiled
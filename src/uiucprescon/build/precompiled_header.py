@@ -0,0 +1,160 @@
+"""Precompiled headers for the C++ extensions built with gcc or clang.
+
+Every source of a pybind11 extension includes pybind11, the standard
+library and often large headers of the Conan dependencies, and they are
+parsed again for each one of them. With the precompiled_header config
+setting, BuildPybind11Extension compiles a prefix header including them
+once, and includes it first into every source with -include. gcc and clang
+then load the precompiled header instead of parsing it, and fall back to
+the header itself when it cannot be used.
+
+The prefix header is either given, or made of the library headers,
+included with angle brackets, that at least half of the sources of the
+extension include outside of any #if block.
+
+Precompiled headers are kept in the build directory, in a directory of
+their own for every compiler, set of flags and prefix header, and are only
+compiled again when one of the headers they include changes.
+"""
+
+from __future__ import annotations
+
+import math
+import os
+import re
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from uiucprescon.build import dependency_index, object_cache
+
+__all__ = [
+    "build_precompiled_header",
+    "common_includes",
+    "precompiled_header_setting",
+    "prefix_header",
+]
+
+PCH_DIR = "pch"
+PREFIX_HEADER = "prefix.h"
+PREFIX_HEADER_COMMENT = (
+    "/* Generated by uiucprescon.build to be precompiled. */\n"
+)
+
+DIRECTIVE_REGEX = re.compile(r"^\s*#\s*(\w+)\s*(.*)$")
+ANGLE_INCLUDE_REGEX = re.compile(r"^<([^>]+)>")
+
+
+def _unconditional_includes(source: str) -> List[str]:
+    try:
+        with open(source, "r", encoding="utf-8", errors="replace") as f:
+            lines = f.readlines()
+    except OSError:
+        return []
+    includes: List[str] = []
+    depth = 0
+    for line in lines:
+        match = DIRECTIVE_REGEX.match(line)
+        if match is None:
+            continue
+        directive, rest = match.groups()
+        if directive in ["if", "ifdef", "ifndef"]:
+            depth += 1
+        elif directive == "endif":
+            depth = max(depth - 1, 0)
+        elif directive == "include" and depth == 0:
+            header = ANGLE_INCLUDE_REGEX.match(rest.strip())
+            if header is not None and header.group(1) not in includes:
+                includes.append(header.group(1))
+    return includes
+
+
+def common_includes(
+    sources: Sequence[str], min_share: float = 0.5
+) -> List[str]:
+    """Find the library headers that most of the sources include.
+
+    Only the headers included with angle brackets outside of any #if block
+    are counted. They are returned in the order they are first included.
+    """
+    counts: Dict[str, int] = {}
+    for source in sources:
+        for header in _unconditional_includes(source):
+            counts[header] = counts.get(header, 0) + 1
+    needed = max(2, math.ceil(len(sources) * min_share))
+    return [header for header, count in counts.items() if count >= needed]
+
+
+def prefix_header(
+    headers: Sequence[str] = (), prefix: Optional[str] = None
+) -> str:
+    """Make the content of a prefix header.
+
+    It includes either the file prefix, or the library headers given.
+    """
+    if prefix is not None:
+        includes = [
+            '#include "{}"'.format(
+                os.path.abspath(prefix).replace(os.sep, "/")
+            )
+        ]
+    else:
+        includes = [f"#include <{header}>" for header in headers]
+    return PREFIX_HEADER_COMMENT + "".join(f"{line}\n" for line in includes)
+
+
+def build_precompiled_header(
+    content: str,
+    command: List[str],
+    build_dir: str,
+    run: Callable[[List[str]], Any],
+) -> str:
+    """Precompile a prefix header with the compile command of its sources.
+
+    command is the compile command without the -c option and the names of
+    the source and object file. Returns the path of the prefix header to
+    include, next to which the precompiled header is.
+    """
+    identity = object_cache.compiler_identity(command[0])
+    key = dependency_index.signature(
+        compiler=identity, command=command[1:], content=content
+    )
+    pch_dir = os.path.join(os.path.abspath(build_dir), PCH_DIR, key[:16])
+    header = os.path.join(pch_dir, PREFIX_HEADER)
+    # clang looks for prefix.h.pch and gcc for prefix.h.gch when prefix.h
+    # is included with -include.
+    suffix = ".pch" if "clang" in (identity.get("version") or "") else ".gch"
+    precompiled = f"{header}{suffix}"
+    index = dependency_index.DependencyIndex(
+        os.path.join(pch_dir, dependency_index.DEPENDENCY_INDEX)
+    )
+    if index.is_up_to_date(precompiled, key):
+        return header
+    os.makedirs(pch_dir, exist_ok=True)
+    with open(header, "w", encoding="utf-8") as f:
+        f.write(content)
+    dependency_file = f"{header}.d"
+    temp_precompiled = f"{precompiled}.{os.getpid()}.tmp"
+    run(
+        command
+        + ["-x", "c++-header", header, "-o", temp_precompiled]
+        + ["-MMD", "-MF", dependency_file]
+    )
+    os.replace(temp_precompiled, precompiled)
+    index.record(
+        precompiled,
+        key,
+        [header, *dependency_index.parse_dependency_file(dependency_file)],
+    )
+    index.save()
+    return header
+
+
+def precompiled_header_setting(
+    config_settings: Dict[str, Any],
+) -> Optional[str]:
+    """Get the prefix header to use, "auto" for the common includes."""
+    value = config_settings.get("precompiled_header")
+    if value is None or str(value).lower() in ["false", "0", "no", "off", ""]:
+        return None
+    if str(value).lower() in ["true", "1", "yes", "on", "auto"]:
+        return "auto"
+    return str(value)
@@ -0,0 +1,268 @@
+"""Checks that the build machine has what the build needs, run up front.
+
+Building the Conan dependencies can take many minutes. Tools that are only
+needed afterwards, such as patchelf for fixing up the extensions, are
+checked before that starts, together with the compiler, the Conan settings
+and the directories the build writes to. The checks run in parallel and
+every problem found is reported at once.
+"""
+
+from __future__ import annotations
+
+import concurrent.futures
+import os
+import platform
+import shlex
+import subprocess  # nosec B404
+import sysconfig
+import time
+from typing import Any, Callable, Dict, List, Optional, Union, cast
+
+from setuptools.msvc import EnvironmentInfo
+
+from uiucprescon.build.capabilities import get_toolchain_capabilities
+from uiucprescon.build.errors import PreflightError
+
+__all__ = ["run_preflight_checks"]
+
+# Tools used to fix up extensions linked to Conan dependencies
+FIXUP_TOOLS = {
+    "Linux": ["patchelf", "ldd"],
+    "Darwin": ["otool", "install_name_tool"],
+    "Windows": ["dumpbin"],
+}
+
+TOOL_HINTS = {
+    "patchelf": "install it with your package manager or "
+    "'pip install patchelf'",
+    "dumpbin": "install the Visual Studio C++ build tools",
+    "otool": "install the Xcode command line tools",
+    "install_name_tool": "install the Xcode command line tools",
+}
+
+TOOL_TIMEOUT = 10
+
+Check = Callable[[], Optional[str]]
+
+
+def _run_version(command: str) -> Optional[str]:
+    executable = shlex.split(command)[0]
+    tool = get_toolchain_capabilities().tool_path(executable)
+    if tool is None:
+        return f"{executable} not found"
+    try:
+        subprocess.run(  # nosec B603
+            [tool, "--version"],
+            capture_output=True,
+            check=True,
+            timeout=TOOL_TIMEOUT,
+        )
+    except (OSError, subprocess.SubprocessError) as error:
+        return f"unable to run {tool}: {error}"
+    return None
+
+
+def _configured_command(env_var: str) -> Optional[str]:
+    return os.environ.get(env_var) or sysconfig.get_config_var(env_var)
+
+
+def check_compiler() -> Optional[str]:
+    """Check that the C and C++ compilers can be run."""
+    if platform.system() == "Windows":
+        try:
+            tools = EnvironmentInfo("amd64").VCTools
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            return f"MSVC not found: {error}"
+        if not any(
+            os.path.exists(os.path.join(path, "cl.exe")) for path in tools
+        ):
+            return "cl.exe not found"
+        return None
+    problems = []
+    for env_var in ["CC", "CXX"]:
+        command = _configured_command(env_var)
+        if command:
+            problem = _run_version(command)
+            if problem is not None:
+                problems.append(f"{env_var}: {problem}")
+    return "; ".join(problems) or None
+
+
+def check_linker() -> Optional[str]:
+    """Check that the linker for shared libraries can be found."""
+    if platform.system() == "Windows":
+        return None
+    command = _configured_command("LDSHARED")
+    if not command:
+        return None
+    executable = shlex.split(command)[0]
+    if get_toolchain_capabilities().tool_path(executable) is None:
+        return f"LDSHARED: {executable} not found"
+    return None
+
+
+def check_tool(tool: str) -> Check:
+    """Create a check that tool is available."""
+    def check() -> Optional[str]:
+        if get_toolchain_capabilities().has_tool(tool):
+            return None
+        hint = TOOL_HINTS.get(tool)
+        return f"{tool} not found" + (f", {hint}" if hint else "")
+
+    return check
+
+
+def check_writable(path: str) -> Check:
+    """Create a check that path is, or can be created as, a writable dir."""
+    def check() -> Optional[str]:
+        existing = os.path.abspath(path)
+        while not os.path.exists(existing):
+            parent = os.path.dirname(existing)
+            if parent == existing:
+                break
+            existing = parent
+        if not os.path.isdir(existing):
+            return f"{path} cannot be created, {existing} is not a directory"
+        if not os.access(existing, os.W_OK | os.X_OK):
+            return f"{existing} is not writable"
+        return None
+
+    return check
+
+
+def check_conan_settings(
+    config_settings: Dict[str, Union[str, List[str], None]],
+    conan_cache: str,
+) -> Check:
+    """Create a check of the Conan settings given by the config settings.
+
+    The values are checked against the settings.yml of the Conan cache. The
+    check is skipped when the cache has none yet.
+    """
+    def check() -> Optional[str]:
+        capabilities = get_toolchain_capabilities()
+        if capabilities.conan_version == ():
+            return "conan is not installed"
+        settings_yml = os.path.join(conan_cache, "settings.yml")
+        if not os.path.exists(settings_yml):
+            return None
+        # Only imported when there is a Conan cache to check since the
+        # metadata hooks run the preflight checks too.
+        import yaml  # noqa: PLC0415
+
+        try:
+            with open(settings_yml, "r", encoding="utf-8") as f:
+                settings = yaml.safe_load(f) or {}
+        except (OSError, yaml.YAMLError) as error:
+            return f"unable to read {settings_yml}: {error}"
+        problems = []
+        arch = config_settings.get("arch")
+        if arch and arch not in (settings.get("arch") or []):
+            problems.append(f"arch={arch} is not a valid Conan architecture")
+        compiler = (settings.get("compiler") or {}).get(
+            capabilities.compiler_family
+        ) or {}
+        values_to_check = {
+            "libcxx": config_settings.get("conan_compiler_libcxx"),
+            "version": config_settings.get("conan_compiler_version"),
+            "cppstd": config_settings.get("cxx_std"),
+        }
+        for setting, value in values_to_check.items():
+            allowed = compiler.get(setting)
+            if value and isinstance(allowed, list) and (
+                str(value) not in [str(a) for a in allowed]
+            ):
+                problems.append(
+                    f"compiler.{setting}={value} is not valid for "
+                    f"{capabilities.compiler_family}"
+                )
+        return "; ".join(problems) or None
+
+    return check
+
+
+def _conan_cache(
+    config_settings: Dict[str, Union[str, List[str], None]]
+) -> str:
+    conan_cache = config_settings.get("conan_cache")
+    if conan_cache:
+        return cast(str, conan_cache)
+    folder = ".conan" if get_toolchain_capabilities().uses_conan_v1 else (
+        ".conan2"
+    )
+    return os.path.join(
+        os.environ.get("CONAN_USER_HOME", os.path.join("build", "conan")),
+        folder,
+    )
+
+
+def get_preflight_checks(
+    config_settings: Optional[Dict[str, Union[str, List[str], None]]],
+    build_info: Optional[Dict[str, Any]],
+    wheel_directory: str,
+    uses_conan: bool,
+) -> Dict[str, Check]:
+    """Get the checks that apply to the build, by name."""
+    config_settings = config_settings or {}
+    checks: Dict[str, Check] = {
+        "build directory": check_writable("build"),
+        "wheel directory": check_writable(wheel_directory),
+    }
+    has_extensions = bool((build_info or {}).get("extensions"))
+    if has_extensions:
+        checks["compiler"] = check_compiler
+        checks["linker"] = check_linker
+    if uses_conan:
+        conan_cache = _conan_cache(config_settings)
+        checks["conan cache"] = check_writable(conan_cache)
+        checks["conan settings"] = check_conan_settings(
+            config_settings, conan_cache
+        )
+        if has_extensions:
+            for tool in FIXUP_TOOLS.get(platform.system(), []):
+                checks[tool] = check_tool(tool)
+    return checks
+
+
+def run_checks(checks: Dict[str, Check]) -> Dict[str, str]:
+    """Run the checks in parallel and get the problems found, by name."""
+    if not checks:
+        return {}
+    problems = {}
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=len(checks)
+    ) as executor:
+        futures = {
+            name: executor.submit(check) for name, check in checks.items()
+        }
+        for name, future in futures.items():
+            try:
+                problem = future.result()
+            except Exception as error:  # pylint: disable=broad-except
+                problem = f"check failed: {error}"
+            if problem is not None:
+                problems[name] = problem
+    return problems
+
+
+def run_preflight_checks(
+    config_settings: Optional[Dict[str, Union[str, List[str], None]]],
+    build_info: Optional[Dict[str, Any]],
+    wheel_directory: str,
+    uses_conan: bool,
+) -> None:
+    """Check that the build can succeed before doing any expensive work.
+
+    Raises:
+        PreflightError: listing every problem found.
+
+    """
+    start = time.monotonic()
+    problems = run_checks(
+        get_preflight_checks(
+            config_settings, build_info, wheel_directory, uses_conan
+        )
+    )
+    if problems:
+        raise PreflightError(problems)
+    print(f"Preflight checks passed in {time.monotonic() - start:.2f}s")
@@ -2,21 +2,48 @@
 
 from __future__ import annotations
 import abc
+import concurrent.futures
+import contextlib
+import functools
+import threading
 import warnings
-from importlib.metadata import version
 import os
+import subprocess  # nosec B404
 import sys
-from typing import Optional, cast, List, TYPE_CHECKING
-
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    Optional,
+    cast,
+    List,
+    Set,
+    TYPE_CHECKING,
+    Union,
+)
+
+from setuptools._distutils.ccompiler import gen_preprocess_options
 from setuptools.command.build_py import build_py as BuildPy
-from setuptools.extension import Extension
+from setuptools.extension import Extension, Library
 from setuptools.command.build_clib import build_clib as BuildClib
+from setuptools.errors import ExecError
 
 import pybind11
 from pybind11.setup_helpers import Pybind11Extension, build_ext
 
+from uiucprescon.build.capabilities import get_toolchain_capabilities
 from uiucprescon.build.utils import locate_file
-from uiucprescon.build import deps, conan_libs
+from uiucprescon.build import (
+    conan_libs,
+    dependency_index,
+    deps,
+    precompiled_header,
+    unity_build,
+)
+from uiucprescon.build.file_inputs import scan_includes
+from uiucprescon.build.dependency_index import DependencyIndex
+from uiucprescon.build.session import get_active_session
 from uiucprescon.build.conan.files import parse_conan_build_info
 
 if TYPE_CHECKING:
@@ -25,6 +52,26 @@ if TYPE_CHECKING:
 
 __all__ = ["BuildPybind11Extension"]
 
+DEFAULT_FIXUP_WORKERS = 4
+
+# Attributes of an Extension that change how it is compiled or linked
+EXTENSION_FLAGS = [
+    "sources",
+    "depends",
+    "define_macros",
+    "undef_macros",
+    "include_dirs",
+    "library_dirs",
+    "libraries",
+    "runtime_library_dirs",
+    "extra_objects",
+    "extra_compile_args",
+    "extra_link_args",
+    "export_symbols",
+    "language",
+    "py_limited_api",
+]
+
 
 class AbsFindLibrary(abc.ABC):
     @abc.abstractmethod
@@ -40,25 +87,117 @@ def find_linking_libraries_with_conanbuildinfo_txt(conanbuildinfo):
     )
 
 
+def _parallel_workers(
+    value: Union[str, int, List[str], None],
+) -> Optional[int]:
+    if isinstance(value, str):
+        value = value.strip().lower()
+        if value in ("", "false"):
+            return None
+        if value in ("true", "auto"):
+            return os.cpu_count() or 1
+    if value is True:
+        return os.cpu_count() or 1
+    if value is None or value is False:
+        return None
+    return int(str(value))
+
+
 class BuildPybind11Extension(build_ext):
     """Custom build_ext Setuptools command for building pybind11 extensions."""
 
     user_options = build_ext.user_options + [
-        ("cxx-standard=", None, "C++ version to use. Default:11")
+        ("cxx-standard=", None, "C++ version to use. Default:11"),
+        (
+            "fixup-workers=",
+            None,
+            "number of extensions fixed up while the next ones are "
+            f"compiled, 0 to fix each one up before compiling the next. "
+            f"Default: {DEFAULT_FIXUP_WORKERS}",
+        ),
     ]
 
+    parallel: Optional[int]
+    fixup_workers: Optional[int]
+    dependency_index: Optional[bool]
+    unity_build: Optional[bool]
+    unity_files: Optional[int]
+    unity_exclude: Optional[List[str]]
+    precompiled_header: Optional[str]
+
     def finalize_options(self) -> None:
         """Finalize options for the build."""
+        session = get_active_session()
+        config_settings = (
+            (session.config_settings or {}) if session is not None else {}
+        )
+        parallel: Union[str, int, List[str], None] = (
+            self.parallel
+            if self.parallel is not None
+            else config_settings.get("parallel")
+        )
+        self.parallel = _parallel_workers(parallel)
         super().finalize_options()
 
         # self.inplace keeps getting reset by the time it is needed so
         # capture it here
         self._inplace = self.inplace
+        fixup_workers: Union[str, int, List[str], None] = (
+            self.fixup_workers
+            if self.fixup_workers is not None
+            else config_settings.get("fixup_workers")
+        )
+        self.fixup_workers = (
+            int(str(fixup_workers))
+            if fixup_workers is not None
+            else DEFAULT_FIXUP_WORKERS
+        )
+        if self.dependency_index is None:
+            self.dependency_index = str(
+                config_settings.get("dependency_index", "true")
+            ).lower() not in ["false", "0", "no", "off"]
+        if self.unity_build is None:
+            self.unity_build = str(
+                config_settings.get("unity_build", "false")
+            ).lower() in ["true", "1", "yes", "on"]
+        unity_files: Union[str, int, List[str], None] = (
+            self.unity_files or config_settings.get("unity_files")
+        )
+        # As many generated files as sources compiled at the same time
+        self.unity_files = (
+            int(str(unity_files)) if unity_files else self.parallel or 1
+        )
+        if self.precompiled_header is None:
+            self.precompiled_header = (
+                precompiled_header.precompiled_header_setting(config_settings)
+            )
+        if self.unity_exclude is None:
+            exclude = config_settings.get("unity_exclude") or []
+            if isinstance(exclude, str):
+                exclude = exclude.replace(",", " ").split()
+            self.unity_exclude = list(exclude)
 
-    def initialize_options(self):
+    def initialize_options(self) -> None:
         """Init extra options."""
         super().initialize_options()
-        self.linking_library_search_paths = []
+        self.linking_library_search_paths: List[str] = []
+        self.fixup_workers = None
+        self.dependency_index = None
+        self.unity_build = None
+        self.unity_files = None
+        self.unity_exclude = None
+        self.precompiled_header = None
+        self._precompiled_header_lock = threading.Lock()
+        self._fixup_executor: Optional[
+            concurrent.futures.ThreadPoolExecutor
+        ] = None
+        self._fixups: List[concurrent.futures.Future[None]] = []
+        self._fixup_dir_locks: Dict[str, threading.Lock] = {}
+        self._fixup_dir_locks_lock = threading.Lock()
+        self._compile_pool: Optional[concurrent.futures.Executor] = None
+        self._index: Optional[DependencyIndex] = None
+        # Objects compiled by precompile_sources, see _compile_changed
+        self._precompiled: Set[str] = set()
 
     def find_deps(
         self, lib: str, search_paths: Optional[List[str]] = None
@@ -99,7 +238,7 @@ class BuildPybind11Extension(build_ext):
         conan_info_dir = os.environ.get("CONAN_BUILD_INFO_DIR")
         if conan_info_dir:
             conanfileinfo_locations.insert(0, conan_info_dir)
-        if version("conan") < "2.0":
+        if get_toolchain_capabilities().uses_conan_v1:
             conanbuildinfo = locate_file(
                 "conanbuildinfo.txt", conanfileinfo_locations
             )
@@ -126,7 +265,11 @@ class BuildPybind11Extension(build_ext):
 
     def _get_linking_library_paths(self):
         build_conan = self.get_finalized_command("build_conan")
-        if version("conan") < "2.0":
+        session = get_active_session()
+        if session is not None:
+            # The build info is only complete once Conan has installed
+            session.wait_for_conan_install()
+        if get_toolchain_capabilities().uses_conan_v1:
             return find_linking_libraries_with_conanbuildinfo_txt(
                 os.path.join(build_conan.build_temp, "conanbuildinfo.txt")
             )
@@ -152,17 +295,485 @@ class BuildPybind11Extension(build_ext):
             + self.linking_library_search_paths
         )
 
+    def build_extensions(self) -> None:
+        """Build the extensions.
+
+        Unless forced, only the sources whose content, headers or flags
+        changed since the last build are compiled, see dependency_index.
+
+        With parallel set, the sources of every extension are compiled in a
+        single pool of that many threads and each extension is linked as
+        soon as its own objects are compiled, instead of waiting for the
+        extensions before it. Up to parallel extensions are built at the
+        same time, after the setuptools Library extensions, which are built
+        one at a time.
+
+        Fixing up an extension and checking its dependencies mostly waits
+        on other programs, so it is done in a pool of fixup_workers threads
+        while the next extensions are compiled.
+        """
+        with contextlib.ExitStack() as stack:
+            if self.dependency_index and not self.force:
+                stack.enter_context(self._track_dependencies())
+            if self.parallel and self.parallel > 1:
+                stack.enter_context(self._parallel_compile(self.parallel))
+            if self.fixup_workers:
+                stack.enter_context(self._fixup_in_background())
+            super().build_extensions()
+
+    @contextlib.contextmanager
+    def _track_dependencies(self) -> Iterator[None]:
+        compiler = self.compiler
+        index = DependencyIndex(
+            os.path.join(self.build_temp, dependency_index.DEPENDENCY_INDEX)
+        )
+        replaced = {
+            name: (name in vars(compiler), getattr(compiler, name))
+            for name in ["compile", "link"]
+        }
+        compiler.compile = functools.partial(
+            self._compile_changed, index, compiler, compiler.compile
+        )
+        compiler.link = functools.partial(
+            self._link_changed, index, compiler, compiler.link
+        )
+        self._index = index
+        try:
+            yield
+        finally:
+            self._index = None
+            for name, (had_method, method) in replaced.items():
+                if had_method:
+                    setattr(compiler, name, method)
+                else:
+                    delattr(compiler, name)
+            index.save()
+
+    @staticmethod
+    def _compiler_flags(compiler: CCompiler) -> Dict[str, Any]:
+        return {
+            name: getattr(compiler, name, None)
+            for name in [
+                *getattr(compiler, "executables", {}),
+                "compile_options",
+                "compile_options_debug",
+                "ldflags_shared",
+                "ldflags_shared_debug",
+            ]
+        }
+
+    def _compile_changed(
+        self,
+        index: DependencyIndex,
+        compiler: CCompiler,
+        compile_sources: Callable[..., List[str]],
+        sources: List[str],
+        output_dir: Optional[str] = None,
+        macros: Optional[List[Any]] = None,
+        include_dirs: Optional[List[str]] = None,
+        debug: bool = False,
+        extra_preargs: Optional[List[str]] = None,
+        extra_postargs: Optional[List[str]] = None,
+        depends: Optional[List[str]] = None,
+    ) -> List[str]:
+        options: Dict[str, Any] = {
+            "output_dir": output_dir,
+            "macros": macros,
+            "include_dirs": include_dirs,
+            "debug": debug,
+            "extra_preargs": extra_preargs,
+            "extra_postargs": extra_postargs,
+            "depends": depends,
+        }
+        if getattr(compiler, "_uiucprescon_recorder", None) is not None:
+            # Editable builds decide what to compile themselves
+            return compile_sources(sources, **options)
+        all_include_dirs = list(compiler.include_dirs) + list(
+            include_dirs or []
+        )
+        flags = dependency_index.signature(
+            compiler=self._compiler_flags(compiler),
+            macros=list(compiler.macros) + list(macros or []),
+            include_dirs=all_include_dirs,
+            debug=debug,
+            extra_preargs=extra_preargs,
+            extra_postargs=extra_postargs,
+        )
+        objects = []
+        for source in sources:
+            obj = compiler.object_filenames(
+                [source], strip_dir=False, output_dir=output_dir
+            )[0]
+            objects.append(obj)
+            if (
+                os.path.abspath(obj) in self._precompiled
+                and os.path.exists(obj)
+            ) or index.is_up_to_date(obj, flags):
+                print(f"skipping {source} (up-to-date)")
+                continue
+            index.forget(obj)
+            dependency_file = None
+            postargs = list(extra_postargs or [])
+            if getattr(compiler, "compiler_type", None) in (
+                dependency_index.DEPENDENCY_FILE_COMPILERS
+            ):
+                dependency_file = f"{os.path.splitext(obj)[0]}.d"
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(dependency_file)
+                postargs += ["-MMD", "-MF", dependency_file]
+            compile_sources(
+                [source], **{**options, "extra_postargs": postargs}
+            )
+            if dependency_file is not None and os.path.exists(
+                dependency_file
+            ):
+                inputs = dependency_index.parse_dependency_file(
+                    dependency_file
+                )
+            else:
+                # MSVC does not write dependency files, and the object
+                # cache does not restore them.
+                inputs = scan_includes(
+                    source, all_include_dirs, os.getcwd()
+                )
+            index.record(obj, flags, [source, *inputs, *(depends or [])])
+        return objects
+
+    def _link_changed(
+        self,
+        index: DependencyIndex,
+        compiler: CCompiler,
+        link: Callable[..., None],
+        target_desc: str,
+        objects: List[str],
+        output_filename: str,
+        output_dir: Optional[str] = None,
+        *args: Any,
+        **kwargs: Any,
+    ) -> None:
+        if getattr(compiler, "_uiucprescon_recorder", None) is not None:
+            link(
+                target_desc, objects, output_filename, output_dir,
+                *args, **kwargs
+            )
+            return
+        output = (
+            os.path.join(output_dir, output_filename)
+            if output_dir is not None else output_filename
+        )
+        flags = dependency_index.signature(
+            compiler=self._compiler_flags(compiler),
+            target_desc=target_desc,
+            objects=objects,
+            args=args,
+            kwargs=kwargs,
+        )
+        if index.is_up_to_date(output, flags):
+            print(f"skipping linking {output} (up-to-date)")
+            return
+        index.forget(output)
+        # The compiler only links when an object is newer than the output
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(output)
+        link(
+            target_desc, objects, output_filename, output_dir,
+            *args, **kwargs
+        )
+        index.record(output, flags, objects)
+
+    @contextlib.contextmanager
+    def _parallel_compile(self, workers: int) -> Iterator[None]:
+        compiler = self.compiler
+        if not getattr(compiler, "initialized", True):
+            # MSVC sets up its environment on the first compile otherwise,
+            # which has to happen once rather than in every thread.
+            compiler.initialize(self.plat_name)
+        had_compile = "compile" in vars(compiler)
+        compile_sources = compiler.compile
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="compile"
+        ) as executor:
+            compiler.compile = functools.partial(
+                self._compile_in_pool, executor, compile_sources
+            )
+            self._compile_pool = executor
+            try:
+                yield
+            finally:
+                self._compile_pool = None
+                if had_compile:
+                    compiler.compile = compile_sources
+                else:
+                    del compiler.compile
+
+    def _build_extensions_parallel(self) -> None:
+        if self._compile_pool is None:
+            super()._build_extensions_parallel()
+            return
+        # setuptools builds a Library with another compiler, which it puts
+        # in self.compiler while it does, so no other extension may be
+        # built at the same time. The other extensions may link them.
+        extensions = []
+        for ext in self.extensions:
+            if isinstance(ext, Library):
+                with self._filter_build_errors(ext):
+                    self.build_extension(ext)
+            else:
+                extensions.append(ext)
+        # Every other extension is built in a thread that mostly waits for
+        # the compile pool to compile its sources, then links it.
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.parallel or 1,
+            thread_name_prefix="extension",
+        ) as executor:
+            futures = [
+                executor.submit(self.build_extension, ext)
+                for ext in extensions
+            ]
+            for ext, future in zip(extensions, futures):
+                with self._filter_build_errors(ext):
+                    future.result()
+
+    @staticmethod
+    def _compile_in_pool(
+        executor: concurrent.futures.Executor,
+        compile_sources: Callable[..., List[str]],
+        sources: List[str],
+        *args: Any,
+        **kwargs: Any,
+    ) -> List[str]:
+        if len(sources) < 2:
+            return compile_sources(sources, *args, **kwargs)
+        # Compiled one by one with the flags of the extension they are from
+        compiling = [
+            executor.submit(compile_sources, [source], *args, **kwargs)
+            for source in sources
+        ]
+        objects: List[str] = []
+        try:
+            for compiled in compiling:
+                objects += compiled.result()
+        except BaseException:
+            for compiled in compiling:
+                compiled.cancel()
+            raise
+        return objects
+
+    @contextlib.contextmanager
+    def _fixup_in_background(self) -> Iterator[None]:
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.fixup_workers, thread_name_prefix="fixup"
+        ) as executor:
+            self._fixup_executor = executor
+            try:
+                yield
+                for fixup in concurrent.futures.as_completed(self._fixups):
+                    fixup.result()
+            finally:
+                self._fixup_executor = None
+                self._fixups = []
+
     def build_extension(self, ext: Pybind11Extension) -> None:
-        """Build the extension."""
-        super().build_extension(ext)
+        """Build the extension.
+
+        With unity_build set, its sources are merged into unity_files
+        generated sources that are compiled instead, see unity_build.
+
+        With precompiled_header set, a prefix header is precompiled and
+        included first into every source, see precompiled_header.
+        """
         fullname = self.get_ext_fullname(ext.name)
+        index = self._index
+        if index is None or self.force:
+            self._build_extension(ext, fullname)
+        else:
+            flags = self._extension_flags(ext)
+            ext_path = self.get_ext_fullpath(ext.name)
+            if index.is_extension_up_to_date(ext_path, flags):
+                print(f"skipping '{fullname}' extension (up-to-date)")
+            else:
+                # build_ext only compares the times of the sources with the
+                # extension, so it would skip it when only a header or a
+                # flag changed.
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(ext_path)
+                self._build_extension(ext, fullname)
+                index.record_extension(ext_path, flags)
         created_extension = os.path.join(
             self.build_lib, self.get_ext_filename(fullname)
         )
+        search_paths = self._get_linking_library_paths()
+        if self._fixup_executor is None:
+            self._fixup_extension(created_extension, search_paths)
+            return
+        # Stop compiling as soon as an earlier fixup failed
+        for fixup in list(self._fixups):
+            if fixup.done() and fixup.exception() is not None:
+                fixup.result()
+        self._fixups.append(
+            self._fixup_executor.submit(
+                self._fixup_extension, created_extension, search_paths
+            )
+        )
 
-        deps.fixup_library(
-            created_extension, self._get_linking_library_paths()
+    def precompile_sources(
+        self, ext: Pybind11Extension, sources: List[str], compiler: CCompiler
+    ) -> List[str]:
+        """Compile some sources of ext before the extensions are built.
+
+        They are compiled with compiler, set up like the one of this command,
+        with the flags build_extension compiles them with, and recorded in
+        the dependency index. build_extension does not compile them again,
+        even once Conan has added the include directories and definitions
+        of its libraries to ext, so only pass sources that need none of
+        them.
+
+        Returns the object files. Nothing is compiled when the flags are
+        only known once the extension is built, with unity_build or
+        precompiled_header set, or without the dependency index.
+        """
+        if (
+            not self.dependency_index
+            or self.force
+            or self.unity_build
+            or self.precompiled_header
+        ):
+            return []
+        index = DependencyIndex(
+            os.path.join(self.build_temp, dependency_index.DEPENDENCY_INDEX)
         )
+        # The same arguments build_ext.build_extension compiles with
+        macros: List[Any] = ext.define_macros[:]
+        for undef in ext.undef_macros:
+            macros.append((undef,))
+        objects = self._compile_changed(
+            index,
+            compiler,
+            compiler.compile,
+            sorted(sources),
+            output_dir=self.build_temp,
+            macros=macros,
+            include_dirs=ext.include_dirs,
+            debug=self.debug,
+            extra_postargs=ext.extra_compile_args or [],
+            depends=ext.depends,
+        )
+        index.save()
+        self._precompiled.update(os.path.abspath(obj) for obj in objects)
+        return objects
+
+    def _build_extension(self, ext: Pybind11Extension, fullname: str) -> None:
+        extra_compile_args = ext.extra_compile_args
+        if self.precompiled_header:
+            ext.extra_compile_args = self._precompiled_header_args(
+                ext
+            ) + list(extra_compile_args)
+        try:
+            if self.unity_build:
+                self._build_unity(ext, fullname)
+            else:
+                super().build_extension(ext)
+        finally:
+            ext.extra_compile_args = extra_compile_args
+
+    def _extension_flags(self, ext: Pybind11Extension) -> str:
+        return dependency_index.signature(
+            compiler=self._compiler_flags(self.compiler),
+            macros=list(self.compiler.macros),
+            include_dirs=list(self.compiler.include_dirs),
+            debug=self.debug,
+            extension={
+                name: getattr(ext, name, None)
+                for name in EXTENSION_FLAGS
+            },
+            precompiled_header=self.precompiled_header,
+            unity_build=self.unity_build,
+            unity_files=self.unity_files,
+            unity_exclude=self.unity_exclude,
+        )
+
+    def _precompiled_header_args(self, ext: Pybind11Extension) -> List[str]:
+        compiler = self.compiler
+        if compiler.compiler_type not in (
+            dependency_index.DEPENDENCY_FILE_COMPILERS
+        ):
+            return []
+        sources = list(ext.sources)
+        # The precompiled header is C++, so C sources could not include it
+        if not sources or any(
+            compiler.detect_language([source]) != "c++" for source in sources
+        ):
+            return []
+        if self.precompiled_header == "auto":
+            headers = precompiled_header.common_includes(sources)
+            if not headers:
+                return []
+            content = precompiled_header.prefix_header(headers)
+        else:
+            content = precompiled_header.prefix_header(
+                prefix=self.precompiled_header
+            )
+        macros: List[Any] = list(ext.define_macros)
+        for undef in ext.undef_macros:
+            macros.append((undef,))
+        command = (
+            list(
+                getattr(compiler, "compiler_so_cxx", None)
+                or compiler.compiler_so
+            )
+            + gen_preprocess_options(
+                list(compiler.macros) + macros,
+                list(ext.include_dirs) + list(compiler.include_dirs),
+            )
+            + (["-g"] if self.debug else [])
+            + list(ext.extra_compile_args)
+        )
+        # Compiler.call replaces the deprecated spawn in newer setuptools
+        run = compiler.call if hasattr(compiler, "call") else compiler.spawn
+        try:
+            with self._precompiled_header_lock:
+                header = precompiled_header.build_precompiled_header(
+                    content, command, self.build_temp, run
+                )
+        except (OSError, subprocess.CalledProcessError, ExecError) as error:
+            self.warn(
+                f"Unable to precompile the headers of {ext.name}, compiling "
+                f"without them: {error}"
+            )
+            return []
+        return ["-include", header]
+
+    def _build_unity(self, ext: Pybind11Extension, fullname: str) -> None:
+        sources = ext.sources
+        depends = ext.depends
+        ext.sources = unity_build.unity_sources(
+            sources,
+            os.path.join(
+                self.build_temp, unity_build.UNITY_DIR, *fullname.split(".")
+            ),
+            self.unity_files or 1,
+            self.unity_exclude or [],
+        )
+        # The generated files only change when sources are added or
+        # removed, so the extension is out of date when any source changed.
+        ext.depends = list(depends) + list(sources)
+        try:
+            super().build_extension(ext)
+        finally:
+            ext.sources = sources
+            ext.depends = depends
+
+    def _fixup_extension(
+        self, created_extension: str, search_paths: List[str]
+    ) -> None:
+        output_dir = os.path.abspath(os.path.dirname(created_extension))
+        with self._fixup_dir_locks_lock:
+            lock = self._fixup_dir_locks.setdefault(
+                output_dir, threading.Lock()
+            )
+        # Extensions in the same directory share the libraries copied there
+        with lock:
+            deps.fixup_library(created_extension, search_paths)
         if sys.platform == "darwin":
             self.spawn(["otool", "-L", created_extension])
         if sys.platform == "linux":
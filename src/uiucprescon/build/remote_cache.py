@@ -0,0 +1,580 @@
+"""Build artifacts shared between machines through a remote cache.
+
+Blobs are stored by namespace and key. The HTTP protocol is::
+
+    GET  /blobs/<namespace>/<key>   200 with the blob, or 404
+    HEAD /blobs/<namespace>/<key>   200 or 404
+    PUT  /blobs/<namespace>/<key>   201 once stored
+
+The file name of the blob travels in the X-Blob-Name header and its sha256 in
+the X-Blob-SHA256 header, so both sides can check what they received.
+
+A remote cache is only ever an optimization. Every error talking to it is
+reported as a warning and treated as a miss, so the build carries on locally.
+
+The module also contains a small reference server that stores the blobs on the
+local disk::
+
+    python -m uiucprescon.build.remote_cache --root /srv/cache --port 8000
+"""
+
+from __future__ import annotations
+
+import abc
+import argparse
+import contextlib
+import hashlib
+import http.client
+import http.server
+import os
+import queue
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import urllib.parse
+from typing import (
+    BinaryIO,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from uiucprescon.build.cache import ContentStore, parse_size
+
+__all__ = [
+    "RemoteCache",
+    "HTTPRemoteCache",
+    "RemoteCacheServer",
+    "get_remote_cache",
+    "register_remote_cache_backend",
+]
+
+REMOTE_CACHE_ENV_VAR = "UIUCPRESCON_BUILD_REMOTE_CACHE"
+REMOTE_CACHE_TOKEN_ENV_VAR = "UIUCPRESCON_BUILD_REMOTE_CACHE_TOKEN"
+
+NAMESPACE_WHEELS = "wheels"
+
+BLOB_PATH_REGEX = re.compile(
+    r"^/blobs/(?P<namespace>[a-z0-9_-]{1,64})/(?P<key>[a-f0-9]{16,128})$"
+)
+BLOB_NAME_REGEX = re.compile(r"^[A-Za-z0-9._+-]{1,255}$")
+
+DEFAULT_TIMEOUT = 10.0
+DEFAULT_MAX_CONNECTIONS = 4
+CHUNK_SIZE = 1024 * 1024
+
+# Stop using a remote cache after this many errors in a row, so an
+# unreachable cache does not add a timeout to every lookup.
+MAX_CONSECUTIVE_ERRORS = 3
+
+
+def _sha256(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class RemoteCache(abc.ABC):
+    """Blobs shared with other machines."""
+
+    def __init__(self, upload: bool = True) -> None:
+        """Create the client. When upload is False, put() does nothing."""
+        self.upload = upload
+        self._errors = 0
+        self._errors_lock = threading.Lock()
+
+    @property
+    def available(self) -> bool:
+        """Check if the cache is still worth talking to."""
+        return self._errors < MAX_CONSECUTIVE_ERRORS
+
+    def _record(self, error: Optional[BaseException], action: str) -> None:
+        with self._errors_lock:
+            if error is None:
+                self._errors = 0
+                return
+            self._errors += 1
+            disabled = self._errors == MAX_CONSECUTIVE_ERRORS
+        print(
+            f"Warning: remote cache {action} failed: {error}",
+            file=sys.stderr,
+        )
+        if disabled:
+            print(
+                "Warning: too many remote cache errors, not using the remote "
+                "cache for the rest of this build",
+                file=sys.stderr,
+            )
+
+    def get(
+        self, namespace: str, key: str, destination_dir: str
+    ) -> Optional[str]:
+        """Download a blob into destination_dir and return its path.
+
+        Returns None if the blob is not in the cache or the cache is not
+        reachable.
+        """
+        if not self.available:
+            return None
+        try:
+            result = self._get(namespace, key, destination_dir)
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            self._record(error, f"download of {namespace}/{key}")
+            return None
+        self._record(None, "download")
+        return result
+
+    def put(self, namespace: str, key: str, file_path: str) -> bool:
+        """Upload a blob. Returns True if it was stored."""
+        if not self.upload or not self.available:
+            return False
+        try:
+            self._put(namespace, key, file_path)
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            self._record(error, f"upload of {namespace}/{key}")
+            return False
+        self._record(None, "upload")
+        return True
+
+    @abc.abstractmethod
+    def _get(
+        self, namespace: str, key: str, destination_dir: str
+    ) -> Optional[str]:
+        """Download a blob, raising on errors."""
+
+    @abc.abstractmethod
+    def _put(self, namespace: str, key: str, file_path: str) -> None:
+        """Upload a blob, raising on errors."""
+
+    def close(self) -> None:
+        """Release the resources held by the client."""
+
+
+class _ConnectionPool:
+    """Keep-alive HTTP connections reused between requests."""
+
+    def __init__(
+        self,
+        url: urllib.parse.SplitResult,
+        timeout: float,
+        max_connections: int,
+    ) -> None:
+        self.url = url
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self._idle: queue.LifoQueue[http.client.HTTPConnection] = (
+            queue.LifoQueue()
+        )
+
+    def _new_connection(self) -> http.client.HTTPConnection:
+        connection_class = (
+            http.client.HTTPSConnection
+            if self.url.scheme == "https"
+            else http.client.HTTPConnection
+        )
+        return connection_class(
+            self.url.hostname or "localhost",
+            self.url.port,
+            timeout=self.timeout,
+        )
+
+    @contextlib.contextmanager
+    def connection(
+        self, fresh: bool = False
+    ) -> Iterator[http.client.HTTPConnection]:
+        connection = None
+        if not fresh:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                pass
+        if connection is None:
+            connection = self._new_connection()
+        try:
+            yield connection
+        except BaseException:
+            connection.close()
+            raise
+        if self._idle.qsize() < self.max_connections:
+            self._idle.put(connection)
+        else:
+            connection.close()
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class HTTPRemoteCache(RemoteCache):
+    """Remote cache talking the blob protocol over HTTP."""
+
+    def __init__(
+        self,
+        url: str,
+        upload: bool = True,
+        timeout: float = DEFAULT_TIMEOUT,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        token: Optional[str] = None,
+    ) -> None:
+        """Use the cache served at url."""
+        super().__init__(upload=upload)
+        self.url = urllib.parse.urlsplit(url)
+        self.token = token
+        self._pool = _ConnectionPool(self.url, timeout, max_connections)
+
+    def _path(self, namespace: str, key: str) -> str:
+        return (
+            f"{self.url.path.rstrip('/')}/blobs/"
+            f"{urllib.parse.quote(namespace)}/{urllib.parse.quote(key)}"
+        )
+
+    def _headers(self) -> Dict[str, str]:
+        headers = {"Connection": "keep-alive"}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        return headers
+
+    def _request(
+        self,
+        method: str,
+        path: str,
+        handle: Callable[[http.client.HTTPResponse], Optional[str]],
+        body: Optional[Callable[[], BinaryIO]] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Optional[str]:
+        # An idle keep-alive connection may have been closed by the server,
+        # which only shows when it is used. Retry once on a new connection.
+        for fresh in (False, True):
+            with self._pool.connection(fresh=fresh) as connection:
+                try:
+                    connection.request(
+                        method,
+                        path,
+                        body=body() if body is not None else None,
+                        headers={**self._headers(), **(headers or {})},
+                    )
+                    response = connection.getresponse()
+                except (
+                    http.client.RemoteDisconnected,
+                    BrokenPipeError,
+                    ConnectionResetError,
+                ):
+                    if fresh:
+                        raise
+                    connection.close()
+                    continue
+                try:
+                    return handle(response)
+                finally:
+                    # Leave the connection ready for the next request.
+                    response.read()
+        return None
+
+    def _get(
+        self, namespace: str, key: str, destination_dir: str
+    ) -> Optional[str]:
+        def handle(response: http.client.HTTPResponse) -> Optional[str]:
+            if response.status == 404:
+                return None
+            if response.status != 200:
+                raise http.client.HTTPException(
+                    f"{response.status} {response.reason}"
+                )
+            name = response.getheader("X-Blob-Name", "")
+            if not BLOB_NAME_REGEX.match(name):
+                raise http.client.HTTPException(f"Invalid blob name {name!r}")
+            expected_sha256 = response.getheader("X-Blob-SHA256")
+            os.makedirs(destination_dir, exist_ok=True)
+            destination = os.path.join(destination_dir, name)
+            digest = hashlib.sha256()
+            with tempfile.NamedTemporaryFile(
+                dir=destination_dir, prefix=".download-", delete=False
+            ) as f:
+                try:
+                    for chunk in iter(lambda: response.read(CHUNK_SIZE), b""):
+                        digest.update(chunk)
+                        f.write(chunk)
+                except BaseException:
+                    f.close()
+                    os.unlink(f.name)
+                    raise
+            if expected_sha256 and digest.hexdigest() != expected_sha256:
+                os.unlink(f.name)
+                raise http.client.HTTPException(
+                    f"Checksum mismatch for {namespace}/{key}"
+                )
+            os.replace(f.name, destination)
+            return destination
+
+        return self._request("GET", self._path(namespace, key), handle)
+
+    def _put(self, namespace: str, key: str, file_path: str) -> None:
+        name = os.path.basename(file_path)
+        headers = {
+            "Content-Length": str(os.path.getsize(file_path)),
+            "Content-Type": "application/octet-stream",
+            "X-Blob-Name": name,
+            "X-Blob-SHA256": _sha256(file_path),
+        }
+
+        def handle(response: http.client.HTTPResponse) -> Optional[str]:
+            if response.status not in (200, 201, 204):
+                raise http.client.HTTPException(
+                    f"{response.status} {response.reason}"
+                )
+            return None
+
+        with contextlib.ExitStack() as stack:
+            self._request(
+                "PUT",
+                self._path(namespace, key),
+                handle,
+                body=lambda: stack.enter_context(open(file_path, "rb")),
+                headers=headers,
+            )
+
+    def close(self) -> None:
+        """Close the pooled connections."""
+        self._pool.close()
+
+
+REMOTE_CACHE_BACKENDS: Dict[str, Callable[..., RemoteCache]] = {
+    "http": HTTPRemoteCache,
+    "https": HTTPRemoteCache,
+}
+
+
+def register_remote_cache_backend(
+    scheme: str, factory: Callable[..., RemoteCache]
+) -> None:
+    """Use factory to create remote caches for urls with the given scheme.
+
+    The factory is called with the url and the upload, timeout, and token
+    keyword arguments.
+    """
+    REMOTE_CACHE_BACKENDS[scheme] = factory
+
+
+def get_remote_cache(
+    config_settings: Optional[Dict[str, Union[str, List[str], None]]] = None,
+) -> Optional[RemoteCache]:
+    """Get the remote cache configured by config_settings, if any."""
+    config_settings = config_settings or {}
+    url = config_settings.get("remote_cache") or os.environ.get(
+        REMOTE_CACHE_ENV_VAR
+    )
+    if not url:
+        return None
+    url = str(url)
+    factory = REMOTE_CACHE_BACKENDS.get(urllib.parse.urlsplit(url).scheme)
+    if factory is None:
+        print(
+            f"Warning: no remote cache backend for {url}, not using it",
+            file=sys.stderr,
+        )
+        return None
+    upload = str(config_settings.get("remote_cache_upload", "true")).lower()
+    return factory(
+        url,
+        upload=upload not in ["false", "0", "no", "off"],
+        timeout=float(
+            str(config_settings.get("remote_cache_timeout", DEFAULT_TIMEOUT))
+        ),
+        token=os.environ.get(REMOTE_CACHE_TOKEN_ENV_VAR),
+    )
+
+
+class BlobRequestHandler(http.server.BaseHTTPRequestHandler):
+    """Serve blobs stored in the server's content stores."""
+
+    protocol_version = "HTTP/1.1"
+    server: RemoteCacheServer
+
+    def _parse_path(self) -> Optional[Tuple[str, str]]:
+        if self.server.token is not None and (
+            self.headers.get("Authorization")
+            != f"Bearer {self.server.token}"
+        ):
+            self._fail(401)
+            return None
+        match = BLOB_PATH_REGEX.match(self.path)
+        if match is None:
+            self._fail(404)
+            return None
+        return match.group("namespace"), match.group("key")
+
+    def _fail(self, status: int) -> None:
+        if self.command != "PUT":
+            self._respond(status)
+            return
+        # What is left of the body of the upload would be read as the next
+        # request, so the connection is not kept alive.
+        self.close_connection = True
+        self._respond(status, {"Content-Length": "0", "Connection": "close"})
+
+    def _respond(
+        self, status: int, headers: Optional[Dict[str, str]] = None
+    ) -> None:
+        self.send_response(status)
+        for name, value in (headers or {"Content-Length": "0"}).items():
+            self.send_header(name, value)
+        self.end_headers()
+
+    def _blob_headers(self, blob: str) -> Dict[str, str]:
+        return {
+            "Content-Length": str(os.path.getsize(blob)),
+            "Content-Type": "application/octet-stream",
+            "X-Blob-Name": os.path.basename(blob),
+            "X-Blob-SHA256": _sha256(blob),
+        }
+
+    def do_HEAD(self) -> None:  # noqa: N802
+        """Check if a blob is stored."""
+        parsed = self._parse_path()
+        if parsed is None:
+            return
+        blob = self.server.store(parsed[0]).get(parsed[1])
+        if blob is None:
+            self._respond(404)
+            return
+        self._respond(200, self._blob_headers(blob))
+
+    def do_GET(self) -> None:  # noqa: N802
+        """Send a blob."""
+        parsed = self._parse_path()
+        if parsed is None:
+            return
+        blob = self.server.store(parsed[0]).get(parsed[1])
+        if blob is None:
+            self._respond(404)
+            return
+        try:
+            with open(blob, "rb") as f:
+                self._respond(200, self._blob_headers(blob))
+                shutil.copyfileobj(f, self.wfile, CHUNK_SIZE)
+        except FileNotFoundError:
+            self._respond(404)
+
+    def do_PUT(self) -> None:  # noqa: N802
+        """Store a blob."""
+        parsed = self._parse_path()
+        if parsed is None:
+            return
+        name = self.headers.get("X-Blob-Name", "")
+        try:
+            remaining = int(self.headers.get("Content-Length", ""))
+        except ValueError:
+            remaining = -1
+        if not BLOB_NAME_REGEX.match(name) or remaining < 0:
+            self._fail(400)
+            return
+        digest = hashlib.sha256()
+        with tempfile.TemporaryDirectory(dir=self.server.root) as upload_dir:
+            upload = os.path.join(upload_dir, name)
+            with open(upload, "wb") as f:
+                while remaining > 0:
+                    chunk = self.rfile.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    f.write(chunk)
+                    remaining -= len(chunk)
+            expected_sha256 = self.headers.get("X-Blob-SHA256")
+            if remaining or (
+                expected_sha256 and digest.hexdigest() != expected_sha256
+            ):
+                self._fail(400)
+                return
+            self.server.store(parsed[0]).put(parsed[1], upload)
+        self._respond(201)
+
+    def log_message(self, format: str, *args) -> None:  # noqa: A002
+        """Only log when the server is verbose."""
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class RemoteCacheServer(http.server.ThreadingHTTPServer):
+    """Reference remote cache server, storing blobs on the local disk."""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: Tuple[str, int],
+        root: str,
+        max_size: int,
+        token: Optional[str] = None,
+        verbose: bool = False,
+    ) -> None:
+        """Serve the blobs stored in root on address."""
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.max_size = max_size
+        self.token = token
+        self.verbose = verbose
+        self._stores: Dict[str, ContentStore] = {}
+        self._stores_lock = threading.Lock()
+        super().__init__(address, BlobRequestHandler)
+
+    def store(self, namespace: str) -> ContentStore:
+        """Get the content store of a namespace."""
+        with self._stores_lock:
+            if namespace not in self._stores:
+                self._stores[namespace] = ContentStore(
+                    os.path.join(self.root, namespace), self.max_size
+                )
+            return self._stores[namespace]
+
+    @property
+    def url(self) -> str:
+        """Url clients use to reach the server."""
+        host, port = self.server_address[:2]
+        if isinstance(host, bytes):
+            host = host.decode("ascii")
+        return f"http://{host}:{port}"
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Run the reference remote cache server."""
+    parser = argparse.ArgumentParser(
+        prog="python -m uiucprescon.build.remote_cache",
+        description="Serve a remote build cache from the local disk.",
+    )
+    parser.add_argument("--root", required=True, help="where to store blobs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--max-size",
+        default="10G",
+        help="size limit of each namespace. Default: 10G",
+    )
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args(argv)
+    with RemoteCacheServer(
+        (args.host, args.port),
+        args.root,
+        parse_size(args.max_size),
+        token=os.environ.get(REMOTE_CACHE_TOKEN_ENV_VAR),
+        verbose=args.verbose,
+    ) as server:
+        print(f"Serving the build cache in {args.root} on {server.url}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
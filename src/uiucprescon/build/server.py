@@ -0,0 +1,302 @@
+"""Long-lived build server that keeps the build tooling warm.
+
+Building a wheel in a fresh process means starting Python, importing
+setuptools, pybind11, Conan and yaml and detecting the compiler again every
+time. The build server does this once and forks a child for every build
+request so that each build starts with them already loaded, while still
+running in its own working directory and environment.
+
+Start the server with::
+
+    python -m uiucprescon.build.server /tmp/uiucprescon-build.sock
+
+and set the UIUCPRESCON_BUILD_SERVER environment variable to the same path
+for the builds that should use it. When the variable is not set, the server
+is not running or it runs another Python interpreter than the frontend, the
+backend hooks build in their own process as usual.
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import importlib
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+import sysconfig
+import tempfile
+import traceback
+from typing import Any, Dict, List, Optional
+
+from uiucprescon.build.capabilities import get_toolchain_capabilities
+from uiucprescon.build.errors import BuildServerError, PlatformError
+
+__all__ = ["BuildServer", "serve", "forward_hook"]
+
+SERVER_SOCKET_ENV_VAR = "UIUCPRESCON_BUILD_SERVER"
+
+# Hooks expensive enough to be worth sending to the server. The other hooks
+# are cheap and always run in the frontend's process.
+FORWARDED_HOOKS = ["build_wheel", "build_editable"]
+
+PRELOAD_MODULES = [
+    "setuptools",
+    "setuptools.build_meta",
+    "setuptools.command.build_ext",
+    "yaml",
+    "pybind11",
+    "uiucprescon.build.local_backend",
+    "uiucprescon.build.conan_libs",
+    "uiucprescon.build.pybind11_builder",
+]
+
+CONNECT_TIMEOUT = 2.0
+
+
+def is_supported() -> bool:
+    """Check if the platform is able to run the build server."""
+    return hasattr(socket, "AF_UNIX") and hasattr(os, "fork")
+
+
+def preload() -> None:
+    """Import everything a build needs and detect the toolchain.
+
+    The Conan integration for the installed version of Conan is imported
+    too, and with Conan 2 the default profile is detected.
+    """
+    for module in PRELOAD_MODULES:
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            pass
+
+    capabilities = get_toolchain_capabilities()
+    # Only a warm up. A build that needs any of it reports the error.
+    with contextlib.suppress(Exception):
+        capabilities.compiler_version
+    if capabilities.conan_major_version is None:
+        return
+    with contextlib.suppress(Exception):
+        if capabilities.uses_conan_v1:
+            importlib.import_module("uiucprescon.build.conan.v1")
+            return
+        # Only importable with Conan 2
+        from uiucprescon.build.conan import v2  # noqa: PLC0415
+
+        with tempfile.TemporaryDirectory() as conan_home:
+            v2.detect_profile(v2.ConanAPI(conan_home))
+
+
+def interpreter() -> Dict[str, Any]:
+    """Describe the Python interpreter, which the wheel tags come from."""
+    return {
+        "executable": sys.executable,
+        "version": list(sys.version_info),
+        "soabi": sysconfig.get_config_var("SOABI"),
+    }
+
+
+def run_request(request: Dict[str, Any]) -> Dict[str, Any]:
+    """Run a build request in the current process.
+
+    This changes the working directory and the environment of the process, so
+    the server only calls it in a forked child.
+    """
+    hook = request.get("hook")
+    if hook not in FORWARDED_HOOKS:
+        return {"error": f"Unsupported hook: {hook}"}
+    if request.get("interpreter") != interpreter():
+        return {
+            "mismatch": (
+                f"The build server runs {sys.executable}, which is not the "
+                f"Python interpreter of the build"
+            )
+        }
+
+    os.chdir(request["cwd"])
+    os.environ.clear()
+    os.environ.update(request["env"])
+    os.environ.pop(SERVER_SOCKET_ENV_VAR, None)
+
+    # local_backend imports this module
+    from uiucprescon.build import local_backend  # noqa: PLC0415
+
+    with tempfile.TemporaryFile(mode="w+", encoding="utf-8") as output:
+        with _redirect_output(output):
+            try:
+                result = getattr(local_backend, hook)(*request["args"])
+                response: Dict[str, Any] = {"result": result}
+            except BaseException:  # pylint: disable=broad-exception-caught
+                response = {"error": traceback.format_exc()}
+        output.seek(0)
+        response["output"] = output.read()
+    return response
+
+
+@contextlib.contextmanager
+def _redirect_output(output):
+    # Redirect the file descriptors and not only sys.stdout so the output of
+    # compilers and other subprocesses is captured too.
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved = [os.dup(1), os.dup(2)]
+    os.dup2(output.fileno(), 1)
+    os.dup2(output.fileno(), 2)
+    try:
+        yield
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.dup2(saved[0], 1)
+        os.dup2(saved[1], 2)
+        for fd in saved:
+            os.close(fd)
+
+
+class BuildRequestHandler(socketserver.StreamRequestHandler):
+    """Handle one build request, one JSON document per line."""
+
+    def handle(self) -> None:
+        """Run the request and send back the response."""
+        line = self.rfile.readline()
+        if not line:
+            # Only checking if the server is running.
+            return
+        try:
+            response = run_request(json.loads(line))
+        except Exception:  # pylint: disable=broad-exception-caught
+            response = {"error": traceback.format_exc()}
+        self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+
+
+if is_supported():
+
+    class BuildServer(
+        socketserver.ForkingMixIn, socketserver.UnixStreamServer
+    ):
+        """Server running every build request in a forked child process."""
+
+        timeout = 0.5
+
+        def __init__(self, socket_path: str) -> None:
+            """Listen for build requests on socket_path."""
+            if os.path.exists(socket_path):
+                if _is_listening(socket_path):
+                    raise BuildServerError(
+                        f"A build server is already running on {socket_path}"
+                    )
+                os.unlink(socket_path)
+            super().__init__(socket_path, BuildRequestHandler)
+            self.socket_path = socket_path
+            # Anyone able to connect can run a build as this user.
+            os.chmod(socket_path, 0o600)
+
+        def server_close(self) -> None:
+            """Stop listening and remove the socket file."""
+            super().server_close()
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(self.socket_path)
+
+
+def serve(socket_path: str) -> None:
+    """Run the build server until it is interrupted."""
+    if not is_supported():
+        raise PlatformError("The build server requires Unix sockets and fork")
+    preload()
+    stopping = False
+
+    def stop(*_: Any) -> None:
+        # Raising KeyboardInterrupt is not safe here. It is lost if the signal
+        # arrives while forking.
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    with BuildServer(socket_path) as server:
+        print(f"Listening for build requests on {socket_path}", flush=True)
+        while not stopping:
+            server.handle_request()
+
+
+def _is_listening(socket_path: str) -> bool:
+    try:
+        with _connect(socket_path):
+            return True
+    except OSError:
+        return False
+
+
+def _connect(socket_path: str) -> socket.socket:
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    connection.settimeout(CONNECT_TIMEOUT)
+    try:
+        connection.connect(socket_path)
+    except OSError:
+        connection.close()
+        raise
+    # Building can take any amount of time.
+    connection.settimeout(None)
+    return connection
+
+
+def forward_hook(hook: str, *args: Any) -> Optional[Any]:
+    """Run a backend hook on the build server, if one is running.
+
+    Returns None if no build server is available, or if it runs another
+    Python interpreter, so the caller should build in its own process
+    instead.
+    """
+    socket_path = os.environ.get(SERVER_SOCKET_ENV_VAR)
+    if not socket_path or not is_supported():
+        return None
+    try:
+        connection = _connect(socket_path)
+    except OSError:
+        return None
+    request = {
+        "hook": hook,
+        "args": [os.fspath(a) if isinstance(a, os.PathLike) else a
+                 for a in args],
+        "cwd": os.getcwd(),
+        "env": dict(os.environ),
+        "interpreter": interpreter(),
+    }
+    with connection, connection.makefile("rwb") as stream:
+        stream.write(json.dumps(request).encode("utf-8") + b"\n")
+        stream.flush()
+        line = stream.readline()
+    if not line:
+        raise BuildServerError(
+            f"The build server on {socket_path} closed the connection"
+        )
+    response = json.loads(line)
+    if "mismatch" in response:
+        print(
+            f"{response['mismatch']}. Building in this process instead.",
+            file=sys.stderr,
+        )
+        return None
+    sys.stdout.write(response.get("output", ""))
+    if "error" in response:
+        raise BuildServerError(response["error"])
+    return response["result"]
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Run the build server from the command line."""
+    parser = argparse.ArgumentParser(
+        prog="python -m uiucprescon.build.server",
+        description="Keep the build tooling warm between wheel builds.",
+    )
+    parser.add_argument("socket", help="path of the Unix socket to listen on")
+    args = parser.parse_args(argv)
+    serve(args.socket)
+
+
+if __name__ == "__main__":
+    main()
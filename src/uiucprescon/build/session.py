@@ -0,0 +1,196 @@
+"""Shared state for a single call to a build backend hook.
+
+A build session lets the backend hook and the setuptools commands that run
+later in the same process share work, such as the setup.py introspection and
+the dependencies resolved with Conan, instead of each of them deriving it
+again.
+"""
+
+from __future__ import annotations
+
+import concurrent.futures
+import contextlib
+import dataclasses
+import json
+import os
+import threading
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Union,
+    TYPE_CHECKING,
+)
+
+from setuptools.dist import Distribution
+
+from uiucprescon.build.capabilities import (
+    ToolchainCapabilities,
+    get_toolchain_capabilities,
+)
+
+if TYPE_CHECKING:
+    from uiucprescon.build.conan.files import ConanBuildInfo
+
+__all__ = ["BuildSession", "build_session", "get_active_session"]
+
+
+@dataclasses.dataclass
+class ConanResolution:
+    """Dependencies resolved by Conan for a build directory."""
+
+    build_dir: str
+    build_info: ConanBuildInfo
+    graph: Optional[Dict[str, Any]] = None
+
+
+class BuildSession:
+    """State shared by everything that runs for one backend hook call."""
+
+    def __init__(
+        self,
+        config_settings: Optional[
+            Dict[str, Union[str, List[str], None]]
+        ] = None,
+    ) -> None:
+        """Create a new session for the given config settings."""
+        self.config_settings = config_settings
+        self.build_info: Optional[Dict[str, Any]] = None
+        self.build_plan: Optional[Dict[str, Any]] = None
+        # Conan dependencies resolved without installing them, which the
+        # wheel cache key is made from
+        self.conan_graph: Optional[Dict[str, Any]] = None
+        self._distribution: Optional[Distribution] = None
+        self._conan_resolutions: Dict[str, ConanResolution] = {}
+
+        # Build directory of the latest Conan resolution, or of the one being
+        # installed. Commands created later in the session without the
+        # config settings use it instead of resolving the dependencies again
+        # with a different configuration.
+        self.conan_build_dir: Optional[str] = None
+
+        # Conan install running in a worker thread, see start_conan_install
+        self.conan_install: Optional[concurrent.futures.Future[None]] = None
+        self._conan_install_thread: Optional[int] = None
+
+    @property
+    def distribution(self) -> Distribution:
+        """Distribution with the project's configuration files parsed."""
+        if self._distribution is None:
+            dist = Distribution()
+            dist.parse_config_files()
+            self._distribution = dist
+        return self._distribution
+
+    @property
+    def capabilities(self) -> ToolchainCapabilities:
+        """Capabilities of the toolchain of the build machine."""
+        return get_toolchain_capabilities()
+
+    def record_conan_resolution(
+        self,
+        build_dir: str,
+        build_info: ConanBuildInfo,
+        graph: Optional[Dict[str, Any]] = None,
+    ) -> ConanResolution:
+        """Keep the result of running Conan for later phases of the build."""
+        if graph is None:
+            graph = load_conan_graph(build_dir)
+        resolution = ConanResolution(
+            build_dir=os.path.abspath(build_dir),
+            build_info=build_info,
+            graph=graph,
+        )
+        self._conan_resolutions[resolution.build_dir] = resolution
+        self.conan_build_dir = resolution.build_dir
+        return resolution
+
+    def get_conan_resolution(
+        self, build_dir: str
+    ) -> Optional[ConanResolution]:
+        """Get the dependencies already resolved for a build directory."""
+        return self._conan_resolutions.get(os.path.abspath(build_dir))
+
+    def start_conan_install(
+        self, install: Callable[[], None], build_dir: str
+    ) -> None:
+        """Install the Conan dependencies into build_dir in a worker thread.
+
+        The build goes on while they are installed. Call
+        wait_for_conan_install before using them.
+        """
+        self.conan_build_dir = os.path.abspath(build_dir)
+        executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="conan-install"
+        )
+
+        def run() -> None:
+            self._conan_install_thread = threading.get_ident()
+            install()
+
+        self.conan_install = executor.submit(run)
+        executor.shutdown(wait=False)
+
+    def _in_conan_install(self) -> bool:
+        return self._conan_install_thread == threading.get_ident()
+
+    @property
+    def conan_install_pending(self) -> bool:
+        """Check if Conan is installing the dependencies in another thread."""
+        return (
+            self.conan_install is not None
+            and not self.conan_install.done()
+            and not self._in_conan_install()
+        )
+
+    def wait_for_conan_install(self) -> None:
+        """Wait for the Conan install started by start_conan_install.
+
+        Raises the error of the install if it failed.
+        """
+        if self.conan_install is not None and not self._in_conan_install():
+            self.conan_install.result()
+
+
+def load_conan_graph(build_dir: str) -> Optional[Dict[str, Any]]:
+    """Load the conan_build_info.json file in build_dir, if there is one."""
+    build_json = os.path.join(build_dir, "conan_build_info.json")
+    if not os.path.exists(build_json):
+        return None
+    with open(build_json, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+_active_session: Optional[BuildSession] = None
+
+
+def get_active_session() -> Optional[BuildSession]:
+    """Get the session of the backend hook currently running, if any."""
+    return _active_session
+
+
+@contextlib.contextmanager
+def build_session(
+    config_settings: Optional[Dict[str, Union[str, List[str], None]]] = None,
+) -> Iterator[BuildSession]:
+    """Run a block of code with a build session active.
+
+    If a session is already active, it is reused.
+    """
+    global _active_session  # noqa: PLW0603
+    if _active_session is not None:
+        yield _active_session
+        return
+    _active_session = BuildSession(config_settings)
+    try:
+        yield _active_session
+        # A failed install must fail the hook, even if nothing used it
+        _active_session.wait_for_conan_install()
+    finally:
+        if _active_session.conan_install is not None:
+            # Never leave Conan running once the hook has returned
+            concurrent.futures.wait([_active_session.conan_install])
+        _active_session = None
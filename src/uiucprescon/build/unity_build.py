@@ -0,0 +1,116 @@
+"""Unity builds, compiling several sources of an extension as one.
+
+Most of the time spent compiling a pybind11 extension goes into parsing
+pybind11 and the standard library again for every source. In a unity
+build, the sources of an extension are included into a few generated
+files that are compiled instead, so these headers are parsed once per
+generated file.
+
+Sources defining static functions or variables, or anything in an
+anonymous namespace, with the same name as another source cannot be
+compiled together. List them in unity_exclude to compile them on their
+own.
+"""
+
+from __future__ import annotations
+
+import fnmatch
+import os
+from typing import Dict, List, Sequence
+
+__all__ = ["unity_sources"]
+
+UNITY_DIR = "unity"
+UNITY_HEADER = "/* Generated by uiucprescon.build for a unity build. */\n"
+
+
+def is_excluded(source: str, exclude: Sequence[str]) -> bool:
+    """Check if source matches any of the patterns in exclude.
+
+    Patterns are matched against the path of the source, with forward
+    slashes, and against its file name.
+    """
+    path = source.replace(os.sep, "/")
+    name = os.path.basename(path)
+    return any(
+        fnmatch.fnmatchcase(path, pattern)
+        or fnmatch.fnmatchcase(name, pattern)
+        for pattern in exclude
+    )
+
+
+def split_evenly(sources: Sequence[str], count: int) -> List[List[str]]:
+    """Split sources into count runs of about the same length.
+
+    The sources stay in order, so that adding or removing one changes as
+    few of the generated files as possible.
+    """
+    count = max(1, min(count, len(sources)))
+    size, extra = divmod(len(sources), count)
+    chunks = []
+    start = 0
+    for i in range(count):
+        end = start + size + (1 if i < extra else 0)
+        chunks.append(list(sources[start:end]))
+        start = end
+    return chunks
+
+
+def _write_if_changed(path: str, content: str) -> None:
+    # Keeping the modification time of unchanged files keeps their objects
+    # up to date.
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            if f.read() == content:
+                return
+    except OSError:
+        pass
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(temp_path, path)
+
+
+def unity_sources(
+    sources: Sequence[str],
+    output_dir: str,
+    count: int,
+    exclude: Sequence[str] = (),
+    source_extensions: Sequence[str] = (".c", ".cc", ".cpp", ".cxx"),
+) -> List[str]:
+    """Get the sources to compile instead of sources in a unity build.
+
+    The sources of each language are included into at most count files
+    generated in output_dir. The excluded sources, and the sources of a
+    language with no other source to merge with, are kept as they are.
+    """
+    by_suffix: Dict[str, List[str]] = {}
+    kept: List[str] = []
+    for source in sources:
+        suffix = os.path.splitext(source)[1]
+        if suffix not in source_extensions or is_excluded(source, exclude):
+            kept.append(source)
+        else:
+            by_suffix.setdefault(suffix, []).append(source)
+    unity_files: List[str] = []
+    for suffix, merged in by_suffix.items():
+        if len(merged) < 2:
+            kept += merged
+            continue
+        for i, chunk in enumerate(split_evenly(merged, count)):
+            unity_file = os.path.join(
+                output_dir, f"unity_{suffix[1:]}_{i}{suffix}"
+            )
+            _write_if_changed(
+                unity_file,
+                UNITY_HEADER
+                + "".join(
+                    '#include "{}"\n'.format(
+                        os.path.abspath(source).replace(os.sep, "/")
+                    )
+                    for source in chunk
+                ),
+            )
+            unity_files.append(unity_file)
+    return unity_files + [s for s in sources if s in kept]
@@ -1,10 +1,24 @@
 """Utility functions."""
 
 import contextlib
-from typing import Optional, List, Dict
+import sys
+from typing import Any, Optional, List, Dict, Iterator
 import os
 
-__all__ = ["locate_file", "set_env_var"]
+if sys.version_info >= (3, 11):
+    import tomllib
+else:
+    tomllib = None
+
+__all__ = [
+    "locate_file",
+    "set_env_var",
+    "find_conanfile",
+    "load_toml",
+    "file_lock",
+]
+
+CONANFILE_TYPES = ["conanfile.py", "conanfile.txt"]
 
 
 def locate_file(file_name: str, search_locations: List[str]) -> Optional[str]:
@@ -16,6 +30,28 @@ def locate_file(file_name: str, search_locations: List[str]) -> Optional[str]:
     return None
 
 
+def find_conanfile(path: str) -> Optional[str]:
+    """Locate the conanfile.py or conanfile.txt file in path."""
+    for conanfile_type in CONANFILE_TYPES:
+        conanfile = os.path.join(path, conanfile_type)
+        if os.path.exists(conanfile):
+            return conanfile
+    return None
+
+
+def load_toml(file_name: str) -> Dict[str, Any]:
+    """Load a toml file, using tomllib when the Python version has it."""
+    if tomllib is not None:
+        with open(file_name, "rb") as f:
+            return tomllib.load(f)
+
+    # Only installed before Python 3.11
+    import toml  # noqa: PLC0415
+
+    with open(file_name, "r", encoding="utf-8") as f:
+        return toml.load(f)
+
+
 @contextlib.contextmanager
 def set_env_var(env_vars: Dict[str, str]):
     """Set an environment variable."""
@@ -39,3 +75,42 @@ def set_env_var(env_vars: Dict[str, str]):
     # set the values of environment variables before entering the context
     for k, v in og_env.items():
         os.environ[k] = v
+
+
+@contextlib.contextmanager
+def file_lock(lock_file: str) -> Iterator[None]:
+    """Hold an exclusive lock on lock_file, waiting until it is available.
+
+    The lock is released by the operating system if the process dies while
+    holding it. It is not reentrant.
+    """
+    lock_dir = os.path.dirname(lock_file)
+    if lock_dir:
+        os.makedirs(lock_dir, exist_ok=True)
+    with open(lock_file, "a+b") as f:
+        if sys.platform == "win32":
+            # msvcrt only exists on Windows
+            import msvcrt  # noqa: PLC0415
+
+            f.seek(0)
+            while True:
+                try:
+                    # LK_LOCK gives up after trying for 10 seconds
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            # fcntl does not exist on Windows
+            import fcntl  # noqa: PLC0415
+
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
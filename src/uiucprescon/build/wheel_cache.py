@@ -0,0 +1,272 @@
+"""Cache of finished wheels, keyed by everything the wheel is built from.
+
+The key covers the source tree, the config settings, the interpreter, the
+compiler and the dependency graph resolved by Conan. A build with the same
+key produces the same wheel, so it is taken from the cache instead. The key
+is made before anything is built, the Conan dependencies being resolved
+without installing them.
+
+Show how well the cache is doing with::
+
+    python -m uiucprescon.build.wheel_cache stats
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import platform
+import subprocess  # nosec B404
+import sys
+import sysconfig
+from importlib.metadata import version
+from typing import Any, Dict, List, Optional, Union
+
+from uiucprescon.build.capabilities import get_toolchain_capabilities
+from uiucprescon.build.cache import (
+    ContentStore,
+    default_cache_root,
+    format_stats,
+    parse_size,
+)
+
+__all__ = ["WheelCache", "get_wheel_cache", "wheel_cache_key"]
+
+WHEEL_CACHE_ENV_VAR = "UIUCPRESCON_BUILD_WHEEL_CACHE"
+DEFAULT_MAX_SIZE = "2G"
+
+# Config settings that only control the caches or how the build is
+# scheduled, and do not change the wheel.
+CACHE_CONFIG_SETTINGS = [
+    "wheel_cache",
+    "wheel_cache_max_size",
+    "remote_cache",
+    "remote_cache_upload",
+    "remote_cache_timeout",
+    "preflight",
+    "parallel_wheel_writer",
+    "wheel_compression_level",
+    "wheel_store_libraries_larger_than",
+    "object_cache",
+    "object_cache_max_size",
+    "conan_pipeline",
+    "fixup_workers",
+    "parallel",
+    "dependency_index",
+]
+
+EXCLUDED_SOURCE_DIRS = {
+    ".git",
+    ".hg",
+    ".svn",
+    ".tox",
+    ".nox",
+    ".venv",
+    "venv",
+    ".eggs",
+    ".mypy_cache",
+    ".pytest_cache",
+    "__pycache__",
+    "build",
+    "dist",
+}
+
+# Environment variables read by setuptools or the compilers.
+BUILD_ENV_VARS = [
+    "CC",
+    "CXX",
+    "CFLAGS",
+    "CXXFLAGS",
+    "CPPFLAGS",
+    "LDFLAGS",
+    "LDSHARED",
+    "ARCHFLAGS",
+    "MACOSX_DEPLOYMENT_TARGET",
+    "_PYTHON_HOST_PLATFORM",
+    "CONAN_USER_HOME",
+    "CONAN_COMPILER_LIBCXX",
+    "CONAN_COMPILER_VERSION",
+    "CONAN_BUILD_INFO_DIR",
+]
+
+
+def source_tree_fingerprint(
+    source_root: str = ".", exclude: Optional[List[str]] = None
+) -> str:
+    """Hash the content of every file in the source tree.
+
+    Version control, build and output directories are skipped, as are the
+    directories listed in exclude.
+    """
+    excluded_paths = {os.path.abspath(p) for p in exclude or []}
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(source_root):
+        dirs[:] = sorted(
+            d for d in dirs
+            if d not in EXCLUDED_SOURCE_DIRS
+            and not d.endswith(".egg-info")
+            and os.path.abspath(os.path.join(root, d)) not in excluded_paths
+        )
+        for file_name in sorted(files):
+            file_path = os.path.join(root, file_name)
+            relative_path = os.path.relpath(file_path, source_root)
+            digest.update(relative_path.replace(os.sep, "/").encode("utf-8"))
+            digest.update(b"\0")
+            try:
+                digest.update(_file_digest(file_path))
+            except OSError:
+                # Broken symlinks and such
+                digest.update(b"unreadable")
+    return digest.hexdigest()
+
+
+def _file_digest(file_path: str) -> bytes:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def interpreter_fingerprint() -> Dict[str, Any]:
+    """Describe the interpreter the extensions are built for."""
+    return {
+        "implementation": sys.implementation.cache_tag,
+        "version": sys.version,
+        "soabi": sysconfig.get_config_var("SOABI"),
+        "ext_suffix": sysconfig.get_config_var("EXT_SUFFIX"),
+        "platform": sysconfig.get_platform(),
+        "machine": platform.machine(),
+    }
+
+
+def compiler_fingerprint() -> Dict[str, Any]:
+    """Describe the compiler and the settings it is used with."""
+    capabilities = get_toolchain_capabilities()
+    # The same compiler the family is detected from
+    compiler = capabilities.compiler
+    compiler_version = None
+    if compiler and capabilities.platform != "Windows":
+        try:
+            compiler_version = subprocess.run(  # nosec B603
+                [compiler, "--version"],
+                capture_output=True,
+                text=True,
+                check=False,
+                timeout=30,
+            ).stdout
+        except (OSError, subprocess.SubprocessError):
+            compiler_version = None
+    return {
+        "family": capabilities.compiler_family,
+        "python_compiler": platform.python_compiler(),
+        "compiler": compiler,
+        "compiler_version": compiler_version,
+        "env": {name: os.environ.get(name) for name in BUILD_ENV_VARS},
+    }
+
+
+def wheel_cache_key(
+    config_settings: Optional[Dict[str, Union[str, List[str], None]]],
+    conan_graph: Optional[Dict[str, Any]],
+    source_root: str = ".",
+    exclude: Optional[List[str]] = None,
+) -> str:
+    """Get the key of the wheel built from the current state of things."""
+    settings = {
+        key: value
+        for key, value in (config_settings or {}).items()
+        if key not in CACHE_CONFIG_SETTINGS
+    }
+    key_data = {
+        "source": source_tree_fingerprint(source_root, exclude),
+        "config_settings": settings,
+        "interpreter": interpreter_fingerprint(),
+        "compiler": compiler_fingerprint(),
+        "conan_graph": conan_graph,
+        "tools": {
+            name: version(name) for name in ["uiucprescon.build", "setuptools"]
+        },
+    }
+    return hashlib.sha256(
+        json.dumps(key_data, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+class WheelCache(ContentStore):
+    """Store of finished wheels."""
+
+    def fetch_wheel(self, key: str, wheel_directory: str) -> Optional[str]:
+        """Place the cached wheel in wheel_directory and return its name."""
+        wheel = self.fetch(key, wheel_directory)
+        return os.path.basename(wheel) if wheel is not None else None
+
+
+def get_wheel_cache_dir(
+    config_settings: Optional[Dict[str, Union[str, List[str], None]]] = None,
+) -> Optional[str]:
+    """Get the directory of the wheel cache, or None if it is disabled."""
+    value = (config_settings or {}).get("wheel_cache")
+    if value is None:
+        value = os.environ.get(WHEEL_CACHE_ENV_VAR)
+    if value is None:
+        return None
+    value = str(value)
+    if value.lower() in ["false", "0", "no", "off", ""]:
+        return None
+    if value.lower() in ["true", "1", "yes", "on"]:
+        return os.path.join(default_cache_root(), "wheels")
+    return os.path.abspath(value)
+
+
+def get_wheel_cache(
+    config_settings: Optional[Dict[str, Union[str, List[str], None]]] = None,
+) -> Optional[WheelCache]:
+    """Get the wheel cache configured by config_settings, if enabled."""
+    cache_dir = get_wheel_cache_dir(config_settings)
+    if cache_dir is None:
+        return None
+    max_size = (config_settings or {}).get(
+        "wheel_cache_max_size", DEFAULT_MAX_SIZE
+    )
+    return WheelCache(cache_dir, parse_size(str(max_size)))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Show or clear the wheel cache from the command line."""
+    parser = argparse.ArgumentParser(
+        prog="python -m uiucprescon.build.wheel_cache",
+        description="Manage the cache of wheels built by uiucprescon.build.",
+    )
+    parser.add_argument(
+        "command", choices=["stats", "clear"], help="what to do"
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=None,
+        help="location of the cache. Defaults to "
+        f"${WHEEL_CACHE_ENV_VAR} or the user cache directory.",
+    )
+    parser.add_argument(
+        "--max-size",
+        default=DEFAULT_MAX_SIZE,
+        help=f"size limit of the cache. Default: {DEFAULT_MAX_SIZE}",
+    )
+    args = parser.parse_args(argv)
+    cache_dir = (
+        args.cache_dir
+        or get_wheel_cache_dir()
+        or os.path.join(default_cache_root(), "wheels")
+    )
+    cache = WheelCache(cache_dir, parse_size(args.max_size))
+    if args.command == "clear":
+        cache.clear()
+        print(f"Cleared {cache_dir}")
+        return
+    print("\n".join(format_stats(f"Wheel cache ({cache_dir})", cache.stats())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+"""Writing wheel archives with the members prepared in parallel.
+
+setuptools reads, hashes and compresses every member of a wheel one after
+the other, with the same compression level. Wheels vendoring large shared
+libraries spend much of their packaging time there. The writer here reads
+and hashes the members for RECORD in a thread pool, and decides there how
+each of them is stored, while the archive is written in order through
+zipfile. The members are streamed in chunks, so large libraries are never
+held in memory.
+
+A compression policy decides how each member is stored. Members that are
+already compressed, or that do not get smaller when compressed, are stored
+as they are, and take no time to compress.
+"""
+
+from __future__ import annotations
+
+import base64
+import concurrent.futures
+import contextlib
+import csv
+import dataclasses
+import hashlib
+import io
+import os
+import shutil
+import stat
+import time
+import zipfile
+import zlib
+from typing import (
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from uiucprescon.build.cache import parse_size
+
+__all__ = ["CompressionPolicy", "ParallelWheelFile", "parallel_wheel_writer"]
+
+MINIMUM_TIMESTAMP = 315532800  # 1980-01-01 00:00:00 UTC
+
+ALREADY_COMPRESSED_SUFFIXES = (
+    ".7z",
+    ".bz2",
+    ".gif",
+    ".gz",
+    ".jar",
+    ".jpeg",
+    ".jpg",
+    ".png",
+    ".webp",
+    ".whl",
+    ".xz",
+    ".zip",
+    ".zst",
+)
+
+SHARED_LIBRARY_SUFFIXES = (".so", ".dylib", ".dll", ".pyd")
+
+CHUNK_SIZE = 1024 * 1024
+
+# How much of a member is compressed to find out if it is worth compressing
+SAMPLE_SIZE = 1024 * 1024
+
+
+def _zipinfo_datetime(timestamp: float) -> Tuple[int, int, int, int, int, int]:
+    # Honor SOURCE_DATE_EPOCH for reproducible wheels, as setuptools does.
+    timestamp = int(os.environ.get("SOURCE_DATE_EPOCH", timestamp))
+    return time.gmtime(max(timestamp, MINIMUM_TIMESTAMP))[0:6]
+
+
+def _format_record_hash(digest: bytes) -> str:
+    return "sha256=" + base64.urlsafe_b64encode(digest).rstrip(b"=").decode(
+        "ascii"
+    )
+
+
+def _record_hash(data: bytes) -> str:
+    return _format_record_hash(hashlib.sha256(data).digest())
+
+
+@dataclasses.dataclass
+class CompressionPolicy:
+    """How the members of a wheel are compressed.
+
+    Attributes:
+        level: zlib compression level, from 0 to 9.
+        store_suffixes: Members with these suffixes are already compressed
+            and are stored without compressing them again.
+        store_libraries_larger_than: Shared libraries larger than this many
+            bytes are stored. Trades a larger wheel for faster builds and
+            installs. None compresses every library.
+        min_saving: Members whose first megabyte does not shrink by at
+            least this fraction when compressed are stored instead.
+
+    """
+
+    level: int = 6
+    store_suffixes: Tuple[str, ...] = ALREADY_COMPRESSED_SUFFIXES
+    store_libraries_larger_than: Optional[int] = None
+    min_saving: float = 0.05
+
+    def should_compress(self, arcname: str, size: int) -> bool:
+        """Check if a member is worth compressing at all."""
+        name = arcname.lower()
+        if size == 0 or name.endswith(self.store_suffixes):
+            return False
+        if (
+            self.store_libraries_larger_than is not None
+            and size > self.store_libraries_larger_than
+            and (
+                name.endswith(SHARED_LIBRARY_SUFFIXES) or ".so." in name
+            )
+        ):
+            return False
+        return True
+
+    @classmethod
+    def from_config_settings(
+        cls,
+        config_settings: Optional[Dict[str, Union[str, List[str], None]]],
+    ) -> CompressionPolicy:
+        """Create the policy given by the wheel_* config settings."""
+        config_settings = config_settings or {}
+        policy = cls()
+        level = config_settings.get("wheel_compression_level")
+        if level is not None:
+            policy.level = int(str(level))
+            if not 0 <= policy.level <= 9:
+                raise ValueError(
+                    f"wheel_compression_level must be between 0 and 9, "
+                    f"not {level}"
+                )
+        store_larger_than = config_settings.get(
+            "wheel_store_libraries_larger_than"
+        )
+        if store_larger_than:
+            policy.store_libraries_larger_than = parse_size(
+                str(store_larger_than)
+            )
+        return policy
+
+
+@dataclasses.dataclass
+class _Member:
+    path: str
+    zinfo: zipfile.ZipInfo
+    record_hash: str
+
+
+# ZipInfo.compress_level is only public from Python 3.13 on.
+_COMPRESS_LEVEL_ATTRIBUTE = (
+    "compress_level"
+    if hasattr(zipfile.ZipInfo, "compress_level")
+    else "_compresslevel"
+)
+
+
+def _prepare_member(
+    path: str, arcname: str, policy: CompressionPolicy, compress: bool
+) -> _Member:
+    digest = hashlib.sha256()
+    compressor = None
+    sample_size = 0
+    sample_compressed_size = 0
+    with open(path, "rb") as f:
+        st = os.fstat(f.fileno())
+        if compress and policy.should_compress(arcname, st.st_size):
+            compressor = zlib.compressobj(policy.level, zlib.DEFLATED, -15)
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+            if compressor is not None and sample_size < SAMPLE_SIZE:
+                sample = chunk[:SAMPLE_SIZE - sample_size]
+                sample_size += len(sample)
+                sample_compressed_size += len(compressor.compress(sample))
+    zinfo = zipfile.ZipInfo(arcname, date_time=_zipinfo_datetime(st.st_mtime))
+    zinfo.external_attr = (
+        stat.S_IMODE(st.st_mode) | stat.S_IFMT(st.st_mode)
+    ) << 16
+    zinfo.file_size = st.st_size
+    zinfo.compress_type = zipfile.ZIP_STORED
+    if compressor is not None:
+        sample_compressed_size += len(compressor.flush())
+        if sample_compressed_size <= sample_size * (1 - policy.min_saving):
+            zinfo.compress_type = zipfile.ZIP_DEFLATED
+            setattr(zinfo, _COMPRESS_LEVEL_ATTRIBUTE, policy.level)
+    return _Member(path, zinfo, _format_record_hash(digest.digest()))
+
+
+class ParallelWheelFile(zipfile.ZipFile):
+    """Wheel archive writer compressing its members in a thread pool.
+
+    It can stand in for the WheelFile class setuptools' bdist_wheel command
+    writes wheels with. The RECORD file is written when the archive is
+    closed.
+    """
+
+    def __init__(
+        self,
+        file: str,
+        mode: str = "w",
+        compression: int = zipfile.ZIP_DEFLATED,
+        policy: Optional[CompressionPolicy] = None,
+        max_workers: Optional[int] = None,
+    ) -> None:
+        """Create a wheel for writing at file."""
+        if mode not in ["w", "x"]:
+            raise ValueError("ParallelWheelFile can only write wheels")
+        super().__init__(
+            file,
+            "x" if mode == "x" else "w",
+            compression=compression,
+            allowZip64=True,
+        )
+        name, version = os.path.basename(file).split("-")[:2]
+        self.dist_info_path = f"{name}-{version}.dist-info"
+        self.record_path = f"{self.dist_info_path}/RECORD"
+        self.policy = policy or CompressionPolicy()
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 1) + 4)
+        self._records: List[Tuple[str, str, int]] = []
+
+    def _iter_files(self, base_dir: str) -> Iterator[Tuple[str, str]]:
+        # Same order as the wheel package writes them in, with the
+        # .dist-info files last.
+        deferred = []
+        for root, dirnames, filenames in os.walk(base_dir):
+            dirnames.sort()
+            for name in sorted(filenames):
+                path = os.path.normpath(os.path.join(root, name))
+                if not os.path.isfile(path):
+                    continue
+                arcname = os.path.relpath(path, base_dir).replace(
+                    os.path.sep, "/"
+                )
+                if arcname == self.record_path:
+                    continue
+                if root.endswith(".dist-info"):
+                    deferred.append((path, arcname))
+                else:
+                    yield path, arcname
+        yield from sorted(deferred)
+
+    def write_files(self, base_dir: str) -> None:
+        """Add every file in base_dir to the wheel."""
+        compress = self.compression == zipfile.ZIP_DEFLATED
+        files = iter(self._iter_files(base_dir))
+        in_flight: List[concurrent.futures.Future[_Member]] = []
+        # Keeps the pool busy without queueing the whole wheel at once.
+        window = self.max_workers * 2
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.max_workers
+        ) as executor:
+            while True:
+                while len(in_flight) < window:
+                    try:
+                        path, arcname = next(files)
+                    except StopIteration:
+                        break
+                    in_flight.append(
+                        executor.submit(
+                            _prepare_member,
+                            path,
+                            arcname,
+                            self.policy,
+                            compress,
+                        )
+                    )
+                if not in_flight:
+                    break
+                self._write_member(in_flight.pop(0).result())
+
+    def _write_member(self, member: _Member) -> None:
+        with open(member.path, "rb") as source, self.open(
+            member.zinfo, "w"
+        ) as target:
+            shutil.copyfileobj(source, target, CHUNK_SIZE)
+        self._records.append(
+            (member.zinfo.filename, member.record_hash, member.zinfo.file_size)
+        )
+
+    def writestr(self, zinfo_or_arcname, data, *args, **kwargs) -> None:
+        """Write a member from memory, recording it in RECORD."""
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        super().writestr(zinfo_or_arcname, data, *args, **kwargs)
+        name = (
+            zinfo_or_arcname.filename
+            if isinstance(zinfo_or_arcname, zipfile.ZipInfo)
+            else zinfo_or_arcname
+        )
+        if name != self.record_path:
+            self._records.append((name, _record_hash(data), len(data)))
+
+    def close(self) -> None:
+        """Write RECORD and close the archive."""
+        if self.fp is not None and self._records:
+            record = io.StringIO()
+            writer = csv.writer(
+                record, delimiter=",", quotechar='"', lineterminator="\n"
+            )
+            writer.writerows(self._records)
+            writer.writerow((self.record_path, "", ""))
+            self._records = []
+            zinfo = zipfile.ZipInfo(
+                self.record_path, date_time=_zipinfo_datetime(time.time())
+            )
+            zinfo.compress_type = self.compression
+            zinfo.external_attr = (0o664 | stat.S_IFREG) << 16
+            super().writestr(zinfo, record.getvalue())
+        super().close()
+
+
+@contextlib.contextmanager
+def parallel_wheel_writer(policy: CompressionPolicy) -> Iterator[None]:
+    """Have setuptools' bdist_wheel write wheels with ParallelWheelFile."""
+    # Only imported when building a wheel, not by the metadata hooks.
+    from setuptools.command import bdist_wheel  # noqa: PLC0415
+
+    original = bdist_wheel.WheelFile
+
+    def wheel_file(
+        file: str,
+        mode: str = "r",
+        compression: int = zipfile.ZIP_DEFLATED,
+    ) -> zipfile.ZipFile:
+        if mode == "r":
+            return original(file, mode, compression)
+        return ParallelWheelFile(file, mode, compression, policy=policy)
+
+    bdist_wheel.WheelFile = wheel_file
+    try:
+        yield
+    finally:
+        bdist_wheel.WheelFile = original
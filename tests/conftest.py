@@ -0,0 +1,70 @@
+import os
+import subprocess
+
+import pytest
+from setuptools.dist import Distribution
+from setuptools.extension import Extension
+
+from uiucprescon.build import deps, pybind11_builder
+from uiucprescon.build.session import build_session
+
+
+@pytest.fixture
+def conan_dependency_cache(tmp_path):
+    """Conan cache with a header-only recipe and no remotes enabled."""
+    conan_cache = tmp_path / "conan_cache"
+    recipe_dir = tmp_path / "mydep"
+    recipe_dir.mkdir()
+    env = {**os.environ, "CONAN_HOME": str(conan_cache)}
+    for command in [
+        ["conan", "profile", "detect", "--exist-ok"],
+        ["conan", "remote", "disable", "*"],
+        ["conan", "new", "header_lib", "-d", "name=mydep", "-d",
+         "version=1.0"],
+        ["conan", "export", "."],
+    ]:
+        subprocess.run(
+            command, cwd=recipe_dir, env=env, check=True, capture_output=True
+        )
+    return conan_cache
+
+
+@pytest.fixture
+def build_extension(tmp_path, monkeypatch, capfd):
+    """Build a spam extension from sources in tmp_path.
+
+    No libraries are linked or fixed up. The output captured before the
+    build runs is discarded, so that the test reads only the build's own.
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(
+        pybind11_builder.BuildPybind11Extension,
+        "_get_linking_library_paths",
+        lambda self: [],
+    )
+    monkeypatch.setattr(deps, "fixup_library", lambda *args: None)
+
+    def build(
+        sources,
+        config_settings=None,
+        cmdclass=pybind11_builder.BuildPybind11Extension,
+        force=False,
+        run=True,
+        **options,
+    ):
+        extension = Extension("spam", sources, **options)
+        dist = Distribution(
+            {"ext_modules": [extension], "cmdclass": {"build_ext": cmdclass}}
+        )
+        with build_session(config_settings):
+            command = dist.get_command_obj("build_ext")
+            command.build_lib = str(tmp_path / "lib")
+            command.build_temp = str(tmp_path / "temp")
+            command.force = force
+            command.ensure_finalized()
+            capfd.readouterr()
+            if run:
+                command.run()
+        return command
+
+    return build
@@ -0,0 +1,174 @@
+import json
+import os
+import tarfile
+import textwrap
+
+import pytest
+
+from uiucprescon.build import build_plan, conan, local_backend
+from uiucprescon.build.capabilities import get_toolchain_capabilities
+
+
+@pytest.fixture
+def pure_project(tmp_path, monkeypatch):
+    source_root = tmp_path / "package"
+    source_root.mkdir()
+    (source_root / "pyproject.toml").write_text(textwrap.dedent("""
+        [project]
+        name = "dummy"
+        version = "0.1.0"
+    """))
+    (source_root / "setup.py").write_text(textwrap.dedent("""
+        from setuptools import setup
+        setup(py_modules=["dummy"])
+    """))
+    (source_root / "dummy.py").write_text("")
+    monkeypatch.chdir(source_root)
+    return source_root
+
+
+def test_build_sdist_embeds_build_plan(pure_project, tmp_path, capsys):
+    sdist = local_backend.build_sdist(
+        str(tmp_path / "dist"), {"build_plan": "true"}
+    )
+    with tarfile.open(tmp_path / "dist" / sdist) as archive:
+        archive.extractall(tmp_path / "unpacked", filter="data")
+    unpacked = tmp_path / "unpacked" / "dummy-0.1.0"
+    plan = json.loads((unpacked / build_plan.BUILD_PLAN_FILE).read_text())
+    assert plan["introspection"]["build_info"] == {"extensions": []}
+    assert (unpacked / "dummy.py").exists()
+
+    os.chdir(unpacked)
+    capsys.readouterr()
+    local_backend.build_wheel(str(tmp_path / "wheels"))
+    assert (
+        f"Using the extensions from {build_plan.BUILD_PLAN_FILE}"
+        in capsys.readouterr().out
+    )
+
+
+def test_build_sdist_without_build_plan(pure_project, tmp_path):
+    sdist = local_backend.build_sdist(str(tmp_path / "dist"))
+    with tarfile.open(tmp_path / "dist" / sdist) as archive:
+        assert not any(
+            name.endswith(build_plan.BUILD_PLAN_FILE)
+            for name in archive.getnames()
+        )
+
+
+def test_embed_build_plan_replaces_existing_plan(pure_project, tmp_path):
+    sdist = tmp_path / "dist" / local_backend.build_sdist(
+        str(tmp_path / "dist")
+    )
+    build_plan.embed_build_plan(str(sdist), {"version": 0})
+    build_plan.embed_build_plan(str(sdist), {"version": 1})
+    with tarfile.open(sdist) as archive:
+        names = [
+            name for name in archive.getnames()
+            if name.endswith(build_plan.BUILD_PLAN_FILE)
+        ]
+        assert names == [f"dummy-0.1.0/{build_plan.BUILD_PLAN_FILE}"]
+        assert json.load(archive.extractfile(names[0])) == {"version": 1}
+
+
+def test_plan_build_info_falls_back_when_stale(pure_project, monkeypatch):
+    plan = build_plan.create_build_plan()
+    assert build_plan.plan_build_info(plan) == {"extensions": []}
+    assert build_plan.plan_build_info(plan, mode="intercept") is None
+
+    (pure_project / "setup.py").write_text(
+        "from setuptools import setup\nsetup()\n"
+    )
+    assert build_plan.plan_build_info(plan) is None
+
+    plan = build_plan.create_build_plan()
+    monkeypatch.setattr(
+        build_plan,
+        "plan_environment",
+        lambda: {**plan["environment"], "system": "Spam"},
+    )
+    assert build_plan.plan_build_info(plan) is None
+
+
+def test_load_build_plan_ignores_other_versions(pure_project):
+    assert build_plan.load_build_plan() is None
+    (pure_project / build_plan.BUILD_PLAN_FILE).write_text(
+        json.dumps({"version": build_plan.BUILD_PLAN_VERSION + 1})
+    )
+    assert build_plan.load_build_plan() is None
+    (pure_project / build_plan.BUILD_PLAN_FILE).write_text("{")
+    assert build_plan.load_build_plan() is None
+
+
+@pytest.mark.skipif(
+    (get_toolchain_capabilities().conan_major_version or 0) < 2,
+    reason="Build plan lockfiles need Conan 2",
+)
+def test_build_plan_conan_lockfile(pure_project, tmp_path):
+    (pure_project / "conanfile.txt").write_text("[requires]\n")
+    plan = build_plan.create_build_plan(
+        {"conan_cache": str(tmp_path / "conan_cache")}
+    )
+    assert plan["conan"]["lockfile"]["version"]
+    lockfile = build_plan.plan_conan_lockfile(plan, str(tmp_path / "out"))
+    with open(lockfile, encoding="utf-8") as f:
+        assert json.load(f) == plan["conan"]["lockfile"]
+
+    (pure_project / "conanfile.txt").write_text("[generators]\n")
+    assert build_plan.plan_conan_lockfile(plan, str(tmp_path / "out")) is None
+
+
+def test_resolve_conan_graph_uses_the_plan(pure_project, monkeypatch):
+    (pure_project / "conanfile.txt").write_text("[requires]\n")
+    monkeypatch.setattr(
+        get_toolchain_capabilities(), "conan_version", (2, 0, 0)
+    )
+    plan = {
+        "conan": {
+            "conanfile": "conanfile.txt",
+            "conanfile_sha256": build_plan._file_sha256("conanfile.txt"),
+            "conan_version": 2,
+            "lockfile": {"version": "0.5"},
+            "graph": {"nodes": {"0": {"ref": "conanfile"}}},
+        }
+    }
+    assert build_plan.resolve_conan_graph(plan=plan) == plan["conan"]["graph"]
+
+
+@pytest.mark.skipif(
+    (get_toolchain_capabilities().conan_major_version or 0) < 2,
+    reason="Dependency bundles need Conan 2",
+)
+def test_conan_bundle_builds_without_remotes(
+    pure_project, tmp_path, conan_dependency_cache, capsys
+):
+    (pure_project / "conanfile.txt").write_text("[requires]\nmydep/1.0\n")
+    (pure_project / "MANIFEST.in").write_text("include conanfile.txt\n")
+    sdist = local_backend.build_sdist(
+        str(tmp_path / "dist"),
+        {"conan_bundle": "true", "conan_cache": str(conan_dependency_cache)},
+    )
+    with tarfile.open(tmp_path / "dist" / sdist) as archive:
+        archive.extractall(tmp_path / "unpacked", filter="data")
+    unpacked = tmp_path / "unpacked" / "dummy-0.1.0"
+    os.chdir(unpacked)
+    bundle = build_plan.find_conan_bundle()
+    assert bundle is not None
+
+    # A fresh cache, with its default remote, which is never contacted
+    build_dir = tmp_path / "conan_build"
+    build_dir.mkdir()
+    build_info = conan.conan_api.build_deps_with_conan(
+        str(unpacked / "conanfile.txt"),
+        str(build_dir),
+        str(tmp_path / "install"),
+        None,
+        None,
+        ["missing"],
+        conan_cache=str(tmp_path / "fresh_cache"),
+        bundle=bundle,
+    )
+    assert any(
+        "mydep" in include_path for include_path in build_info["include_paths"]
+    )
+    assert "using the Conan remotes" not in capsys.readouterr().err
@@ -0,0 +1,101 @@
+import os
+import time
+
+import pytest
+
+from uiucprescon.build import cache
+
+
+@pytest.mark.parametrize(
+    "size, expected",
+    [
+        ("100", 100),
+        ("2K", 2048),
+        ("500M", 500 * 1024 ** 2),
+        ("2G", 2 * 1024 ** 3),
+        ("2GiB", 2 * 1024 ** 3),
+    ],
+)
+def test_parse_size(size, expected):
+    assert cache.parse_size(size) == expected
+
+
+def test_parse_size_invalid():
+    with pytest.raises(ValueError):
+        cache.parse_size("lots")
+
+
+@pytest.fixture
+def make_file(tmp_path):
+    def _make_file(name, size):
+        path = tmp_path / "files" / name
+        path.parent.mkdir(exist_ok=True)
+        path.write_bytes(b"x" * size)
+        return str(path)
+    return _make_file
+
+
+def test_put_and_fetch(tmp_path, make_file):
+    store = cache.ContentStore(str(tmp_path / "store"), max_size=1024)
+    store.put("abc123", make_file("spam.whl", 10))
+    destination = tmp_path / "dist"
+    fetched = store.fetch("abc123", str(destination))
+    assert fetched == str(destination / "spam.whl")
+    assert (destination / "spam.whl").read_bytes() == b"x" * 10
+    assert store.fetch("def456", str(destination)) is None
+    stats = store.stats()
+    assert (stats.hits, stats.misses, stats.entries, stats.size) == \
+        (1, 1, 1, 10)
+
+
+def test_least_recently_used_is_evicted(tmp_path, make_file):
+    store = cache.ContentStore(str(tmp_path / "store"), max_size=25)
+    store.put("aaaa", make_file("a.whl", 10))
+    store.put("bbbb", make_file("b.whl", 10))
+    old = time.time() - 100
+    os.utime(os.path.dirname(store.get("aaaa")), (old, old))
+    os.utime(os.path.dirname(store.get("bbbb")), (old - 100, old - 100))
+    store.get("aaaa")
+    store.put("cccc", make_file("c.whl", 10))
+    assert store.get("bbbb") is None
+    assert store.get("aaaa") is not None
+    assert store.get("cccc") is not None
+    assert store.stats().evictions == 1
+
+
+def test_clear(tmp_path, make_file):
+    store = cache.ContentStore(str(tmp_path / "store"), max_size=1024)
+    store.put("aaaa", make_file("a.whl", 10))
+    store.clear()
+    assert store.stats().entries == 0
+
+
+def test_hits_are_written_in_batches(tmp_path, make_file):
+    store = cache.ContentStore(str(tmp_path / "store"), max_size=1024)
+    store.put("aaaa", make_file("a.whl", 10))
+    stats_file = tmp_path / "store" / cache.STATS_FILE
+    written = stats_file.read_text()
+    store.get("aaaa")
+    store.get("bbbb")
+    assert stats_file.read_text() == written
+    store.flush()
+    reopened = cache.ContentStore(str(tmp_path / "store"), max_size=1024)
+    stats = reopened.stats()
+    assert (stats.hits, stats.misses) == (1, 1)
+
+
+def test_put_under_budget_does_not_list_entries(
+    tmp_path, make_file, monkeypatch
+):
+    store = cache.ContentStore(str(tmp_path / "store"), max_size=1024)
+    store.put("aaaa", make_file("a.whl", 10))
+
+    def listed():
+        raise AssertionError("entries listed under budget")
+
+    monkeypatch.setattr(store, "_iter_entries", listed)
+    store.put("bbbb", make_file("b.whl", 10))
+    store.put("bbbb", make_file("b.whl", 10))
+    monkeypatch.undo()
+    assert cache._read_counters(store.root)["size"] == 20
+    assert store.stats().size == 20
@@ -0,0 +1,160 @@
+import os
+import sys
+import textwrap
+
+import pytest
+
+from uiucprescon.build import capabilities
+
+
+@pytest.mark.parametrize(
+    "version_string, expected",
+    [
+        ("1.66.0", (1, 66, 0)),
+        ("2.0.0", (2, 0, 0)),
+        ("2.10.1", (2, 10, 1)),
+        ("2.1.0rc1", (2, 1, 0)),
+        ("2.0.dev1", (2, 0)),
+    ],
+)
+def test_parse_version(version_string, expected):
+    assert capabilities.parse_version(version_string) == expected
+
+
+@pytest.mark.parametrize(
+    "conan_version, expected",
+    [
+        ((1, 66, 0), True),
+        ((2, 0, 0), False),
+        ((10, 0, 0), False),
+        ((), False),
+    ],
+)
+def test_uses_conan_v1(conan_version, expected):
+    toolchain = capabilities.ToolchainCapabilities(
+        conan_version=conan_version,
+        system="Linux",
+        compiler_family="gcc",
+    )
+    assert toolchain.uses_conan_v1 is expected
+
+
+def test_conan_not_installed():
+    toolchain = capabilities.ToolchainCapabilities(
+        conan_version=(), system="Linux", compiler_family="gcc"
+    )
+    assert toolchain.conan_major_version is None
+
+
+@pytest.mark.parametrize(
+    "python_compiler, expected",
+    [
+        ("GCC 10.2.1 20210110", "gcc"),
+        ("MSC v.1916 64 bit (AMD64)", "msvc"),
+        ("spam", "unknown"),
+    ],
+)
+def test_get_compiler_family(python_compiler, expected):
+    assert capabilities.get_compiler_family(python_compiler) == expected
+
+
+def fake_compiler(path, version_output, dumpversion=""):
+    path.write_text(textwrap.dedent(f"""\
+        #!/bin/sh
+        if [ "$1" = "-dumpfullversion" ]; then
+            echo "{dumpversion}"
+        else
+            echo "{version_output}"
+        fi
+    """))
+    path.chmod(0o755)
+    return str(path)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Uses shell scripts")
+@pytest.mark.parametrize(
+    "version_output, expected",
+    [
+        ("gcc (Debian 12.2.0-14) 12.2.0", "gcc"),
+        ("c++ (GCC) 13.2.0 Copyright Free Software Foundation", "gcc"),
+        ("Ubuntu clang version 14.0.0-1ubuntu1", "clang"),
+        ("Apple clang version 15.0.0 (clang-1500.1.0.2.5)", "apple-clang"),
+        ("Intel(R) oneAPI DPC++/C++ Compiler 2024.0.0", "unknown"),
+    ],
+)
+def test_get_compiler_family_of(tmp_path, version_output, expected):
+    compiler = fake_compiler(tmp_path / "cc", version_output)
+    assert capabilities.get_compiler_family_of(compiler) == expected
+
+
+def test_get_compiler_family_of_msvc():
+    assert capabilities.get_compiler_family_of(os.path.join("VC", "cl.exe")) \
+        == "msvc"
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Uses shell scripts")
+def test_compiler_family_and_version_describe_the_same_compiler(
+    tmp_path, monkeypatch
+):
+    gcc = fake_compiler(
+        tmp_path / "gcc", "gcc (GCC) 13.2.0", dumpversion="13.2.0"
+    )
+    clang = fake_compiler(tmp_path / "clang", "clang version 17.0.6")
+    monkeypatch.delenv("CXX", raising=False)
+    toolchain = capabilities.ToolchainCapabilities(
+        conan_version=(2, 0, 0), system="Linux"
+    )
+    monkeypatch.setenv("CC", gcc)
+    assert toolchain.compiler == gcc
+    assert toolchain.compiler_family == "gcc"
+    assert toolchain.compiler_version == "13.2"
+    monkeypatch.setenv("CC", clang)
+    assert toolchain.compiler == clang
+    assert toolchain.compiler_family == "clang"
+    assert toolchain.compiler_version == "17.0"
+
+
+def test_tool_path_is_looked_up_once(monkeypatch):
+    calls = []
+
+    def locate_tool(tool):
+        calls.append(tool)
+        return f"/usr/bin/{tool}"
+
+    monkeypatch.setattr(capabilities, "_locate_tool", locate_tool)
+    toolchain = capabilities.ToolchainCapabilities(
+        conan_version=(2, 0, 0), system="Linux", compiler_family="gcc"
+    )
+    assert toolchain.has_patchelf
+    assert toolchain.tool_path("patchelf") == "/usr/bin/patchelf"
+    assert calls == ["patchelf"]
+
+
+def test_compiler_version_follows_the_environment(monkeypatch):
+    calls = []
+
+    def detect_compiler_version(self):
+        calls.append(os.environ.get("CC"))
+        return os.environ.get("CC", "11")
+
+    monkeypatch.setattr(
+        capabilities.ToolchainCapabilities,
+        "_detect_compiler_version",
+        detect_compiler_version,
+    )
+    toolchain = capabilities.ToolchainCapabilities(
+        conan_version=(2, 0, 0), system="Linux", compiler_family="gcc"
+    )
+    monkeypatch.setenv("CC", "12")
+    assert toolchain.compiler_version == "12"
+    assert toolchain.compiler_version == "12"
+    monkeypatch.setenv("CC", "13")
+    assert toolchain.compiler_version == "13"
+    assert calls == ["12", "13"]
+
+
+def test_get_toolchain_capabilities_is_shared():
+    assert (
+        capabilities.get_toolchain_capabilities()
+        is capabilities.get_toolchain_capabilities()
+    )
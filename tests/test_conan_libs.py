@@ -1,7 +1,13 @@
 from uiucprescon.build import conan_libs
+from uiucprescon.build.conan.utils import LanguageStandardsVersion
+from uiucprescon.build.session import build_session
 from setuptools import Extension
+from setuptools.dist import Distribution
+import os
 import sys
 
+import pytest
+
 
 def test_update_extension2():
     extension = Extension(
@@ -48,3 +54,85 @@ conan_options=[]
     """)
     monkeypatch.chdir(source_root)
     conan_libs.get_conan_options()
+
+
+def test_match_libs_with_in_memory_build_info(tmp_path):
+    include_dir = tmp_path / "include"
+    include_dir.mkdir()
+    conan_build_info = {
+        "graph": {
+            "nodes": {
+                "1": {
+                    "name": "zstd",
+                    "cpp_info": {
+                        "root": {
+                            "includedirs": [str(include_dir)],
+                            "libdirs": [],
+                            "bindirs": [],
+                            "defines": ["ZSTD_STATIC"],
+                            "libs": ["zstd"],
+                            "system_libs": [],
+                        }
+                    },
+                    "dependencies": {},
+                }
+            }
+        }
+    }
+    extension = Extension(name="spam", sources=[], libraries=["zstd"])
+    conan_libs.match_libs(
+        extension,
+        build_path=str(tmp_path),
+        conan_build_info=conan_build_info
+    )
+    assert extension.libraries == ["zstd"]
+    assert str(include_dir) in extension.include_dirs
+    assert ("ZSTD_STATIC", None) in extension.define_macros
+
+
+@pytest.fixture
+def conan_project(tmp_path, monkeypatch):
+    source_root = tmp_path / "package"
+    source_root.mkdir()
+    (source_root / "pyproject.toml").write_text('[project]\nname = "dummy"\n')
+    (source_root / "conanfile.txt").write_text("[requires]\nzlib/1.3.1\n")
+    monkeypatch.chdir(source_root)
+    return source_root
+
+
+def _finalized_build_conan(**options):
+    command = conan_libs.BuildConan(Distribution())
+    command.compiler_version = "11"
+    for key, value in options.items():
+        setattr(command, key, value)
+    command.finalize_options()
+    return command
+
+
+def test_build_conan_build_dir_depends_on_configuration(conan_project):
+    default = _finalized_build_conan()
+    assert _finalized_build_conan().build_temp == default.build_temp
+    assert _finalized_build_conan(arch="armv8").build_temp != \
+        default.build_temp
+    assert _finalized_build_conan(
+        language_standards=LanguageStandardsVersion(cpp_std="17")
+    ).build_temp != default.build_temp
+    (conan_project / "conanfile.txt").write_text("[requires]\nzstd/1.5.7\n")
+    assert _finalized_build_conan().build_temp != default.build_temp
+
+
+def test_build_conan_uses_conan_build_dir_from_config(
+    conan_project, tmp_path
+):
+    conan_build_dir = str(tmp_path / "conan_build")
+    with build_session({"conan_build_dir": conan_build_dir}):
+        command = _finalized_build_conan(arch="armv8")
+    assert command.build_temp == conan_build_dir
+
+
+def test_build_conan_reuses_build_dir_of_session(conan_project, tmp_path):
+    with build_session() as session:
+        first = _finalized_build_conan(arch="armv8")
+        session.record_conan_resolution(first.build_temp, {})
+        assert _finalized_build_conan().build_temp == \
+            os.path.abspath(first.build_temp)
@@ -0,0 +1,112 @@
+import os
+import textwrap
+
+import pytest
+
+from uiucprescon.build import dependency_index, pybind11_builder
+
+
+def test_parse_dependency_file(tmp_path):
+    (tmp_path / "spam.d").write_text(textwrap.dedent("""\
+        build/spam.o: src/spam.cpp include/my\\ header.h \\
+          C:/include/eggs.h include/$$cost.h
+    """))
+    assert dependency_index.parse_dependency_file(
+        str(tmp_path / "spam.d")
+    ) == [
+        "src/spam.cpp",
+        "include/my header.h",
+        "C:/include/eggs.h",
+        "include/$cost.h",
+    ]
+
+
+def test_index_survives_saving(tmp_path):
+    (tmp_path / "spam.h").write_text("")
+    (tmp_path / "spam.o").write_text("")
+    path = str(tmp_path / "index.json")
+    index = dependency_index.DependencyIndex(path)
+    index.record(str(tmp_path / "spam.o"), "flags", [str(tmp_path / "spam.h")])
+    index.save()
+    index = dependency_index.DependencyIndex(path)
+    assert index.is_up_to_date(str(tmp_path / "spam.o"), "flags")
+    assert not index.is_up_to_date(str(tmp_path / "spam.o"), "other flags")
+    (tmp_path / "spam.h").write_text("int spam;")
+    assert not index.is_up_to_date(str(tmp_path / "spam.o"), "flags")
+
+
+@pytest.fixture
+def build(build_extension, tmp_path, capfd):
+    (tmp_path / "include").mkdir()
+    (tmp_path / "include" / "value.h").write_text("#define VALUE 1\n")
+    (tmp_path / "spam.cpp").write_text(textwrap.dedent("""
+        #include <Python.h>
+        #include "value.h"
+
+        static struct PyModuleDef spam = {
+            PyModuleDef_HEAD_INIT, "spam", NULL, -1, NULL
+        };
+
+        PyMODINIT_FUNC PyInit_spam(void) {
+            PyObject *module = PyModule_Create(&spam);
+            PyModule_AddIntConstant(module, "value", VALUE);
+            return module;
+        }
+    """))
+    (tmp_path / "eggs.cpp").write_text("int eggs() {return 0;}\n")
+
+    def build(force=False, **options):
+        build_extension(
+            ["spam.cpp", "eggs.cpp"], force=force, include_dirs=["include"],
+            **options
+        )
+        return capfd.readouterr().out
+
+    return build
+
+
+def test_only_changed_sources_are_compiled(build, tmp_path):
+    out = build()
+    assert "skipping" not in out
+    index = tmp_path / "temp" / dependency_index.DEPENDENCY_INDEX
+    assert os.path.exists(index)
+
+    out = build()
+    assert "skipping 'spam' extension (up-to-date)" in out
+
+    # Headers are tracked, and touching a file without changing it is not
+    # a change.
+    (tmp_path / "include" / "value.h").write_text("#define VALUE 2\n")
+    os.utime(tmp_path / "eggs.cpp", ns=(0, 0))
+    out = build()
+    assert "skipping spam.cpp (up-to-date)" not in out
+    assert "skipping eggs.cpp (up-to-date)" in out
+    assert "skipping linking" not in out
+
+    # So are the flags
+    out = build(define_macros=[("EGGS", "1")])
+    assert "skipping spam.cpp" not in out
+    assert "skipping eggs.cpp" not in out
+
+
+def test_force_compiles_everything(build):
+    build()
+    assert "skipping" not in build(force=True)
+    assert "(up-to-date)" in build()
+
+
+def test_build_does_not_force(build, monkeypatch):
+    forced = []
+    build_extension = pybind11_builder.BuildPybind11Extension.build_extension
+
+    def record_force(self, ext):
+        forced.append(self.force)
+        build_extension(self, ext)
+
+    monkeypatch.setattr(
+        pybind11_builder.BuildPybind11Extension,
+        "build_extension",
+        record_force,
+    )
+    build()
+    assert forced == [False]
@@ -0,0 +1,137 @@
+import os
+import subprocess
+import sys
+import textwrap
+import zipfile
+
+import pytest
+from setuptools.command import editable_wheel
+
+from uiucprescon.build import (
+    _editable_hook,
+    editable,
+    errors,
+    local_backend,
+)
+
+
+@pytest.fixture
+def extension_project(tmp_path, monkeypatch):
+    source_root = tmp_path / "package"
+    (source_root / "src").mkdir(parents=True)
+    (source_root / "pyproject.toml").write_text(textwrap.dedent("""
+        [project]
+        name = "dummy"
+        version = "0.1.0"
+    """))
+    (source_root / "setup.py").write_text(textwrap.dedent("""
+        from setuptools import setup, Extension
+        setup(
+            ext_modules=[
+                Extension(
+                    "spam",
+                    ["src/spam.c", "src/eggs.c"],
+                    include_dirs=["src"],
+                )
+            ]
+        )
+    """))
+    (source_root / "src" / "value.h").write_text("#define VALUE 1\n")
+    (source_root / "src" / "eggs.c").write_text("int eggs(void) {return 0;}\n")
+    (source_root / "src" / "spam.c").write_text(textwrap.dedent("""
+        #include <Python.h>
+        #include "value.h"
+
+        static struct PyModuleDef spam = {
+            PyModuleDef_HEAD_INIT, "spam", NULL, -1, NULL
+        };
+
+        PyMODINIT_FUNC PyInit_spam(void) {
+            PyObject *module = PyModule_Create(&spam);
+            PyModule_AddIntConstant(module, "value", VALUE);
+            return module;
+        }
+    """))
+    monkeypatch.chdir(source_root)
+    return source_root
+
+
+HOOK = "__uiucprescon_rebuild_dummy"
+
+
+def import_value(source_root, manifest):
+    # The hook as installed by the editable wheel
+    hook_dir = source_root.parent / "hook"
+    if not hook_dir.exists():
+        [wheel] = (source_root.parent / "wheels").glob("*.whl")
+        with zipfile.ZipFile(wheel) as archive:
+            archive.extractall(
+                hook_dir,
+                [n for n in archive.namelist() if n.startswith(f"{HOOK}/")],
+            )
+    code = (
+        f"import sys; sys.path.insert(0, {str(source_root / 'src')!r}); "
+        f"import {HOOK}; {HOOK}.install({manifest!r}); "
+        f"import spam; print(spam.value)"
+    )
+    env = {**os.environ, "PYTHONPATH": str(hook_dir)}
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        env=env,
+    )
+    return int(result.stdout.strip()), result.stderr
+
+
+def test_editable_rebuild(extension_project, tmp_path, capsys):
+    config_settings = {"editable_rebuild": "true"}
+    wheel = local_backend.build_editable(
+        str(tmp_path / "wheels"), config_settings
+    )
+    manifest = os.path.join(
+        extension_project, "build", "editable", editable.EDITABLE_MANIFEST
+    )
+    with zipfile.ZipFile(tmp_path / "wheels" / wheel) as archive:
+        pth = archive.read("__uiucprescon_rebuild_dummy.pth").decode()
+        assert repr(manifest) in pth
+        assert f"{HOOK}/__init__.py" in archive.namelist()
+        assert f"{HOOK}/file_inputs.py" in archive.namelist()
+    assert import_value(extension_project, manifest) == (1, "")
+
+    # Reinstalling only compiles what changed
+    (extension_project / "src" / "eggs.c").write_text(
+        "int eggs(void) {return 1;}\n"
+    )
+    capsys.readouterr()
+    local_backend.build_editable(str(tmp_path / "wheels"), config_settings)
+    out = capsys.readouterr().out
+    assert "skipping" in out and "spam.c (up-to-date)" in out
+    assert "eggs.c (up-to-date)" not in out
+
+    # Changing a header rebuilds the extension when it is imported
+    (extension_project / "src" / "value.h").write_text("#define VALUE 42\n")
+    value, stderr = import_value(extension_project, manifest)
+    assert value == 42
+    assert "Rebuilding spam: compiling 1 of 2 source files" in stderr
+    assert import_value(extension_project, manifest) == (42, "")
+
+
+def test_rebuild_reports_compile_errors(extension_project, tmp_path):
+    local_backend.build_editable(
+        str(tmp_path / "wheels"), {"editable_rebuild": "true"}
+    )
+    manifest = os.path.join(
+        extension_project, "build", "editable", editable.EDITABLE_MANIFEST
+    )
+    (extension_project / "src" / "eggs.c").write_text("not C\n")
+    with pytest.raises(ImportError, match="Unable to rebuild spam"):
+        _editable_hook.rebuild(manifest, "spam")
+
+
+def test_unsupported_setuptools_fails_loudly(tmp_path, monkeypatch):
+    monkeypatch.delattr(editable_wheel.editable_wheel, "_configure_build")
+    with pytest.raises(errors.PlatformError, match="editable_rebuild"):
+        with editable.persistent_editable_build(str(tmp_path)):
+            pass
@@ -0,0 +1,34 @@
+import os
+
+from uiucprescon.build import file_inputs
+
+
+def test_scan_includes(tmp_path):
+    (tmp_path / "include").mkdir()
+    (tmp_path / "include" / "a.h").write_text('#include "b.h"\n')
+    (tmp_path / "include" / "b.h").write_text("#include <stdio.h>\n")
+    (tmp_path / "main.c").write_text(
+        '#include <a.h>\n  #  include "missing.h"\n'
+    )
+    assert file_inputs.scan_includes(
+        str(tmp_path / "main.c"), [str(tmp_path / "include")], str(tmp_path)
+    ) == [
+        str(tmp_path / "include" / "a.h"),
+        str(tmp_path / "include" / "b.h"),
+    ]
+    assert file_inputs.include_dirs_of(
+        ["gcc", "-Iinclude", "-I", "other", "/Imsvc", "-c", "main.c"]
+    ) == ["include", "other", "msvc"]
+
+
+def test_is_stale_compares_contents(tmp_path):
+    source = tmp_path / "spam.c"
+    source.write_text("int spam;\n")
+    inputs = file_inputs.fingerprint([str(source)])
+    assert not file_inputs.is_stale(inputs)
+    os.utime(source, ns=(0, 0))
+    assert not file_inputs.is_stale(inputs)
+    source.write_text("int eggs;\n")
+    assert file_inputs.is_stale(inputs)
+    source.unlink()
+    assert file_inputs.is_stale(inputs)
@@ -0,0 +1,90 @@
+import json
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+from uiucprescon.build import commands
+
+# Budget in seconds for "import uiucprescon.build". Can be raised for slow
+# machines with the UIUCPRESCON_BUILD_IMPORT_BUDGET environment variable.
+IMPORT_TIME_BUDGET = float(
+    os.getenv("UIUCPRESCON_BUILD_IMPORT_BUDGET", "0.1")
+)
+
+HEAVY_MODULES = [
+    "conan",
+    "pybind11",
+    "setuptools",
+    "toml",
+    "yaml",
+    "uiucprescon.build.compiler_info",
+    "uiucprescon.build.conan_libs",
+    "uiucprescon.build.deps",
+]
+
+
+def import_in_subprocess(module):
+    script = textwrap.dedent(f"""
+        import json, sys, time
+        start = time.perf_counter()
+        import {module}
+        duration = time.perf_counter() - start
+        print(json.dumps({{
+            "duration": duration,
+            "imported": sorted(sys.modules),
+        }}))
+    """)
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return json.loads(result.stdout)
+
+
+def test_import_time_budget():
+    # Take the best of a few runs to reduce noise from the machine
+    durations = [
+        import_in_subprocess("uiucprescon.build")["duration"]
+        for _ in range(3)
+    ]
+    assert min(durations) < IMPORT_TIME_BUDGET, \
+        f"import uiucprescon.build took {min(durations):.3f}s"
+
+
+def test_import_does_not_load_heavy_modules():
+    imported = import_in_subprocess("uiucprescon.build")["imported"]
+    assert [module for module in HEAVY_MODULES if module in imported] == []
+
+
+@pytest.mark.parametrize(
+    "module",
+    [
+        "uiucprescon.build.commands",
+        "uiucprescon.build.pybind11_builder",
+        "uiucprescon.build.conan.files",
+    ]
+)
+def test_submodules_do_not_import_conan(module):
+    imported = import_in_subprocess(module)["imported"]
+    assert "conan" not in imported
+    assert "uiucprescon.build.compiler_info" not in imported
+
+
+@pytest.mark.parametrize(
+    "shim, implementation_module",
+    [
+        (commands.BuildExtInfo, "uiucprescon.build.introspection"),
+        (commands.BuildConan, "uiucprescon.build.conan_libs"),
+    ]
+)
+def test_command_shim_matches_implementation(shim, implementation_module):
+    module = __import__(implementation_module, fromlist=[shim.__name__])
+    implementation = getattr(module, shim.__name__)
+    assert shim.user_options == implementation.user_options
+    assert getattr(shim, "boolean_options", []) == \
+        getattr(implementation, "boolean_options", [])
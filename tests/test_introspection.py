@@ -0,0 +1,113 @@
+import json
+import textwrap
+
+import pytest
+import setuptools
+
+from uiucprescon.build import introspection
+
+
+@pytest.fixture
+def simple_project(tmp_path, monkeypatch):
+    source_root = tmp_path / "package"
+    source_root.mkdir()
+    (source_root / "pyproject.toml").write_text(textwrap.dedent("""
+        [project]
+        name = "dummy"
+        version = "0.1.0"
+    """))
+    (source_root / "setup.py").write_text(textwrap.dedent("""
+        from setuptools import setup, Extension
+
+        extension = Extension("dummy.spam", sources=["spam.cpp"])
+        extension.cxx_std = 17
+        setup(ext_modules=[extension])
+    """))
+    monkeypatch.chdir(source_root)
+    return source_root
+
+
+def test_introspection_cache_hit(simple_project):
+    stats = introspection.introspection_cache_stats
+    misses = stats.misses
+    hits = stats.hits
+    first = introspection.get_extension_build_info()
+    assert stats.misses == misses + 1
+    second = introspection.get_extension_build_info()
+    assert stats.hits == hits + 1
+    assert first == second
+    assert second["extensions"][0]["name"] == "dummy.spam"
+
+
+def test_introspection_cache_invalidated_by_setup_py(simple_project):
+    cache = introspection.IntrospectionCache(
+        str(simple_project / "build" / "cache.json"),
+        stats=introspection.IntrospectionCacheStats()
+    )
+    key = cache.fingerprint()
+    cache.put(key, {"extensions": []})
+    (simple_project / "setup.py").write_text("# changed")
+    assert cache.get(cache.fingerprint()) is None
+    assert cache.get(key) == {"extensions": []}
+    assert cache.stats == introspection.IntrospectionCacheStats(
+        hits=1, misses=1
+    )
+
+
+def test_introspection_cache_ignores_corrupt_file(tmp_path):
+    cache_file = tmp_path / "cache.json"
+    cache_file.write_text("not json")
+    cache = introspection.IntrospectionCache(
+        str(cache_file), stats=introspection.IntrospectionCacheStats()
+    )
+    assert cache.get("spam") is None
+
+
+def test_introspection_does_not_write_file_by_default(simple_project):
+    introspection.get_extension_build_info(use_cache=False)
+    assert not list(
+        simple_project.glob(f"build/**/{introspection.INTROSPECTION_FILE}")
+    )
+
+
+def test_introspection_persist_writes_file(simple_project):
+    data = introspection.get_extension_build_info(
+        use_cache=False, persist=True
+    )
+    introspection_files = list(
+        simple_project.glob(f"build/**/{introspection.INTROSPECTION_FILE}")
+    )
+    assert len(introspection_files) == 1
+    assert json.loads(introspection_files[0].read_text()) == data
+
+
+def test_collect_introspection_result_clears_registry():
+    introspection.publish_introspection_result({"extensions": []})
+    assert introspection.collect_introspection_result() == {"extensions": []}
+    assert introspection.collect_introspection_result() is None
+
+
+def test_intercept_mode_captures_extension_details(simple_project):
+    data = introspection.get_extension_build_info(
+        use_cache=False, mode=introspection.INTROSPECTION_MODE_INTERCEPT
+    )
+    extension = data["extensions"][0]
+    assert extension["name"] == "dummy.spam"
+    assert extension["sources"] == ["spam.cpp"]
+    assert extension["cxx_std"] == 17
+    assert "language" in extension
+    assert "extra_compile_args" in extension
+    assert not (simple_project / "build").exists()
+
+
+def test_intercept_mode_restores_setup(simple_project):
+    original_setup = setuptools.setup
+    introspection.get_extension_build_info(
+        use_cache=False, mode=introspection.INTROSPECTION_MODE_INTERCEPT
+    )
+    assert setuptools.setup is original_setup
+
+
+def test_invalid_introspection_mode(simple_project):
+    with pytest.raises(ValueError):
+        introspection.get_extension_build_info(mode="spam")
@@ -0,0 +1,118 @@
+import json
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+from uiucprescon import build
+
+
+@pytest.fixture
+def metadata_only_project(tmp_path):
+    source_root = tmp_path / "package"
+    source_root.mkdir()
+    (source_root / "pyproject.toml").write_text(textwrap.dedent("""
+        [project]
+        name = "dummy"
+        version = "0.1.0"
+    """))
+    (source_root / "setup.py").write_text(textwrap.dedent("""
+        from setuptools import setup
+        setup()
+    """))
+    return source_root
+
+
+def test_backend_import_does_not_import_conan():
+    script = textwrap.dedent("""
+        import json, sys
+        import uiucprescon.build
+        heavy = ["conan", "pybind11", "uiucprescon.build.conan_libs"]
+        print(json.dumps([m for m in heavy if m in sys.modules]))
+    """)
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    assert json.loads(result.stdout) == []
+
+
+@pytest.mark.parametrize(
+    "hook",
+    [
+        "prepare_metadata_for_build_wheel",
+        "prepare_metadata_for_build_editable",
+    ]
+)
+def test_metadata_hooks(metadata_only_project, tmp_path, hook):
+    metadata_directory = tmp_path / "metadata"
+    metadata_directory.mkdir()
+    script = textwrap.dedent(f"""
+        import json, sys
+        import uiucprescon.build
+        dist_info = uiucprescon.build.{hook}(sys.argv[1])
+        heavy = ["conan", "pybind11", "uiucprescon.build.conan_libs"]
+        print(json.dumps({{
+            "dist_info": dist_info,
+            "imported": [m for m in heavy if m in sys.modules],
+        }}))
+    """)
+    result = subprocess.run(
+        [sys.executable, "-c", script, str(metadata_directory)],
+        cwd=metadata_only_project,
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    data = json.loads(result.stdout.strip().splitlines()[-1])
+    assert data["imported"] == []
+    assert (metadata_directory / data["dist_info"] / "METADATA").exists()
+
+
+def test_get_requires_for_build_editable_matches_wheel():
+    assert build.get_requires_for_build_editable() == \
+        build.get_requires_for_build_wheel()
+
+
+def test_get_requires_for_build_wheel_minimal(
+    metadata_only_project, monkeypatch
+):
+    monkeypatch.chdir(metadata_only_project)
+    requires = build.get_requires_for_build_wheel()
+    assert not any(
+        requirement.startswith(("conan", "pybind11"))
+        for requirement in requires
+    )
+
+
+def test_get_requires_for_build_wheel_with_conanfile(
+    metadata_only_project, monkeypatch
+):
+    (metadata_only_project / "conanfile.txt").write_text("[requires]\n")
+    monkeypatch.chdir(metadata_only_project)
+    assert "conan" in build.get_requires_for_build_wheel()
+
+
+def test_get_requires_for_build_wheel_with_pybind11(
+    metadata_only_project, monkeypatch
+):
+    (metadata_only_project / "setup.py").write_text(textwrap.dedent("""
+        from setuptools import setup
+        from pybind11.setup_helpers import Pybind11Extension
+        setup()
+    """))
+    monkeypatch.chdir(metadata_only_project)
+    assert "pybind11>=2.5" in build.get_requires_for_build_wheel()
+
+
+@pytest.mark.skipif(
+    sys.version_info < (3, 11), reason="Requires tomllib"
+)
+def test_get_requires_for_build_wheel_no_toml_with_tomllib(
+    metadata_only_project, monkeypatch
+):
+    monkeypatch.chdir(metadata_only_project)
+    assert "toml" not in build.get_requires_for_build_wheel()
@@ -0,0 +1,90 @@
+import json
+import sys
+import textwrap
+
+import pytest
+
+from uiucprescon.build import conan_libs, local_backend, matrix
+from uiucprescon.build.session import build_session
+
+
+@pytest.fixture
+def pure_project(tmp_path, monkeypatch):
+    source_root = tmp_path / "package"
+    source_root.mkdir()
+    (source_root / "pyproject.toml").write_text(textwrap.dedent("""
+        [project]
+        name = "dummy"
+        version = "0.1.0"
+    """))
+    (source_root / "setup.py").write_text(textwrap.dedent("""
+        from setuptools import setup
+        setup(py_modules=["dummy"])
+    """))
+    (source_root / "dummy.py").write_text("")
+    monkeypatch.chdir(source_root)
+    return source_root
+
+
+def test_build_wheel_matrix(pure_project):
+    wheels = matrix.build_wheel_matrix("dist", [sys.executable])
+    assert (pure_project / "dist" / wheels[sys.executable]).exists()
+    # Each interpreter writes its metadata somewhere of its own
+    assert not list(pure_project.glob("*.egg-info"))
+
+
+def test_prepared_wheel_is_not_prepared_again(
+    pure_project, tmp_path, monkeypatch
+):
+    prepared_build_file = tmp_path / matrix.PREPARED_BUILD_FILE
+    prepared_build_file.write_text(json.dumps({
+        "build_info": {"extensions": []},
+        "build_plan": None,
+        "conan_graph": None,
+    }))
+
+    def prepare_build(*args, **kwargs):
+        raise AssertionError("the build was prepared again")
+
+    monkeypatch.setattr(local_backend, "prepare_build", prepare_build)
+    wheel = matrix.build_prepared_wheel(
+        str(tmp_path / "dist"), {}, str(prepared_build_file)
+    )
+    assert (tmp_path / "dist" / wheel).exists()
+
+
+def test_build_wheel_matrix_reports_failing_interpreter(pure_project):
+    (pure_project / "setup.py").write_text(textwrap.dedent("""
+        import sys
+        from setuptools import setup
+        if "bdist_wheel" in sys.argv:
+            raise SystemExit("spam")
+        setup(py_modules=["dummy"])
+    """))
+    with pytest.raises(matrix.ExecError, match="spam"):
+        matrix.build_wheel_matrix("dist", [sys.executable])
+
+
+@pytest.mark.parametrize(
+    "existing, expected",
+    [
+        (None, ["--bdist-dir", "bacon"]),
+        ("--py-limited-api cp310", [
+            "--py-limited-api", "cp310", "--bdist-dir", "bacon"
+        ]),
+        (["--py-limited-api", "cp310"], [
+            "--py-limited-api", "cp310", "--bdist-dir", "bacon"
+        ]),
+    ],
+)
+def test_with_build_option(existing, expected):
+    config_settings = matrix._with_build_option(
+        {"--build-option": existing}, ["--bdist-dir", "bacon"]
+    )
+    assert config_settings["--build-option"] == expected
+
+
+def test_shared_conan_build_dir(tmp_path):
+    assert conan_libs._get_shared_conan_build_dir() is None
+    with build_session({"conan_build_dir": str(tmp_path)}):
+        assert conan_libs._get_shared_conan_build_dir() == str(tmp_path)
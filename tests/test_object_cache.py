@@ -0,0 +1,114 @@
+import os
+import shutil
+import textwrap
+import zipfile
+
+import pytest
+from setuptools._distutils import dir_util
+
+from uiucprescon.build import local_backend, object_cache
+
+
+@pytest.fixture
+def extension_project(tmp_path, monkeypatch):
+    source_root = tmp_path / "package"
+    source_root.mkdir()
+    (source_root / "pyproject.toml").write_text(textwrap.dedent("""
+        [project]
+        name = "dummy"
+        version = "0.1.0"
+    """))
+    (source_root / "setup.py").write_text(textwrap.dedent("""
+        from setuptools import setup, Extension
+        setup(ext_modules=[Extension("spam", ["spam.c", "eggs.c"])])
+    """))
+    (source_root / "eggs.c").write_text("int eggs(void) {return 0;}\n")
+    (source_root / "spam.c").write_text(textwrap.dedent("""
+        #include <Python.h>
+
+        static struct PyModuleDef spam = {
+            PyModuleDef_HEAD_INIT, "spam", NULL, -1, NULL
+        };
+
+        PyMODINIT_FUNC PyInit_spam(void) {return PyModule_Create(&spam);}
+    """))
+    monkeypatch.chdir(source_root)
+    return source_root
+
+
+def test_parse_compile_command():
+    command = object_cache.parse_compile_command(
+        ["gcc", "-O2", "-Iinclude", "-c", "src/spam.c", "-o",
+         "build/src/spam.o", "-MMD", "-MF", "build/src/spam.d"],
+        [".c", ".cpp"],
+    )
+    assert command.source == "src/spam.c"
+    assert command.output == "build/src/spam.o"
+    assert command.without_files() == ["gcc", "-O2", "-Iinclude", "-c", ".c"]
+    assert command.preprocess_command() == [
+        "gcc", "-O2", "-Iinclude", "-E", "src/spam.c"
+    ]
+    command = object_cache.parse_compile_command(
+        ["cl.exe", "/c", "/nologo", "/Tpspam.cpp", "/Fobuild\\spam.obj"],
+        [".c", ".cpp"],
+    )
+    assert (command.source, command.output) == ("spam.cpp", "build\\spam.obj")
+    assert command.preprocess_command() == [
+        "cl.exe", "/E", "/nologo", "/Tpspam.cpp"
+    ]
+    assert object_cache.parse_compile_command(
+        ["gcc", "-shared", "spam.o", "-o", "spam.so"], [".c"]
+    ) is None
+
+
+def test_build_wheel_reuses_objects(extension_project, tmp_path, capfd):
+    config_settings = {"object_cache": str(tmp_path / "objects")}
+    cache = object_cache.get_object_cache(config_settings)
+    wheel = local_backend.build_wheel(
+        str(tmp_path / "wheels"), config_settings
+    )
+    assert cache.stats().entries == 2
+    assert "using cached object" not in capfd.readouterr().out
+
+    # Start again from a fresh build directory, as isolated builds do
+    shutil.rmtree(extension_project / "build")
+    dir_util.SkipRepeatAbsolutePaths.clear()
+    (extension_project / "eggs.c").write_text("int eggs(void) {return 1;}\n")
+    wheel = local_backend.build_wheel(
+        str(tmp_path / "wheels"), config_settings
+    )
+    out = capfd.readouterr().out
+    assert "using cached object for spam.c" in out
+    assert "using cached object for eggs.c" not in out
+    assert cache.stats().entries == 3
+    with zipfile.ZipFile(tmp_path / "wheels" / wheel) as archive:
+        assert any(name.startswith("spam.") for name in archive.namelist())
+
+
+def test_objects_linked_from_the_cache_are_not_overwritten(
+    extension_project, tmp_path
+):
+    cache = object_cache.ObjectCache(str(tmp_path / "objects"), 2 ** 30)
+    (tmp_path / "spam.o").write_bytes(b"cached")
+    cache.put("spam", str(tmp_path / "spam.o"))
+    output = tmp_path / "build" / "eggs.o"
+    assert cache.fetch_object("spam", str(output))
+    assert output.read_bytes() == b"cached"
+
+    def compile_eggs(command):
+        with open(output, "wb") as f:
+            f.write(b"compiled")
+
+    class Compiler:
+        src_extensions = [".c"]
+
+    object_cache._cached_call(
+        cache,
+        compile_eggs,
+        Compiler(),
+        ["cc", "-c", "does-not-exist.c", "-o", str(output)],
+    )
+    assert output.read_bytes() == b"compiled"
+    with open(cache.get("spam"), "rb") as f:
+        assert f.read() == b"cached"
+    assert os.path.exists(tmp_path / "spam.o")
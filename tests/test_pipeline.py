@@ -0,0 +1,264 @@
+import os
+import textwrap
+import threading
+import time
+import types
+
+import pytest
+from setuptools.command import build_ext as build_ext_command
+from setuptools.dist import Distribution
+
+from uiucprescon.build import (
+    conan_libs,
+    local_backend,
+    pipeline,
+    pybind11_builder,
+)
+from uiucprescon.build.capabilities import get_toolchain_capabilities
+from uiucprescon.build.session import BuildSession, build_session
+
+
+def test_needs_conan(tmp_path):
+    (tmp_path / "include").mkdir()
+    (tmp_path / "include" / "local.h").write_text(
+        "#include <vector>\n#include <sys/types.h>\n"
+    )
+    (tmp_path / "include" / "uses_dep.h").write_text("#include <zstd.h>\n")
+    (tmp_path / "spam.cpp").write_text(
+        '#include "local.h"\n#include <Python.h>\n#include <cstdio>\n'
+    )
+    (tmp_path / "eggs.cpp").write_text('#include "uses_dep.h"\n')
+    (tmp_path / "Python.h").write_text("")
+    include_dirs = [str(tmp_path / "include"), str(tmp_path)]
+    assert not pipeline.needs_conan(
+        str(tmp_path / "spam.cpp"), include_dirs, str(tmp_path)
+    )
+    assert pipeline.find_unresolved_includes(
+        str(tmp_path / "eggs.cpp"), include_dirs, str(tmp_path)
+    ) == {"zstd.h"}
+
+
+@pytest.fixture
+def precompile_project(build_extension, tmp_path):
+    (tmp_path / "spam.c").write_text(textwrap.dedent("""
+        #include <Python.h>
+
+        static struct PyModuleDef spam = {
+            PyModuleDef_HEAD_INIT, "spam", NULL, -1, NULL
+        };
+
+        PyMODINIT_FUNC PyInit_spam(void) {return PyModule_Create(&spam);}
+    """))
+    # Includes are scanned without preprocessing, so this one counts
+    (tmp_path / "eggs.c").write_text(
+        "#ifdef USE_ZSTD\n#include <zstd.h>\n#endif\n"
+        "int eggs(void) {return 0;}\n"
+    )
+
+    def command(**options):
+        return build_extension(["spam.c", "eggs.c"], run=False, **options)
+
+    return command
+
+
+def test_precompile_independent_sources(precompile_project, capfd):
+    build_ext = precompile_project()
+    compiled = pipeline.precompile_independent_sources(build_ext)
+    spam_object = compiled["spam"][0]
+    assert os.path.basename(spam_object).startswith("spam.")
+    assert os.path.exists(spam_object)
+    assert build_ext.extensions[0].sources == ["spam.c", "eggs.c"]
+
+    # build_ext compiles the rest with the same flags
+    capfd.readouterr()
+    build_ext.run()
+    out = capfd.readouterr().out
+    assert "skipping spam.c (up-to-date)" in out
+    assert "skipping eggs.c" not in out
+
+
+def test_precompile_extension_linking_conan_library(
+    precompile_project, tmp_path, capfd
+):
+    conan_include = tmp_path / "conan" / "include"
+    conan_include.mkdir(parents=True)
+    (conan_include / "zstd.h").write_text("int zstd_version(void);\n")
+    build_ext = precompile_project(libraries=["zstd"])
+    compiled = pipeline.precompile_independent_sources(build_ext)
+    [spam_object] = compiled["spam"]
+    assert os.path.basename(spam_object).startswith("spam.")
+
+    # What build_conan does once the dependencies are installed
+    conan_libs.match_libs(
+        build_ext.extensions[0],
+        str(tmp_path / "conan"),
+        {
+            "graph": {
+                "nodes": {
+                    "1": {
+                        "name": "zstd",
+                        "cpp_info": {
+                            "root": {
+                                "includedirs": [str(conan_include)],
+                                "defines": ["USE_ZSTD"],
+                                "libs": ["m"],
+                            }
+                        },
+                    }
+                }
+            }
+        },
+    )
+    assert build_ext.extensions[0].define_macros == [("USE_ZSTD", None)]
+    capfd.readouterr()
+    build_ext.run()
+    out = capfd.readouterr().out
+    assert "skipping spam.c (up-to-date)" in out
+    assert "skipping eggs.c" not in out
+
+
+def test_precompile_needs_the_dependency_index(precompile_project):
+    build_ext = precompile_project(cmdclass=build_ext_command.build_ext)
+    assert pipeline.precompile_independent_sources(build_ext) == {}
+
+
+def test_session_conan_install():
+    session = BuildSession()
+    started = threading.Event()
+    release = threading.Event()
+    seen_from_install = []
+
+    def install():
+        started.set()
+        seen_from_install.append(session.conan_install_pending)
+        session.wait_for_conan_install()
+        release.wait(10)
+        raise RuntimeError("spam")
+
+    session.start_conan_install(install, "build")
+    started.wait(10)
+    assert session.conan_install_pending
+    release.set()
+    with pytest.raises(RuntimeError, match="spam"):
+        session.wait_for_conan_install()
+    assert not session.conan_install_pending
+    assert seen_from_install == [False]
+
+
+def test_failed_conan_install_fails_the_session():
+    def install():
+        raise RuntimeError("spam")
+
+    with pytest.raises(RuntimeError, match="spam"):
+        with build_session() as session:
+            session.start_conan_install(install, "build")
+
+
+def test_linking_waits_for_conan_install(tmp_path, monkeypatch):
+    # Conan writes the build info the libraries are found with last
+    build_info = tmp_path / "conan" / "conan_build_info.json"
+    monkeypatch.setattr(
+        pybind11_builder,
+        "get_toolchain_capabilities",
+        lambda: types.SimpleNamespace(uses_conan_v1=False),
+    )
+    monkeypatch.setattr(
+        conan_libs,
+        "find_linking_libraries_with_conan_build_info_json",
+        lambda path: [path],
+    )
+
+    def install():
+        time.sleep(0.2)
+        build_info.parent.mkdir()
+        build_info.write_text("{}")
+
+    with build_session() as session:
+        build_ext = pybind11_builder.BuildPybind11Extension(Distribution())
+        build_ext.build_temp = str(tmp_path / "temp")
+        build_conan = build_ext.get_finalized_command("build_conan")
+        build_conan.build_temp = str(build_info.parent)
+        session.start_conan_install(install, build_conan.build_temp)
+        assert build_ext._get_linking_library_paths() == [str(build_info)]
+
+
+@pytest.mark.skipif(
+    (get_toolchain_capabilities().conan_major_version or 0) < 2,
+    reason="Uses a Conan 2 cache",
+)
+def test_conan_pipeline(
+    tmp_path, monkeypatch, capfd, conan_dependency_cache
+):
+    source_root = tmp_path / "package"
+    source_root.mkdir()
+    (source_root / "pyproject.toml").write_text(textwrap.dedent("""
+        [project]
+        name = "dummy"
+        version = "0.1.0"
+    """))
+    (source_root / "conanfile.txt").write_text("[requires]\nmydep/1.0\n")
+    (source_root / "setup.py").write_text(textwrap.dedent("""
+        from setuptools import setup, Extension
+        from uiucprescon.build.pybind11_builder import BuildPybind11Extension
+
+        class BuildExt(BuildPybind11Extension):
+            def run(self):
+                self.get_finalized_command("build_conan").run()
+                super().run()
+
+        setup(
+            ext_modules=[
+                Extension("spam", ["spam.cpp", "eggs.cpp"], language="c++")
+            ],
+            cmdclass={"build_ext": BuildExt},
+        )
+    """))
+    (source_root / "spam.cpp").write_text(textwrap.dedent("""
+        #include <Python.h>
+
+        static struct PyModuleDef spam = {
+            PyModuleDef_HEAD_INIT, "spam", NULL, -1, NULL
+        };
+
+        PyMODINIT_FUNC PyInit_spam(void) {return PyModule_Create(&spam);}
+    """))
+    # Includes are scanned without preprocessing, so this one counts
+    (source_root / "eggs.cpp").write_text(textwrap.dedent("""
+        #ifdef USE_MYDEP
+        #include <mydep.h>
+        #endif
+        void eggs() {}
+    """))
+    monkeypatch.chdir(source_root)
+
+    # Hold the install back until the independent sources are compiled
+    precompiled = threading.Event()
+    compiled = []
+    precompile = pipeline.precompile_independent_sources
+    run = conan_libs.BuildConan.run
+
+    def slow_run(self):
+        if threading.current_thread() is not threading.main_thread():
+            assert precompiled.wait(60)
+        run(self)
+
+    def record_precompile(*args, **kwargs):
+        compiled.append(precompile(*args, **kwargs))
+        precompiled.set()
+        return compiled[-1]
+
+    monkeypatch.setattr(conan_libs.BuildConan, "run", slow_run)
+    monkeypatch.setattr(
+        pipeline, "precompile_independent_sources", record_precompile
+    )
+    wheel = local_backend.build_wheel(
+        str(tmp_path / "wheels"),
+        {
+            "conan_pipeline": "true",
+            "conan_cache": str(conan_dependency_cache),
+        },
+    )
+    assert os.path.exists(tmp_path / "wheels" / wheel)
+    assert "skipping spam.cpp (up-to-date)" in capfd.readouterr().out
+    assert [list(objects) for objects in compiled] == [["spam"]]
+    assert os.path.basename(compiled[0]["spam"][0]).startswith("spam.")
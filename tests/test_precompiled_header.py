@@ -0,0 +1,96 @@
+import glob
+import os
+import textwrap
+
+import pytest
+
+from uiucprescon.build import precompiled_header, pybind11_builder
+
+SOURCES = {
+    "spam.cpp": """
+        #include <Python.h>
+        #include <vector>
+
+        static struct PyModuleDef spam = {
+            PyModuleDef_HEAD_INIT, "spam", NULL, -1, NULL
+        };
+
+        PyMODINIT_FUNC PyInit_spam(void) {return PyModule_Create(&spam);}
+    """,
+    "eggs.cpp": """
+        #include <vector>
+        #include <string>
+        #ifdef _WIN32
+        #  include <windows.h>
+        #endif
+        #include "local.h"
+        int eggs() {return std::vector<std::string>().size();}
+    """,
+    "bacon.cpp": """
+        #include <string>
+        #include <vector>
+        int bacon() {return std::vector<int>().size();}
+    """,
+}
+
+
+@pytest.fixture
+def sources(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for name, source in SOURCES.items():
+        (tmp_path / name).write_text(textwrap.dedent(source))
+    (tmp_path / "local.h").write_text("")
+    return list(SOURCES)
+
+
+def test_common_includes(sources):
+    assert precompiled_header.common_includes(sources) == ["vector", "string"]
+    assert precompiled_header.common_includes(sources[:1]) == []
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [("auto", "auto"), ("true", "auto"), ("false", None),
+     ("include/prefix.h", "include/prefix.h")],
+)
+def test_precompiled_header_setting(value, expected):
+    assert precompiled_header.precompiled_header_setting(
+        {"precompiled_header": value}
+    ) == expected
+
+
+@pytest.fixture
+def build(sources, build_extension, capfd):
+    def build(config_settings):
+        # -H lists the headers used, with ! in front of precompiled ones
+        command = build_extension(
+            sources, config_settings, force=True, extra_compile_args=["-H"]
+        )
+        assert command.extensions[0].extra_compile_args == ["-H"]
+        assert os.path.exists(command.get_ext_fullpath("spam"))
+        return capfd.readouterr().err
+
+    return build
+
+
+@pytest.mark.skipif(
+    pybind11_builder.sys.platform == "win32", reason="Uses gcc or clang"
+)
+def test_precompiled_header(build, tmp_path):
+    used = build({"precompiled_header": "auto"})
+    [header] = glob.glob(str(tmp_path / "temp" / "pch" / "*" / "prefix.h"))
+    with open(header) as f:
+        assert f.read().splitlines()[1:] == [
+            "#include <vector>", "#include <string>"
+        ]
+    [precompiled] = glob.glob(f"{header}.?ch")
+    assert used.count(f"! {precompiled}") == 3
+
+    # Only compiled again when a header it includes changes
+    os.utime(precompiled, ns=(0, 0))
+    build({"precompiled_header": "auto"})
+    assert os.stat(precompiled).st_mtime_ns == 0
+
+    (tmp_path / "prefix.h").write_text("#include <string>\n")
+    used = build({"precompiled_header": "prefix.h"})
+    assert used.count(".h.gch") + used.count(".h.pch") == 3
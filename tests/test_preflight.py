@@ -0,0 +1,93 @@
+import platform
+
+import pytest
+
+from uiucprescon.build import preflight
+from uiucprescon.build.errors import PreflightError
+
+EXTENSION_BUILD_INFO = {"extensions": [{"name": "spam"}]}
+
+
+def test_checks_depend_on_the_build(tmp_path):
+    checks = preflight.get_preflight_checks(
+        {}, {"extensions": []}, str(tmp_path), uses_conan=False
+    )
+    assert set(checks) == {"build directory", "wheel directory"}
+
+    checks = preflight.get_preflight_checks(
+        {}, EXTENSION_BUILD_INFO, str(tmp_path), uses_conan=True
+    )
+    assert {"compiler", "linker", "conan cache", "conan settings"} <= set(
+        checks
+    )
+    assert set(preflight.FIXUP_TOOLS.get(platform.system(), [])) <= set(
+        checks
+    )
+
+
+def test_check_writable(tmp_path):
+    assert preflight.check_writable(str(tmp_path / "new" / "dir"))() is None
+    (tmp_path / "file").write_text("")
+    problem = preflight.check_writable(str(tmp_path / "file" / "dir"))()
+    assert "is not a directory" in problem
+
+
+def test_check_tool(monkeypatch, tmp_path):
+    monkeypatch.setenv("PATH", str(tmp_path))
+    assert "patchelf not found" in preflight.check_tool("patchelf")()
+
+
+def test_check_conan_settings(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        preflight.get_toolchain_capabilities(), "conan_version", (2, 0)
+    )
+    monkeypatch.setattr(
+        preflight.get_toolchain_capabilities(), "_compiler_family", "gcc"
+    )
+    (tmp_path / "settings.yml").write_text(
+        "arch: [x86_64, armv8]\n"
+        "compiler:\n"
+        "  gcc:\n"
+        "    libcxx: [libstdc++, libstdc++11]\n"
+        "    cppstd: [null, 11, 14, 17]\n"
+    )
+    check = preflight.check_conan_settings(
+        {"arch": "x86_64", "cxx_std": "17"}, str(tmp_path)
+    )
+    assert check() is None
+
+    check = preflight.check_conan_settings(
+        {"arch": "spam", "conan_compiler_libcxx": "libc++"}, str(tmp_path)
+    )
+    problem = check()
+    assert "arch=spam" in problem
+    assert "compiler.libcxx=libc++" in problem
+
+
+def test_run_preflight_checks_reports_every_problem(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        preflight,
+        "get_preflight_checks",
+        lambda *args: {
+            "spam": lambda: "spam is missing",
+            "bacon": lambda: None,
+            "eggs": lambda: "eggs is broken",
+        },
+    )
+    with pytest.raises(PreflightError) as error:
+        preflight.run_preflight_checks({}, None, str(tmp_path), False)
+    assert error.value.problems == {
+        "spam": "spam is missing",
+        "eggs": "eggs is broken",
+    }
+    assert "spam is missing" in str(error.value)
+    assert "eggs is broken" in str(error.value)
+
+
+def test_run_checks_reports_failing_checks():
+    def broken_check():
+        raise RuntimeError("bacon")
+
+    assert preflight.run_checks({"spam": broken_check}) == {
+        "spam": "check failed: bacon"
+    }
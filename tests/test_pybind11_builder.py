@@ -0,0 +1,193 @@
+import os
+import threading
+
+import pytest
+from pybind11.setup_helpers import Pybind11Extension, build_ext
+from setuptools.dist import Distribution
+from setuptools.extension import Library
+
+from uiucprescon.build import deps, pybind11_builder
+from uiucprescon.build.session import build_session
+
+
+@pytest.fixture
+def builder(monkeypatch, tmp_path):
+    extensions = [
+        Pybind11Extension("pkg.spam", ["spam.cpp"]),
+        Pybind11Extension("pkg.eggs", ["eggs.cpp"]),
+        Pybind11Extension("other.bacon", ["bacon.cpp"]),
+    ]
+    dist = Distribution({"ext_modules": extensions})
+    command = pybind11_builder.BuildPybind11Extension(dist)
+    command.build_lib = str(tmp_path / "lib")
+    command.build_temp = str(tmp_path / "temp")
+    command.ensure_finalized()
+    command.compiled = []
+    monkeypatch.setattr(
+        build_ext,
+        "build_extension",
+        lambda self, ext: self.compiled.append(ext.name),
+    )
+    monkeypatch.setattr(
+        pybind11_builder.BuildPybind11Extension,
+        "_get_linking_library_paths",
+        lambda self: [],
+    )
+    monkeypatch.setattr(command, "spawn", lambda command: None)
+    command.compiler = None
+    return command
+
+
+def test_fixup_overlaps_compiling_next_extension(builder, monkeypatch):
+    release_spam = threading.Event()
+    events = []
+
+    def fixup_library(library, search_paths):
+        if "spam" in library:
+            # Not fixed up until the next extension has been compiled
+            assert release_spam.wait(10)
+        events.append(("fixup", library, threading.current_thread().name))
+
+    def build_extension(self, ext):
+        events.append(("compile", ext.name, None))
+        if ext.name == "pkg.eggs":
+            release_spam.set()
+
+    monkeypatch.setattr(deps, "fixup_library", fixup_library)
+    monkeypatch.setattr(build_ext, "build_extension", build_extension)
+    builder.run()
+
+    compiled = [name for step, name, _ in events if step == "compile"]
+    assert compiled == ["pkg.spam", "pkg.eggs", "other.bacon"]
+    fixups = [event for event in events if event[0] == "fixup"]
+    assert len(fixups) == 3
+    assert all(thread.startswith("fixup") for _, _, thread in fixups)
+
+
+def test_fixups_in_the_same_directory_do_not_overlap(builder, monkeypatch):
+    running = {}
+    overlapped = []
+    lock = threading.Lock()
+
+    def fixup_library(library, search_paths):
+        directory = library.rsplit("/", 1)[0]
+        with lock:
+            if running.get(directory):
+                overlapped.append(library)
+            running[directory] = True
+        threading.Event().wait(0.05)
+        with lock:
+            running[directory] = False
+
+    monkeypatch.setattr(deps, "fixup_library", fixup_library)
+    builder.run()
+    assert overlapped == []
+
+
+def test_fixup_errors_stop_the_build(builder, monkeypatch):
+    def fixup_library(library, search_paths):
+        raise FileNotFoundError(f"Unable to locate spam.so for {library}")
+
+    monkeypatch.setattr(deps, "fixup_library", fixup_library)
+    with pytest.raises(FileNotFoundError, match="Unable to locate spam.so"):
+        builder.run()
+
+
+def test_fixup_workers_from_config_settings():
+    with build_session({"fixup_workers": "0"}):
+        command = pybind11_builder.BuildPybind11Extension(Distribution())
+        command.ensure_finalized()
+    assert command.fixup_workers == 0
+    command = pybind11_builder.BuildPybind11Extension(Distribution())
+    command.ensure_finalized()
+    assert command.fixup_workers == pybind11_builder.DEFAULT_FIXUP_WORKERS
+
+
+class RecordingCompiler:
+    def __init__(self, slow_source, release):
+        self.slow_source = slow_source
+        self.release = release
+        self.compiled = []
+
+    def compile(self, sources, output_dir=None, **kwargs):
+        if self.slow_source in sources:
+            assert self.release.wait(10)
+        self.compiled.append((sources, threading.current_thread().name))
+        return [f"{output_dir}/{source}.o" for source in sources]
+
+
+def test_parallel_links_extensions_as_their_objects_are_ready(
+    builder, monkeypatch
+):
+    # ham.cpp of spam is not compiled until eggs is linked
+    eggs_linked = threading.Event()
+    builder.compiler = RecordingCompiler("ham.cpp", eggs_linked)
+    builder.extensions[0].sources = ["spam.cpp", "ham.cpp"]
+    builder.parallel = 2
+    builder.dependency_index = False
+    linked = {}
+
+    def build_extension(self, ext):
+        assert self.parallel == 2
+        objects = self.compiler.compile(
+            ext.sources, output_dir="temp", macros=ext.define_macros
+        )
+        linked[ext.name] = objects
+        if ext.name == "pkg.eggs":
+            eggs_linked.set()
+
+    monkeypatch.setattr(build_ext, "build_extension", build_extension)
+    monkeypatch.setattr(deps, "fixup_library", lambda *args: None)
+    builder.build_extensions()
+
+    assert linked == {
+        "pkg.spam": ["temp/spam.cpp.o", "temp/ham.cpp.o"],
+        "pkg.eggs": ["temp/eggs.cpp.o"],
+        "other.bacon": ["temp/bacon.cpp.o"],
+    }
+    assert all(len(sources) == 1 for sources, _ in builder.compiler.compiled)
+    assert {
+        thread.split("_")[0]
+        for sources, thread in builder.compiler.compiled
+        if sources == ["spam.cpp"] or sources == ["ham.cpp"]
+    } == {"compile"}
+    assert builder.parallel == 2
+    assert "compile" not in vars(builder.compiler)
+
+
+def test_parallel_builds_libraries_alone(builder, monkeypatch):
+    builder.extensions.insert(0, Library("pkg.ham", ["ham.cpp"]))
+    builder.extensions.append(Pybind11Extension("pkg.jam", ["jam.cpp"]))
+    builder.compiler = RecordingCompiler("", threading.Event())
+    builder.parallel = 2
+    builder.dependency_index = False
+    lock = threading.Lock()
+    building = set()
+    overlaps = []
+
+    def build_extension(self, ext):
+        with lock:
+            building.add(ext.name)
+            overlaps.append(set(building))
+        threading.Event().wait(0.05)
+        with lock:
+            building.remove(ext.name)
+
+    monkeypatch.setattr(build_ext, "build_extension", build_extension)
+    monkeypatch.setattr(deps, "fixup_library", lambda *args: None)
+    builder.build_extensions()
+
+    assert overlaps[0] == {"pkg.ham"}
+    assert all("pkg.ham" not in names for names in overlaps[1:])
+    assert max(len(names) for names in overlaps) == 2
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [("4", 4), ("auto", os.cpu_count()), ("false", None)],
+)
+def test_parallel_from_config_settings(value, expected):
+    with build_session({"parallel": value}):
+        command = pybind11_builder.BuildPybind11Extension(Distribution())
+        command.ensure_finalized()
+    assert command.parallel == expected
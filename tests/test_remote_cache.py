@@ -0,0 +1,131 @@
+import http.client
+import os
+import socket
+import textwrap
+import threading
+import urllib.parse
+
+import pytest
+
+from uiucprescon.build import local_backend, remote_cache
+
+KEY = "ab" * 32
+
+
+@pytest.fixture
+def server(tmp_path):
+    cache_server = remote_cache.RemoteCacheServer(
+        ("127.0.0.1", 0), str(tmp_path / "server"), 1024 ** 2
+    )
+    thread = threading.Thread(target=cache_server.serve_forever, daemon=True)
+    thread.start()
+    yield cache_server
+    cache_server.shutdown()
+    cache_server.server_close()
+
+
+@pytest.fixture
+def blob(tmp_path):
+    blob_file = tmp_path / "spam-1.0-py3-none-any.whl"
+    blob_file.write_bytes(b"eggs" * 1000)
+    return blob_file
+
+
+def test_put_and_get(server, blob, tmp_path):
+    client = remote_cache.HTTPRemoteCache(server.url)
+    assert client.get("wheels", KEY, str(tmp_path / "out")) is None
+    assert client.put("wheels", KEY, str(blob))
+    downloaded = client.get("wheels", KEY, str(tmp_path / "out"))
+    assert os.path.basename(downloaded) == blob.name
+    with open(downloaded, "rb") as f:
+        assert f.read() == blob.read_bytes()
+    client.close()
+
+
+def test_upload_disabled(server, blob):
+    client = remote_cache.HTTPRemoteCache(server.url, upload=False)
+    assert not client.put("wheels", KEY, str(blob))
+
+
+def test_unreachable_cache_is_a_miss(tmp_path, blob, capsys):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    client = remote_cache.HTTPRemoteCache(f"http://127.0.0.1:{port}")
+    for _ in range(remote_cache.MAX_CONSECUTIVE_ERRORS):
+        assert client.get("wheels", KEY, str(tmp_path)) is None
+    assert not client.available
+    assert not client.put("wheels", KEY, str(blob))
+    assert "too many remote cache errors" in capsys.readouterr().err
+
+
+def test_server_rejects_bad_checksum(server, blob, tmp_path, monkeypatch):
+    client = remote_cache.HTTPRemoteCache(server.url)
+    monkeypatch.setattr(remote_cache, "_sha256", lambda file_path: "0" * 64)
+    assert not client.put("wheels", KEY, str(blob))
+    monkeypatch.undo()
+    assert client.get("wheels", KEY, str(tmp_path / "out")) is None
+
+
+@pytest.mark.parametrize(
+    "headers",
+    [
+        {"X-Blob-Name": "../spam", "Content-Length": "4"},
+        {"X-Blob-Name": "spam.whl", "Content-Length": "four"},
+    ],
+)
+def test_server_closes_connection_of_rejected_upload(server, headers):
+    url = urllib.parse.urlsplit(server.url)
+    connection = http.client.HTTPConnection(url.hostname, url.port)
+    connection.putrequest("PUT", f"/blobs/wheels/{KEY}")
+    for name, value in headers.items():
+        connection.putheader(name, value)
+    connection.endheaders(b"eggs")
+    response = connection.getresponse()
+    response.read()
+    assert response.status == 400
+    assert response.getheader("Connection") == "close"
+    connection.close()
+    assert server.store("wheels").stats().entries == 0
+
+
+def test_get_remote_cache(monkeypatch):
+    monkeypatch.delenv(remote_cache.REMOTE_CACHE_ENV_VAR, raising=False)
+    assert remote_cache.get_remote_cache({}) is None
+    cache = remote_cache.get_remote_cache(
+        {"remote_cache": "http://cache:8000", "remote_cache_upload": "false"}
+    )
+    assert isinstance(cache, remote_cache.HTTPRemoteCache)
+    assert not cache.upload
+    assert remote_cache.get_remote_cache({"remote_cache": "spam://x"}) is None
+
+
+def test_build_wheel_uses_remote_cache(server, tmp_path, monkeypatch):
+    source_root = tmp_path / "package"
+    source_root.mkdir()
+    (source_root / "pyproject.toml").write_text(textwrap.dedent("""
+        [project]
+        name = "dummy"
+        version = "0.1.0"
+    """))
+    (source_root / "setup.py").write_text(textwrap.dedent("""
+        from setuptools import setup
+        setup(py_modules=["dummy"])
+    """))
+    (source_root / "dummy.py").write_text("")
+    monkeypatch.chdir(source_root)
+    config_settings = {"remote_cache": server.url}
+    wheel = local_backend.build_wheel(str(tmp_path / "a"), config_settings)
+    assert server.store("wheels").stats().entries == 1
+
+    # Another machine, without a local wheel cache, gets the wheel from the
+    # remote cache.
+    monkeypatch.setattr(
+        local_backend.setuptools.build_meta,
+        "build_wheel",
+        lambda *args, **kwargs: pytest.fail("wheel was built again"),
+    )
+    assert local_backend.build_wheel(
+        str(tmp_path / "b"), config_settings
+    ) == wheel
+    assert (tmp_path / "b" / wheel).exists()
@@ -0,0 +1,118 @@
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import textwrap
+import time
+
+import pytest
+
+from uiucprescon.build import errors, server
+from uiucprescon.build.capabilities import get_toolchain_capabilities
+
+pytestmark = pytest.mark.skipif(
+    not server.is_supported(), reason="Requires Unix sockets and fork"
+)
+
+
+@pytest.fixture
+def socket_path():
+    # Unix socket paths are limited to about 100 characters, which pytest's
+    # tmp_path is able to exceed.
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        yield os.path.join(tmp_dir, "build.sock")
+
+
+@pytest.fixture
+def running_server(socket_path):
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uiucprescon.build.server", socket_path],
+        stdout=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 60
+    while not server._is_listening(socket_path):
+        if process.poll() is not None or time.monotonic() > deadline:
+            process.kill()
+            pytest.fail("build server did not start")
+        time.sleep(0.1)
+    yield socket_path
+    process.send_signal(signal.SIGTERM)
+    process.wait(timeout=30)
+
+
+@pytest.fixture
+def pure_project(tmp_path, monkeypatch):
+    source_root = tmp_path / "package"
+    source_root.mkdir()
+    (source_root / "pyproject.toml").write_text(textwrap.dedent("""
+        [project]
+        name = "dummy"
+        version = "0.1.0"
+    """))
+    (source_root / "setup.py").write_text(textwrap.dedent("""
+        import os
+        from setuptools import setup
+        print("cwd", os.getcwd())
+        print("env", os.environ.get("DUMMY_BUILD_MARKER"))
+        setup(py_modules=["dummy"])
+    """))
+    (source_root / "dummy.py").write_text("")
+    monkeypatch.chdir(source_root)
+    return source_root
+
+
+def test_forward_hook_without_server(monkeypatch, socket_path):
+    monkeypatch.delenv(server.SERVER_SOCKET_ENV_VAR, raising=False)
+    assert server.forward_hook("build_wheel", "dist") is None
+    monkeypatch.setenv(server.SERVER_SOCKET_ENV_VAR, socket_path)
+    assert server.forward_hook("build_wheel", "dist") is None
+
+
+def test_forward_build_wheel(
+    running_server, pure_project, monkeypatch, capsys
+):
+    monkeypatch.setenv(server.SERVER_SOCKET_ENV_VAR, running_server)
+    monkeypatch.setenv("DUMMY_BUILD_MARKER", "spam")
+    wheel = server.forward_hook("build_wheel", "dist", None, None)
+    assert (pure_project / "dist" / wheel).exists()
+    output = capsys.readouterr().out
+    assert f"cwd {pure_project}" in output
+    assert "env spam" in output
+
+
+def test_server_refuses_other_interpreters(
+    running_server, pure_project, monkeypatch, capsys
+):
+    monkeypatch.setenv(server.SERVER_SOCKET_ENV_VAR, running_server)
+    monkeypatch.setattr(
+        server,
+        "interpreter",
+        lambda: {"executable": "python2", "version": [2], "soabi": None},
+    )
+    assert server.forward_hook("build_wheel", "dist", None, None) is None
+    assert "not the Python interpreter" in capsys.readouterr().err
+    assert not os.path.exists(pure_project / "dist")
+
+
+@pytest.mark.skipif(
+    (get_toolchain_capabilities().conan_major_version or 0) < 2,
+    reason="Detects a Conan 2 profile",
+)
+def test_preload_detects_conan_profile(monkeypatch):
+    v2 = pytest.importorskip("uiucprescon.build.conan.v2")
+    monkeypatch.setattr(v2, "_detected_profiles", {})
+    server.preload()
+    [profile] = v2._detected_profiles.values()
+    assert profile.settings["compiler"]
+
+
+def test_server_refuses_unknown_hooks(running_server, monkeypatch):
+    monkeypatch.setenv(server.SERVER_SOCKET_ENV_VAR, running_server)
+    with pytest.raises(errors.BuildServerError):
+        server.forward_hook("spam")
+
+
+def test_server_refuses_to_replace_running_server(running_server):
+    with pytest.raises(errors.BuildServerError):
+        server.BuildServer(running_server)
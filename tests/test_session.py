@@ -0,0 +1,33 @@
+import json
+
+from uiucprescon.build import session
+
+
+def test_build_session_is_active_only_within_context():
+    assert session.get_active_session() is None
+    with session.build_session({"arch": "x86_64"}) as build_session:
+        assert session.get_active_session() is build_session
+        assert build_session.config_settings == {"arch": "x86_64"}
+    assert session.get_active_session() is None
+
+
+def test_nested_build_session_reuses_active_session():
+    with session.build_session() as outer:
+        with session.build_session() as inner:
+            assert inner is outer
+
+
+def test_record_conan_resolution_loads_graph(tmp_path):
+    graph = {"graph": {"nodes": {}}}
+    (tmp_path / "conan_build_info.json").write_text(json.dumps(graph))
+    build_session = session.BuildSession()
+    build_session.record_conan_resolution(
+        str(tmp_path), {"libs": ["zstd"]}
+    )
+    resolution = build_session.get_conan_resolution(str(tmp_path))
+    assert resolution.graph == graph
+    assert resolution.build_info == {"libs": ["zstd"]}
+
+
+def test_get_conan_resolution_unknown_build_dir(tmp_path):
+    assert session.BuildSession().get_conan_resolution(str(tmp_path)) is None
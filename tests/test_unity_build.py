@@ -0,0 +1,86 @@
+import os
+import textwrap
+
+import pytest
+from setuptools.errors import CompileError
+
+from uiucprescon.build import unity_build
+
+
+def test_unity_sources(tmp_path):
+    sources = ["a.cpp", "b.cpp", "c.cpp", "d.c", "e.cpp", "f.c", "g.cu"]
+    for source in sources:
+        (tmp_path / source).write_text("")
+    output_dir = str(tmp_path / "unity")
+    result = unity_build.unity_sources(
+        [str(tmp_path / s) for s in sources], output_dir, 2, ["*/e.cpp"]
+    )
+    assert [os.path.relpath(s, tmp_path) for s in result] == [
+        os.path.join("unity", "unity_cpp_0.cpp"),
+        os.path.join("unity", "unity_cpp_1.cpp"),
+        os.path.join("unity", "unity_c_0.c"),
+        os.path.join("unity", "unity_c_1.c"),
+        "e.cpp",
+        "g.cu",
+    ]
+    with open(result[0]) as f:
+        assert f.read().splitlines()[1:] == [
+            f'#include "{(tmp_path / "a.cpp").as_posix()}"',
+            f'#include "{(tmp_path / "b.cpp").as_posix()}"',
+        ]
+
+    # Unchanged files are not written again
+    os.utime(result[0], ns=(0, 0))
+    unity_build.unity_sources(
+        [str(tmp_path / s) for s in sources], output_dir, 2, ["e.cpp"]
+    )
+    assert os.stat(result[0]).st_mtime_ns == 0
+
+
+def test_split_evenly():
+    assert unity_build.split_evenly(list("abcde"), 3) == [
+        ["a", "b"], ["c", "d"], ["e"]
+    ]
+    assert unity_build.split_evenly(["a"], 4) == [["a"]]
+
+
+@pytest.fixture
+def build(build_extension, tmp_path):
+    (tmp_path / "spam.cpp").write_text(textwrap.dedent("""
+        #include <Python.h>
+
+        static struct PyModuleDef spam = {
+            PyModuleDef_HEAD_INIT, "spam", NULL, -1, NULL
+        };
+
+        PyMODINIT_FUNC PyInit_spam(void) {return PyModule_Create(&spam);}
+    """))
+    # The same static function in two sources
+    for name in ["eggs", "bacon"]:
+        (tmp_path / f"{name}.cpp").write_text(
+            f"static int helper() {{return 0;}}\nint {name}() "
+            f"{{return helper();}}\n"
+        )
+
+    def build(config_settings):
+        sources = ["spam.cpp", "eggs.cpp", "bacon.cpp"]
+        command = build_extension(list(sources), config_settings)
+        assert command.extensions[0].sources == sources
+        return command
+
+    return build
+
+
+def test_unity_build(build, tmp_path):
+    config_settings = {"unity_build": "true", "unity_files": "1"}
+    with pytest.raises(CompileError):
+        build(config_settings)
+    command = build({**config_settings, "unity_exclude": "bacon.cpp"})
+    assert os.path.exists(command.get_ext_fullpath("spam"))
+    objects = {
+        os.path.splitext(name)[0]
+        for _, _, files in os.walk(tmp_path / "temp")
+        for name in files
+        if name.endswith(".o")
+    }
+    assert objects == {"unity_cpp_0", "bacon"}
@@ -1,5 +1,8 @@
 import os
+import subprocess
 import sys
+import textwrap
+
 import pytest
 
 from uiucprescon.build import utils
@@ -61,4 +64,25 @@ def test_set_env_var_does_not_make_program_files_impossible_to_get(variable):
         f"{variable} should already be in the environment"
     with utils.set_env_var(test_env):
         pass
-    assert variable in os.environ
\ No newline at end of file
+    assert variable in os.environ
+
+
+def test_file_lock_excludes_other_processes(tmp_path):
+    lock_file = str(tmp_path / "build.lock")
+    script = textwrap.dedent("""
+        import sys, time
+        from uiucprescon.build import utils
+        with utils.file_lock(sys.argv[1]):
+            print("locked", flush=True)
+            time.sleep(float(sys.argv[2]))
+    """)
+    with utils.file_lock(lock_file):
+        waiting = subprocess.Popen(
+            [sys.executable, "-c", script, lock_file, "0"],
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        with pytest.raises(subprocess.TimeoutExpired):
+            waiting.wait(timeout=1)
+    stdout, _ = waiting.communicate(timeout=30)
+    assert stdout.strip() == "locked"
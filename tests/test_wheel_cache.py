@@ -0,0 +1,97 @@
+import textwrap
+
+import pytest
+
+from uiucprescon.build import build_plan, local_backend, wheel_cache
+from uiucprescon.build.capabilities import get_toolchain_capabilities
+
+
+@pytest.fixture
+def pure_project(tmp_path, monkeypatch):
+    source_root = tmp_path / "package"
+    source_root.mkdir()
+    (source_root / "pyproject.toml").write_text(textwrap.dedent("""
+        [project]
+        name = "dummy"
+        version = "0.1.0"
+    """))
+    (source_root / "setup.py").write_text(textwrap.dedent("""
+        from setuptools import setup
+        setup(py_modules=["dummy"])
+    """))
+    (source_root / "dummy.py").write_text("")
+    monkeypatch.chdir(source_root)
+    return source_root
+
+
+def test_source_tree_fingerprint_ignores_build_outputs(pure_project):
+    fingerprint = wheel_cache.source_tree_fingerprint()
+    (pure_project / "build").mkdir()
+    (pure_project / "build" / "spam.o").write_text("")
+    assert wheel_cache.source_tree_fingerprint() == fingerprint
+    (pure_project / "dummy.py").write_text("print('spam')")
+    assert wheel_cache.source_tree_fingerprint() != fingerprint
+
+
+def test_wheel_cache_key_ignores_cache_settings(pure_project):
+    key = wheel_cache.wheel_cache_key({"arch": "x86_64"}, None)
+    assert wheel_cache.wheel_cache_key(
+        {"arch": "x86_64", "wheel_cache_max_size": "1G"}, None
+    ) == key
+    assert wheel_cache.wheel_cache_key({"arch": "armv8"}, None) != key
+    assert wheel_cache.wheel_cache_key(
+        {"arch": "x86_64"}, {"graph": {"nodes": {}}}
+    ) != key
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [("false", None), ("0", None), ("spam", "spam")],
+)
+def test_get_wheel_cache_dir(value, expected, monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv(wheel_cache.WHEEL_CACHE_ENV_VAR, raising=False)
+    cache_dir = wheel_cache.get_wheel_cache_dir({"wheel_cache": value})
+    assert cache_dir == (
+        str(tmp_path / expected) if expected is not None else None
+    )
+
+
+def test_build_wheel_uses_cache(pure_project, tmp_path, monkeypatch):
+    config_settings = {"wheel_cache": str(tmp_path / "cache")}
+    first = local_backend.build_wheel(
+        str(tmp_path / "first"), dict(config_settings)
+    )
+
+    def fail(*args, **kwargs):
+        raise AssertionError("wheel was built again")
+
+    monkeypatch.setattr(local_backend.setuptools.build_meta, "build_wheel",
+                        fail)
+    # A hit does not inspect setup.py or install the dependencies either
+    monkeypatch.setattr(local_backend, "prepare_build", fail)
+    second = local_backend.build_wheel(
+        str(tmp_path / "second"), dict(config_settings)
+    )
+    assert first == second
+    assert (tmp_path / "second" / second).read_bytes() == \
+        (tmp_path / "first" / first).read_bytes()
+    stats = wheel_cache.get_wheel_cache(config_settings).stats()
+    assert (stats.hits, stats.misses) == (1, 1)
+
+
+@pytest.mark.skipif(
+    (get_toolchain_capabilities().conan_major_version or 0) < 2,
+    reason="Resolving a graph without installing it needs Conan 2",
+)
+def test_resolve_conan_graph_installs_nothing(
+    pure_project, conan_dependency_cache
+):
+    assert build_plan.resolve_conan_graph() is None
+    (pure_project / "conanfile.txt").write_text("[requires]\nmydep/1.0\n")
+    graph = build_plan.resolve_conan_graph(
+        {"conan_cache": str(conan_dependency_cache)}
+    )
+    refs = [node.get("ref", "") for node in graph["nodes"].values()]
+    assert any(ref.startswith("mydep/1.0") for ref in refs)
+    assert not list((conan_dependency_cache / "p").glob("b/*"))
@@ -0,0 +1,137 @@
+import os
+import zipfile
+
+import pytest
+from setuptools._distutils import dir_util
+from wheel.wheelfile import WheelFile
+
+from uiucprescon.build import local_backend, wheel_writer
+from uiucprescon.build.wheel_writer import CompressionPolicy
+
+
+@pytest.fixture
+def archive_root(tmp_path):
+    root = tmp_path / "root"
+    (root / "spam").mkdir(parents=True)
+    (root / "spam" / "__init__.py").write_text("print('spam')\n" * 100)
+    (root / "spam" / "logo.png").write_bytes(b"png" * 1000)
+    (root / "spam" / "_spam.so").write_bytes(b"\x7fELF" * 10000)
+    (root / "spam" / "random.bin").write_bytes(os.urandom(4096))
+    (root / "spam" / "empty.txt").write_bytes(b"")
+    dist_info = root / "spam-1.0.dist-info"
+    dist_info.mkdir()
+    (dist_info / "METADATA").write_text("Name: spam\nVersion: 1.0\n")
+    (dist_info / "WHEEL").write_text("Wheel-Version: 1.0\n")
+    return root
+
+
+def write_wheel(path, root, **kwargs):
+    with wheel_writer.ParallelWheelFile(
+        str(path), "w", max_workers=4, **kwargs
+    ) as wf:
+        wf.write_files(str(root))
+
+
+def test_wheel_is_valid(archive_root, tmp_path):
+    wheel = tmp_path / "spam-1.0-py3-none-any.whl"
+    write_wheel(wheel, archive_root)
+    # WheelFile checks every member against the hashes in RECORD
+    with WheelFile(str(wheel)) as wf:
+        for name in wf.namelist():
+            if not name.endswith("RECORD"):
+                expected = (archive_root / name).read_bytes()
+                assert wf.read(name) == expected
+        names = wf.namelist()
+        assert names[-3:] == [
+            "spam-1.0.dist-info/METADATA",
+            "spam-1.0.dist-info/WHEEL",
+            "spam-1.0.dist-info/RECORD",
+        ]
+        record = wf.read("spam-1.0.dist-info/RECORD").decode().splitlines()
+        assert record[-1] == "spam-1.0.dist-info/RECORD,,"
+        assert len(record) == len(names)
+
+
+def test_compression_policy(archive_root, tmp_path):
+    wheel = tmp_path / "spam-1.0-py3-none-any.whl"
+    write_wheel(
+        wheel,
+        archive_root,
+        policy=CompressionPolicy(store_libraries_larger_than=1024),
+    )
+    with zipfile.ZipFile(wheel) as archive:
+        compress_types = {
+            info.filename: info.compress_type for info in archive.infolist()
+        }
+    assert compress_types["spam/__init__.py"] == zipfile.ZIP_DEFLATED
+    assert compress_types["spam/logo.png"] == zipfile.ZIP_STORED
+    assert compress_types["spam/_spam.so"] == zipfile.ZIP_STORED
+    assert compress_types["spam/random.bin"] == zipfile.ZIP_STORED
+
+
+def test_members_are_streamed(archive_root, tmp_path, monkeypatch):
+    monkeypatch.setattr(wheel_writer, "CHUNK_SIZE", 1000)
+    monkeypatch.setattr(wheel_writer, "SAMPLE_SIZE", 1500)
+    wheel = tmp_path / "spam-1.0-py3-none-any.whl"
+    write_wheel(wheel, archive_root, policy=CompressionPolicy(level=9))
+    with WheelFile(str(wheel)) as wf:
+        assert wf.read("spam/_spam.so") == b"\x7fELF" * 10000
+        info = wf.getinfo("spam/_spam.so")
+        assert info.compress_type == zipfile.ZIP_DEFLATED
+        assert info.compress_size < info.file_size
+
+
+def test_stored_compression_is_honored(archive_root, tmp_path):
+    wheel = tmp_path / "spam-1.0-py3-none-any.whl"
+    write_wheel(wheel, archive_root, compression=zipfile.ZIP_STORED)
+    with zipfile.ZipFile(wheel) as archive:
+        assert {
+            info.compress_type for info in archive.infolist()
+        } == {zipfile.ZIP_STORED}
+
+
+def test_policy_from_config_settings():
+    policy = CompressionPolicy.from_config_settings(
+        {
+            "wheel_compression_level": "1",
+            "wheel_store_libraries_larger_than": "50M",
+        }
+    )
+    assert policy.level == 1
+    assert policy.store_libraries_larger_than == 50 * 1024 * 1024
+    with pytest.raises(ValueError):
+        CompressionPolicy.from_config_settings(
+            {"wheel_compression_level": "10"}
+        )
+
+
+def test_parallel_writer_is_opt_in(tmp_path, monkeypatch):
+    source_root = tmp_path / "package"
+    source_root.mkdir()
+    (source_root / "pyproject.toml").write_text(
+        '[project]\nname = "dummy"\nversion = "0.1.0"\n'
+    )
+    (source_root / "setup.py").write_text(
+        "from setuptools import setup\nsetup(py_modules=['dummy'])\n"
+    )
+    (source_root / "dummy.py").write_text("")
+    monkeypatch.chdir(source_root)
+    written = []
+    original_write_files = wheel_writer.ParallelWheelFile.write_files
+
+    def write_files(self, base_dir):
+        written.append(os.path.basename(self.filename))
+        original_write_files(self, base_dir)
+
+    monkeypatch.setattr(
+        wheel_writer.ParallelWheelFile, "write_files", write_files
+    )
+    wheel = local_backend.build_wheel(str(tmp_path / "wheels"))
+    assert written == []
+    dir_util.SkipRepeatAbsolutePaths.clear()
+    wheel = local_backend.build_wheel(
+        str(tmp_path / "wheels"), {"parallel_wheel_writer": "true"}
+    )
+    assert written == [wheel]
+    with WheelFile(str(tmp_path / "wheels" / wheel)) as wf:
+        assert wf.read("dummy.py") == b""